@@ -10,11 +10,13 @@ sys.path.append("..")
 import time
 import json
 import io
-from typing import Dict
+import threading
+from functools import partial
+from typing import Dict, Iterator, Tuple
 #import pyodbc
 import pandas as pd
 #from openai_connection import get_gpt_response, openai_client
-from mixtral_chat import MixtralAgents
+from mixtral_chat import MixtralAgents, llm_runner, prompt_registry
 from LLM_messaging.llm_context_and_format import (ChartReference, 
                                     LoadTableInfo,
                                     ContextTexts,
@@ -23,7 +25,9 @@ from LLM_messaging.llm_context_and_format import (ChartReference,
                                     GenerateCharts                 
                                     )
 from pydantic import ValidationError
-from mixtral_chat_utilities.mixtral_tools import get_dataframe_from_query
+from mixtral_chat_utilities.mixtral_tools import (canonicalize_query, fingerprint_stats, query_executor, query_stats,
+                                                  submit_query, validate_query)
+from mixtral_chat_utilities.chart_queries import aggregate_query_for_chart
 
 
 ma = MixtralAgents()
@@ -39,7 +43,7 @@ def get_chart_map():
     return chart_map
 
 
-def get_table_description(table_name: str):
+def build_table_description(table_name: str):
     lti = LoadTableInfo(table_name)
     table_cols, sample_table_values = lti.load_info()
     
@@ -48,14 +52,19 @@ def get_table_description(table_name: str):
     return table_description
 
 
+def get_table_description(table_name: str):
+    # Built once per table instead of once per report
+    return prompt_registry.static_text(f"table_description:{table_name}", lambda: build_table_description(table_name))
+
+
 def get_num_reports(user_prompt: str, table_name: str) -> str:
     table_description = get_table_description(table_name)
 
-    gpt_context = ContextTexts.GET_NUM_REPORTS.value.format(
-        user_prompt=user_prompt,
+    gpt_context = prompt_registry.prompt(
+        ContextTexts.GET_NUM_REPORTS,
         table_description=table_description,
-        output_format=json.dumps(NumReports.model_json_schema(), indent=2)
-    )
+        output_format=prompt_registry.schema_json(NumReports)
+    ).format(user_prompt=user_prompt)
 
     # Pass the gpt_context and use the correct output_format
     num_reports = ma.get_mixtral_response(
@@ -92,22 +101,19 @@ def get_report_to_description_map(num_reports: NumReports)-> Dict:
     return report_to_description_map
 
 
-def get_sql_from_description(user_prompt: str, report_statement: str, report_description: str):
+def get_sql_from_description_context(report_statement: str, report_description: str)-> str:
     
     table_name = LoadTableInfo.default_table_name
     
     table_description = get_table_description(table_name)
 
-    gpt_context = ContextTexts.GET_SQL_FROM_DESCRIPTION.value.format(report_statement = report_statement,
-                                                                     report_description = report_description,
-                                                                     table_description = table_description,
-                                                                     output_format = json.dumps(SqlQuery.model_json_schema(), indent=2)
-                                                                     )
-    
-    parsed_content = ma.get_mixtral_response(text = user_prompt,
-                                        context = gpt_context,
-                                        output_format = SqlQuery,
-                                        )
+    return prompt_registry.prompt(ContextTexts.GET_SQL_FROM_DESCRIPTION,
+                                  table_description = table_description,
+                                  output_format = prompt_registry.schema_json(SqlQuery)
+                                  ).format(report_statement = report_statement, report_description = report_description)
+
+
+def parse_sql_from_description(parsed_content):
     if "properties" in parsed_content:
         try:
             parsed_content = json.loads(parsed_content)
@@ -121,10 +127,55 @@ def get_sql_from_description(user_prompt: str, report_statement: str, report_des
         sql_query = SqlQuery.model_validate(parsed_content)
         sql_query.output = " ".join(sql_query.output.split("\n"))
         sql_query.output = sql_query.output.replace("\\", "")
-        return " ".join(sql_query.output.split("\n"))
+        sql_query = " ".join(sql_query.output.split("\n"))
     except ValidationError as e:
         print(f"SQL Query Validation Error: \n{e}")
+        return
+    
+    return sql_query
+
+
+def get_sql_from_description(user_prompt: str, report_statement: str, report_description: str, max_repairs: int = 2):
+    
+    gpt_context = get_sql_from_description_context(report_statement, report_description)
+    
+    parsed_content = ma.get_mixtral_response(text = user_prompt,
+                                        context = gpt_context,
+                                        output_format = SqlQuery,
+                                        )
+    sql_query = parse_sql_from_description(parsed_content)
+    if sql_query is None:
+        return
     
+    # Queries that can't run are sent back to the LLM with the problems found, instead of to the warehouse
+    validation = validate_query(sql_query)
+    if not validation.valid and max_repairs > 0:
+        print(f"Repairing the SQL for report '{report_statement}': {[issue.message for issue in validation.issues]}")
+        return get_sql_from_description(f"{user_prompt}\n\n{validation.to_repair_prompt()}",
+                                        report_statement, report_description, max_repairs - 1)
+    return sql_query
+
+
+async def get_sql_from_description_async(client, user_prompt: str, report_statement: str, report_description: str, max_repairs: int = 2):
+    
+    gpt_context = get_sql_from_description_context(report_statement, report_description)
+    
+    parsed_content = await ma.get_mixtral_response_async(text = user_prompt,
+                                                         context = gpt_context,
+                                                         output_format = SqlQuery,
+                                                         client = client
+                                                         )
+    sql_query = parse_sql_from_description(parsed_content)
+    if sql_query is None:
+        return
+    
+    validation = validate_query(sql_query)
+    if not validation.valid and max_repairs > 0:
+        print(f"Repairing the SQL for report '{report_statement}': {[issue.message for issue in validation.issues]}")
+        return await get_sql_from_description_async(client, f"{user_prompt}\n\n{validation.to_repair_prompt()}",
+                                                    report_statement, report_description, max_repairs - 1)
+    return sql_query
+        
 
 def get_sql_from_description2(user_prompt: str, report_statement: str, report_description: str):
     
@@ -145,39 +196,107 @@ def get_sql_from_description2(user_prompt: str, report_statement: str, report_de
     
     return " ".join(sql_query.output.split("\n"))    
 
-def get_sqls_from_descriptions(user_prompt: str, report_to_description_map: Dict)-> Dict:
-    topic_to_sql_map = {}
-    
+def get_sqls_from_descriptions(user_prompt: str, report_to_description_map: Dict, cancel: threading.Event = None)-> Dict:
+    # The reports are independent, so their SQL is generated concurrently
+    calls = {}
     for report_statement in report_to_description_map:
         report_description = report_to_description_map[report_statement]
-        sql_query = get_sql_from_description(user_prompt, report_statement, report_description)
-        topic_to_sql_map[report_statement] = sql_query
+        calls[report_statement] = partial(get_sql_from_description_async, user_prompt = user_prompt,
+                                          report_statement = report_statement, report_description = report_description)
+    
+    topic_to_sql_map = llm_runner.run(calls, cancel = cancel)
         
-    return topic_to_sql_map
+    return {report_statement: topic_to_sql_map[report_statement] for report_statement in report_to_description_map}
 
 
-def get_topic_to_dataframe_map(topic_to_sql_map: Dict)-> Dict:
-    topic_to_df_map = {}
+def iter_topic_dataframes(topic_to_sql_map: Dict, cancel: threading.Event = None)-> Iterator[Tuple[str, pd.DataFrame]]:
+    canonical_to_topics = {}
+    canonical_to_sql = {}
     for topic in topic_to_sql_map:
         sql_query = topic_to_sql_map[topic]
-        query_df = get_dataframe_from_query(sql_query)
-        topic_to_df_map[topic] = query_df
+        if not sql_query:
+            # The LLM call failed or timed out, so there is nothing to run
+            print(f"No SQL was generated for topic: {topic}")
+            yield topic, pd.DataFrame()
+            continue
+        canonical_query = canonicalize_query(sql_query)
+        # Topics whose queries are equivalent share one warehouse query
+        canonical_to_topics.setdefault(canonical_query, []).append(topic)
+        canonical_to_sql.setdefault(canonical_query, sql_query)
+    
+    print(f"Query fingerprints: {fingerprint_stats.format_stats()}")
     
-    return topic_to_df_map
+    # Results arrive in completion order, so the first charts can render before the slowest query finishes
+    for result in query_executor.run(canonical_to_sql, cancel = cancel):
+        topics = canonical_to_topics[result.topic]
+        print(f"Loaded {len(result.df)} rows for topic: {topics[0]} in {result.seconds:.2f}s")
+        yield topics[0], result.df
+        for topic in topics[1:]:
+            print(f"Reusing the result of an equivalent query for topic: {topic}")
+            yield topic, result.df.copy(deep = False)
 
 
-def generate_chart_info_from_df(user_prompt: str, df: pd.DataFrame, max_rows: int = 3):
+def submit_topic_queries(topic_to_sql_map: Dict)-> Dict:
+    # Returns the handle id of each topic's query; equivalent queries share one handle
+    # and topics without SQL get None
+    canonical_to_handle_id = {}
+    topic_to_handle_id = {}
+    for topic in topic_to_sql_map:
+        sql_query = topic_to_sql_map[topic]
+        if not sql_query:
+            print(f"No SQL was generated for topic: {topic}")
+            topic_to_handle_id[topic] = None
+            continue
+        canonical_query = canonicalize_query(sql_query)
+        if canonical_query not in canonical_to_handle_id:
+            canonical_to_handle_id[canonical_query] = submit_query(sql_query, canonical_query = canonical_query).id
+        topic_to_handle_id[topic] = canonical_to_handle_id[canonical_query]
     
-    chart_names = get_chart_names()
-    chart_map = get_chart_map()
+    print(f"Submitted {len(canonical_to_handle_id)} queries for {len(topic_to_sql_map)} topics")
+    return topic_to_handle_id
 
-    gpt_context = ContextTexts.GET_CHART_SUMMARY.value.format(user_prompt = user_prompt,
-                                                               df_map = df.head(max_rows), 
-                                                               df_stats = df.describe(include= "all"),    
-                                                               chart_names = chart_names, 
-                                                               chart_map = chart_map,
-                                                              output_format = json.dumps(GenerateCharts.model_json_schema(), indent=2)
-                                                               )
+
+def get_topic_to_dataframe_map(topic_to_sql_map: Dict)-> Dict:
+    topic_to_df_map = dict(iter_topic_dataframes(topic_to_sql_map))
+    print(query_stats.format_report())
+    
+    return {topic: topic_to_df_map[topic] for topic in topic_to_sql_map}
+
+
+def get_chart_query_map(topic_to_sql_map: Dict, topic_to_chart_info: Dict, topic_to_dataframe_map: Dict)-> Dict:
+    # Charts the warehouse can aggregate for, keyed by (topic, chart index); the
+    # earlier results of the topic queries tell which columns are numeric
+    chart_query_map = {}
+    for topic in topic_to_chart_info:
+        chart_info_content = topic_to_chart_info[topic]
+        df = topic_to_dataframe_map.get(topic)
+        if not topic_to_sql_map.get(topic) or not chart_info_content or not isinstance(df, pd.DataFrame) or df.empty:
+            continue
+        
+        numeric_columns = [column for column in df.columns if pd.api.types.is_numeric_dtype(df[column])]
+        for idx, chart_content in enumerate(chart_info_content.chart_content):
+            chart_query = aggregate_query_for_chart(topic_to_sql_map[topic], chart_content.chart_type, chart_content.chart_columns, numeric_columns)
+            if chart_query:
+                chart_query_map[(topic, idx)] = chart_query
+    
+    return chart_query_map
+
+
+def get_chart_info_context(user_prompt: str, df: pd.DataFrame, max_rows: int = 3)-> str:
+    
+    return prompt_registry.prompt(ContextTexts.GET_CHART_SUMMARY,
+                                  chart_names = prompt_registry.static_text("chart_names", get_chart_names),
+                                  chart_map = prompt_registry.static_text("chart_map", get_chart_map),
+                                  output_format = prompt_registry.schema_json(GenerateCharts)
+                                  ).format(user_prompt = user_prompt,
+                                           df_map = df.head(max_rows),
+                                           df_stats = df.describe(include= "all")
+                                           )
+
+
+def generate_chart_info_from_df(user_prompt: str, df: pd.DataFrame, max_rows: int = 3):
+    
+    gpt_context = get_chart_info_context(user_prompt, df, max_rows)
     
     charts_object = ma.get_mixtral_response(text = user_prompt,
                                         context = gpt_context,
@@ -186,17 +305,27 @@ def generate_chart_info_from_df(user_prompt: str, df: pd.DataFrame, max_rows: in
     
     return charts_object
 
-def generate_all_charts_info(user_prompt: str, topic_to_dataframe_map: Dict)-> Dict:
-    topic_to_chart_info = {}
+
+async def generate_chart_info_from_df_async(client, user_prompt: str, df: pd.DataFrame, max_rows: int = 3):
     
+    gpt_context = get_chart_info_context(user_prompt, df, max_rows)
+    
+    return await ma.get_mixtral_response_async(text = user_prompt,
+                                               context = gpt_context,
+                                               output_format = GenerateCharts,
+                                               client = client
+                                               )
+
+def generate_all_charts_info(user_prompt: str, topic_to_dataframe_map: Dict, cancel: threading.Event = None)-> Dict:
+    # One chart spec per topic, all requested concurrently; rate limits are retried per call
+    calls = {}
     for topic in topic_to_dataframe_map:
-        time.sleep(60)
         print(f"Getting charts for topic: {topic}")
         df = topic_to_dataframe_map[topic]
         
         if isinstance(df, pd.DataFrame):
-            charts_object = generate_chart_info_from_df(user_prompt, df)
-            
-            topic_to_chart_info[topic] = charts_object
+            calls[topic] = partial(generate_chart_info_from_df_async, user_prompt = user_prompt, df = df)
+    
+    topic_to_chart_info = llm_runner.run(calls, cancel = cancel)
         
     return topic_to_chart_info
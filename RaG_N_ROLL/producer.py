@@ -1,23 +1,71 @@
+import argparse
 import asyncio
+import multiprocessing
 import os
+import queue
 import signal
 import sys
+import threading
 import time
 from datetime import datetime, timedelta
-from typing import Dict, Any, List
+from typing import Dict, Any, Callable, List, Optional, Tuple
 
 from dotenv import load_dotenv
 from faker import Faker
 import snowflake.connector
-from snowflake.connector.pandas_tools import write_pandas
+import numpy as np
 import pandas as pd
 
+from producer_utilities.sinks import (LOCAL_SINKS,
+                                      MEDICAL_RECORDS_COLUMNS,
+                                      SINK_NAMES,
+                                      SNOWFLAKE_MEDICAL_RECORDS_DDL,
+                                      RecordSink,
+                                      SnowflakeSink,
+                                      shard_sink_path
+                                      )
+from producer_utilities.pipeline import LoadPipeline
+from producer_utilities.dead_letter import RetryingSink, RetryPolicy
+from producer_utilities.load_profiles import (LoadProfile,
+                                              RateReporter,
+                                              RateScheduler,
+                                              parse_profile
+                                              )
+
 # Load environment variables
 load_dotenv()
 
 # Initialize Faker
 fake = Faker()
 
+# Lists for realistic medical data generation
+DEPARTMENTS = ['Cardiology', 'Neurology', 'Oncology', 'Pediatrics', 
+               'Emergency', 'Orthopedics', 'Internal Medicine']
+
+BLOOD_TYPES = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
+
+COMMON_DIAGNOSES = [
+    'Hypertension', 'Type 2 Diabetes', 'Acute Bronchitis',
+    'Major Depressive Disorder', 'Osteoarthritis', 'Migraine',
+    'Upper Respiratory Infection', 'Lower Back Pain'
+]
+
+MEDICATIONS = [
+    'Lisinopril', 'Metformin', 'Amlodipine', 'Omeprazole',
+    'Sertraline', 'Amoxicillin', 'Ibuprofen', 'Levothyroxine'
+]
+
+INSURANCE_PROVIDERS = [
+    'Blue Cross Blue Shield', 'UnitedHealth Group', 'Aetna',
+    'Cigna', 'Humana', 'Kaiser Permanente', 'Medicare', 'Medicaid'
+]
+
+GENDERS = ['Male', 'Female', 'Other']
+
+ALLERGIES = ['Penicillin', 'Pollen', 'Latex', 'Peanuts', 'None']
+
+PHYSICIAN_TITLES = ['MD', 'DO']
+
 def create_snowflake_connection():
     """
     Creates and returns a connection to Snowflake using environment variables.
@@ -50,30 +98,7 @@ def create_medical_table(conn):
     """
     try:
         with conn.cursor() as cursor:
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS MEDICAL_RECORDS (
-                    record_id VARCHAR(36) PRIMARY KEY,
-                    created_at TIMESTAMP_NTZ,
-                    patient_id VARCHAR(36),
-                    patient_name VARCHAR(100),
-                    date_of_birth DATE,
-                    age INTEGER,
-                    gender VARCHAR(20),
-                    blood_type VARCHAR(5),
-                    diagnosis VARCHAR(200),
-                    treatment_plan TEXT,
-                    medication VARCHAR(500),
-                    allergies VARCHAR(500),
-                    vital_signs VARIANT,
-                    insurance_provider VARCHAR(100),
-                    insurance_id VARCHAR(50),
-                    attending_physician VARCHAR(100),
-                    department VARCHAR(50),
-                    admission_date TIMESTAMP_NTZ,
-                    discharge_date TIMESTAMP_NTZ,
-                    last_updated_at TIMESTAMP_NTZ
-                )
-            """)
+            cursor.execute(SNOWFLAKE_MEDICAL_RECORDS_DDL)
     except Exception as e:
         print(f"Error creating table: {e}")
         raise
@@ -85,28 +110,6 @@ def generate_medical_record() -> Dict[str, Any]:
     Returns:
         Dict[str, Any]: Generated medical record data
     """
-    # Lists for realistic medical data generation
-    departments = ['Cardiology', 'Neurology', 'Oncology', 'Pediatrics', 
-                  'Emergency', 'Orthopedics', 'Internal Medicine']
-    
-    blood_types = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
-    
-    common_diagnoses = [
-        'Hypertension', 'Type 2 Diabetes', 'Acute Bronchitis',
-        'Major Depressive Disorder', 'Osteoarthritis', 'Migraine',
-        'Upper Respiratory Infection', 'Lower Back Pain'
-    ]
-    
-    medications = [
-        'Lisinopril', 'Metformin', 'Amlodipine', 'Omeprazole',
-        'Sertraline', 'Amoxicillin', 'Ibuprofen', 'Levothyroxine'
-    ]
-    
-    insurance_providers = [
-        'Blue Cross Blue Shield', 'UnitedHealth Group', 'Aetna',
-        'Cigna', 'Humana', 'Kaiser Permanente', 'Medicare', 'Medicaid'
-    ]
-
     # Generate admission and discharge dates
     current_time = datetime.now()
     admission_date = fake.date_time_between(start_date='-30d', end_date='now')
@@ -126,12 +129,12 @@ def generate_medical_record() -> Dict[str, Any]:
         'patient_name': fake.name(),
         'date_of_birth': date_of_birth.strftime('%Y-%m-%d'),
         'age': age,
-        'gender': fake.random_element(elements=('Male', 'Female', 'Other')),
-        'blood_type': fake.random_element(elements=blood_types),
-        'diagnosis': fake.random_element(elements=common_diagnoses),
+        'gender': fake.random_element(elements=GENDERS),
+        'blood_type': fake.random_element(elements=BLOOD_TYPES),
+        'diagnosis': fake.random_element(elements=COMMON_DIAGNOSES),
         'treatment_plan': fake.paragraph(nb_sentences=3),
-        'medication': ', '.join(fake.random_elements(elements=medications, length=fake.random_int(1, 3))),
-        'allergies': ', '.join(fake.random_elements(elements=['Penicillin', 'Pollen', 'Latex', 'Peanuts', 'None'], length=fake.random_int(0, 2))),
+        'medication': ', '.join(fake.random_elements(elements=MEDICATIONS, length=fake.random_int(1, 3))),
+        'allergies': ', '.join(fake.random_elements(elements=ALLERGIES, length=fake.random_int(0, 2))),
         'vital_signs': {
             'blood_pressure': f"{fake.random_int(90, 140)}/{fake.random_int(60, 90)}",
             'heart_rate': fake.random_int(60, 100),
@@ -139,15 +142,202 @@ def generate_medical_record() -> Dict[str, Any]:
             'respiratory_rate': fake.random_int(12, 20),
             'oxygen_saturation': fake.random_int(95, 100)
         },
-        'insurance_provider': fake.random_element(elements=insurance_providers),
+        'insurance_provider': fake.random_element(elements=INSURANCE_PROVIDERS),
         'insurance_id': fake.bothify(text='???-########'),
-        'attending_physician': fake.name() + ", " + fake.random_element(elements=['MD', 'DO']),
-        'department': fake.random_element(elements=departments),
+        'attending_physician': fake.name() + ", " + fake.random_element(elements=PHYSICIAN_TITLES),
+        'department': fake.random_element(elements=DEPARTMENTS),
         'admission_date': admission_date.strftime('%Y-%m-%d %H:%M:%S'),
         'discharge_date': discharge_date.strftime('%Y-%m-%d %H:%M:%S'),
         'last_updated_at': current_time.strftime('%Y-%m-%d %H:%M:%S')
     }
 
+def _format_timestamps(values: np.ndarray) -> np.ndarray:
+    """
+    Formats datetime64[s] values as 'YYYY-MM-DD HH:MM:SS' strings.
+    """
+    return np.char.replace(np.datetime_as_string(values, unit='s'), 'T', ' ')
+
+def _random_uuid4_strings(rng: np.random.Generator, n: int) -> np.ndarray:
+    """
+    Draws n random version 4 UUID strings without a per-row uuid4() call.
+    """
+    nibbles = rng.integers(0, 16, size=(n, 32), dtype=np.uint8)
+    nibbles[:, 12] = 4                                # version
+    nibbles[:, 16] = 8 + (nibbles[:, 16] & 0b0011)    # RFC 4122 variant
+    chars = np.array(list('0123456789abcdef'))[nibbles]
+    dash = np.full((n, 1), '-')
+    chars = np.hstack([chars[:, :8], dash, chars[:, 8:12], dash, chars[:, 12:16],
+                       dash, chars[:, 16:20], dash, chars[:, 20:]])
+    return np.ascontiguousarray(chars).view('<U36').ravel()
+
+def _random_joined_elements(rng: np.random.Generator, elements: List[str],
+                            n: int, min_length: int, max_length: int) -> np.ndarray:
+    """
+    Vectorized equivalent of ', '.join(fake.random_elements(elements, length=k))
+    with k drawn uniformly from [min_length, max_length].
+    """
+    lengths = rng.integers(min_length, max_length + 1, size=n)
+    picks = np.asarray(elements, dtype=object)[rng.integers(0, len(elements), size=(n, max_length))]
+    joined = np.where(lengths > 0, picks[:, 0], '').astype(object)
+    for position in range(1, max_length):
+        joined = np.where(lengths > position, joined + ', ' + picks[:, position], joined)
+    return joined
+
+def draw_text_pools(pool_size: int = 1000, seed: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Draws the pools of names and treatment plans generate_medical_records samples from.
+
+    Args:
+        pool_size (int): Number of distinct names and treatment plans to draw
+        seed (Optional[int]): Seed for reproducible pools
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Name pool and treatment plan pool
+    """
+    pool_fake = fake
+    if seed is not None:
+        pool_fake = Faker()
+        pool_fake.seed_instance(seed)
+    name_pool = np.array([pool_fake.name() for _ in range(pool_size)], dtype=object)
+    plan_pool = np.array([pool_fake.paragraph(nb_sentences=3) for _ in range(pool_size)], dtype=object)
+    return name_pool, plan_pool
+
+def generate_medical_records(n: int, seed: Optional[int] = None, pool_size: int = 1000,
+                             text_pools: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> pd.DataFrame:
+    """
+    Generates a batch of fake medical records column-wise with NumPy.
+
+    Categorical fields are drawn with vectorized choices, dates are computed with
+    datetime64 arithmetic and names/treatment plans are sampled from pools drawn
+    from Faker. The columns and string formats match generate_medical_record.
+
+    Args:
+        n (int): Number of records to generate
+        seed (Optional[int]): Seed for reproducible batches
+        pool_size (int): Number of distinct names and treatment plans drawn from Faker
+        text_pools (Optional[Tuple[np.ndarray, np.ndarray]]): Pools from draw_text_pools
+            to reuse across batches instead of drawing new ones for this batch
+
+    Returns:
+        pd.DataFrame: Generated records in MEDICAL_RECORDS column order
+    """
+    rng = np.random.default_rng(seed)
+    if text_pools is None:
+        text_pools = draw_text_pools(max(1, min(pool_size, n)), seed=seed)
+    name_pool, plan_pool = text_pools
+    pool_size = len(name_pool)
+
+    current_time = np.datetime64(datetime.now().replace(microsecond=0), 's')
+    today = current_time.astype('datetime64[D]')
+
+    # Admission within the last 30 days, discharge up to 14 days after admission
+    admission_date = current_time - rng.integers(0, 30 * 86400 + 1, size=n).astype('timedelta64[s]')
+    discharge_date = admission_date + rng.integers(0, 14 * 86400 + 1, size=n).astype('timedelta64[s]')
+
+    # Date of birth for ages 18 to 90, with age computed as in generate_medical_record
+    this_month = today.astype('datetime64[M]')
+    day_of_month = today - this_month.astype('datetime64[D]')
+    oldest_birth = (this_month - 91 * 12).astype('datetime64[D]') + day_of_month + 1
+    youngest_birth = (this_month - 18 * 12).astype('datetime64[D]') + day_of_month
+    birth_span = (youngest_birth - oldest_birth).astype(int)
+    date_of_birth = oldest_birth + rng.integers(0, birth_span + 1, size=n).astype('timedelta64[D]')
+    age = (today - date_of_birth).astype(int) // 365
+
+    systolic = rng.integers(90, 141, size=n).astype(str).astype(object)
+    diastolic = rng.integers(60, 91, size=n).astype(str).astype(object)
+    vital_signs = [
+        {'blood_pressure': blood_pressure,
+         'heart_rate': heart_rate,
+         'temperature': temperature,
+         'respiratory_rate': respiratory_rate,
+         'oxygen_saturation': oxygen_saturation}
+        for blood_pressure, heart_rate, temperature, respiratory_rate, oxygen_saturation in zip(
+            systolic + '/' + diastolic,
+            rng.integers(60, 101, size=n).tolist(),
+            np.round(rng.uniform(36.1, 37.5, size=n), 1).tolist(),
+            rng.integers(12, 21, size=n).tolist(),
+            rng.integers(95, 101, size=n).tolist()
+        )
+    ]
+
+    letters = np.array(list('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+    digits = np.array(list('0123456789'))
+    insurance_chars = np.hstack([letters[rng.integers(0, len(letters), size=(n, 3))],
+                                 np.full((n, 1), '-'),
+                                 digits[rng.integers(0, len(digits), size=(n, 8))]])
+    insurance_id = np.ascontiguousarray(insurance_chars).view('<U12').ravel()
+
+    physician_titles = np.asarray(PHYSICIAN_TITLES, dtype=object)[rng.integers(0, len(PHYSICIAN_TITLES), size=n)]
+    attending_physician = name_pool[rng.integers(0, pool_size, size=n)] + ', ' + physician_titles
+
+    timestamp = str(current_time).replace('T', ' ')
+
+    return pd.DataFrame({
+        'record_id': _random_uuid4_strings(rng, n),
+        'created_at': np.full(n, timestamp, dtype=object),
+        'patient_id': _random_uuid4_strings(rng, n),
+        'patient_name': name_pool[rng.integers(0, pool_size, size=n)],
+        'date_of_birth': np.datetime_as_string(date_of_birth, unit='D'),
+        'age': age,
+        'gender': rng.choice(GENDERS, size=n),
+        'blood_type': rng.choice(BLOOD_TYPES, size=n),
+        'diagnosis': rng.choice(COMMON_DIAGNOSES, size=n),
+        'treatment_plan': plan_pool[rng.integers(0, pool_size, size=n)],
+        'medication': _random_joined_elements(rng, MEDICATIONS, n, 1, 3),
+        'allergies': _random_joined_elements(rng, ALLERGIES, n, 0, 2),
+        'vital_signs': vital_signs,
+        'insurance_provider': rng.choice(INSURANCE_PROVIDERS, size=n),
+        'insurance_id': insurance_id,
+        'attending_physician': attending_physician,
+        'department': rng.choice(DEPARTMENTS, size=n),
+        'admission_date': _format_timestamps(admission_date),
+        'discharge_date': _format_timestamps(discharge_date),
+        'last_updated_at': np.full(n, timestamp, dtype=object),
+    }, columns=MEDICAL_RECORDS_COLUMNS)
+
+def records_to_dataframe(records: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    Converts a list of generated medical records into a DataFrame.
+    
+    Args:
+        records (List[Dict[str, Any]]): Medical records to convert
+    
+    Returns:
+        pd.DataFrame: Records in MEDICAL_RECORDS column order
+    """
+    return pd.DataFrame.from_records(records, columns=MEDICAL_RECORDS_COLUMNS)
+
+def insert_medical_dataframe(conn, df: pd.DataFrame) -> int:
+    """
+    Inserts a DataFrame of medical records into Snowflake with a single bulk load.
+    
+    Args:
+        conn: Snowflake connection object
+        df (pd.DataFrame): Medical records with vital_signs as dictionaries
+    
+    Returns:
+        int: Number of rows loaded
+    
+    Raises:
+        RuntimeError: If write_pandas reports a failed load
+    """
+    return SnowflakeSink(conn, close_connection=False).write(df)
+
+def insert_medical_records(conn, records: List[Dict[str, Any]]) -> int:
+    """
+    Inserts a batch of medical records into Snowflake with a single bulk load.
+    
+    Args:
+        conn: Snowflake connection object
+        records (List[Dict[str, Any]]): Medical records to insert
+    
+    Returns:
+        int: Number of rows loaded
+    """
+    if not records:
+        return 0
+    return insert_medical_dataframe(conn, records_to_dataframe(records))
+
 async def insert_medical_record(conn, record: Dict[str, Any]):
     """
     Inserts a single medical record into Snowflake.
@@ -157,97 +347,832 @@ async def insert_medical_record(conn, record: Dict[str, Any]):
         record (Dict[str, Any]): Medical record to insert
     """
     try:
-        # Convert record to DataFrame for efficient loading
-        df = pd.DataFrame([record])
-        
-        # Convert vital_signs dictionary to JSON string
-        df['vital_signs'] = df['vital_signs'].apply(lambda x: str(x))
-        
-        # Write to Snowflake
-        success, nchunks, nrows, _ = write_pandas(
-            conn=conn,
-            df=df,
-            table_name='MEDICAL_RECORDS',
-            quote_identifiers=False
-        )
-        
-        if success:
-            print(f"Successfully inserted record {record['record_id']}")
-        else:
-            print(f"Failed to insert record {record['record_id']}")
-            
+        insert_medical_records(conn, [record])
+        print(f"Successfully inserted record {record['record_id']}")
+    
     except Exception as e:
         print(f"Error inserting record: {e}")
 
-async def continuous_data_generation(conn, generation_interval: int = 10, pause_interval: int = 60):
+class MedicalRecordBatcher:
+    """
+    Accumulates medical records into size/time windows and writes each window
+    to a sink with one bulk load, whichever limit is reached first. Single
+    records and pre-built batches from generate_medical_records can be mixed.
+    
+    Args:
+        sink (RecordSink): Destination each window is written to
+        batch_size (int): Maximum number of records held before a flush
+        batch_interval (float): Maximum seconds a record is held before a flush
+        on_flush (Callable[[int, float], None]): Optional callback receiving the rows
+            loaded and the flush latency in seconds after each successful flush
+        verbose (bool): Whether to print throughput after each flush
+        auto_flush (bool): Whether add() and add_dataframe() flush due windows
+            themselves; a LoadPipeline turns this off and drains windows instead
+    """
+    
+    def __init__(self, sink: RecordSink, batch_size: int = 5000, batch_interval: float = 2.0,
+                 on_flush: Optional[Callable[[int, float], None]] = None, verbose: bool = True,
+                 auto_flush: bool = True):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.on_flush = on_flush
+        self.verbose = verbose
+        self.auto_flush = auto_flush
+        # Loader threads share the sink; serialize writes unless it allows concurrent ones
+        self._write_lock = None if sink.concurrent_writes else threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._records: List[Dict[str, Any]] = []
+        self._frames: List[pd.DataFrame] = []
+        self._frame_rows = 0
+        self._window_start = None
+        self.total_rows = 0
+        self.total_flushes = 0
+        self.total_load_seconds = 0.0
+    
+    def __len__(self):
+        return len(self._records) + self._frame_rows
+    
+    def add(self, record: Dict[str, Any]):
+        """
+        Adds a record to the current window, flushing it if the window is due.
+        
+        Args:
+            record (Dict[str, Any]): Medical record to buffer
+        """
+        if not len(self):
+            self._window_start = time.monotonic()
+        self._records.append(record)
+        if self.auto_flush:
+            self.flush_if_due()
+    
+    def add_dataframe(self, df: pd.DataFrame):
+        """
+        Adds a batch of generated records to the current window, flushing it if the window is due.
+        
+        Args:
+            df (pd.DataFrame): Records produced by generate_medical_records
+        """
+        if df.empty:
+            return
+        if not len(self):
+            self._window_start = time.monotonic()
+        self._frames.append(df)
+        self._frame_rows += len(df)
+        if self.auto_flush:
+            self.flush_if_due()
+    
+    def is_due(self) -> bool:
+        """
+        Checks whether the current window has hit its size or time limit.
+        
+        Returns:
+            bool: True if the window should be flushed
+        """
+        if not len(self):
+            return False
+        if len(self) >= self.batch_size:
+            return True
+        return time.monotonic() - self._window_start >= self.batch_interval
+    
+    def flush_if_due(self) -> int:
+        """
+        Flushes the current window if it is due.
+        
+        Returns:
+            int: Number of rows loaded
+        """
+        if self.is_due():
+            return self.flush()
+        return 0
+    
+    def drain(self) -> Optional[pd.DataFrame]:
+        """
+        Removes the current window from the batcher without loading it.
+        
+        Returns:
+            Optional[pd.DataFrame]: Every buffered record, or None if the window is empty
+        """
+        if not len(self):
+            return None
+        
+        frames, self._frames, self._frame_rows = self._frames, [], 0
+        if self._records:
+            frames.append(records_to_dataframe(self._records))
+            self._records = []
+        self._window_start = None
+        return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    
+    def write(self, df: pd.DataFrame) -> int:
+        """
+        Writes a drained window to the sink with one bulk load and reports throughput.
+        Safe to call from loader threads.
+        
+        Args:
+            df (pd.DataFrame): Window returned by drain()
+        
+        Returns:
+            int: Number of rows loaded
+        """
+        flush_start = time.monotonic()
+        try:
+            if self._write_lock is None:
+                nrows = self.sink.write(df)
+            else:
+                with self._write_lock:
+                    nrows = self.sink.write(df)
+        except Exception as e:
+            print(f"Error inserting batch of {len(df)} records: {e}")
+            return 0
+        flush_latency = time.monotonic() - flush_start
+        
+        with self._stats_lock:
+            self.total_rows += nrows
+            self.total_flushes += 1
+            self.total_load_seconds += flush_latency
+            total_rows, total_flushes = self.total_rows, self.total_flushes
+        if self.on_flush is not None:
+            self.on_flush(nrows, flush_latency)
+        if self.verbose:
+            rows_per_second = nrows / flush_latency if flush_latency > 0 else float('inf')
+            print(f"Flushed {nrows} records in {flush_latency:.3f}s "
+                  f"({rows_per_second:,.0f} rows/s, {total_rows} rows in {total_flushes} flushes)")
+        return nrows
+    
+    def flush(self) -> int:
+        """
+        Writes every buffered record to the sink with one bulk load and reports throughput.
+        
+        Returns:
+            int: Number of rows loaded
+        """
+        df = self.drain()
+        if df is None:
+            return 0
+        return self.write(df)
+
+def format_rate(rows: int, seconds: float) -> str:
+    """
+    Formats a throughput figure for the producer reports.
+    
+    Args:
+        rows (int): Number of rows processed
+        seconds (float): Time spent processing them
+    
+    Returns:
+        str: Rows per second, or 'n/a' if no time was spent
+    """
+    return f"{rows / seconds:,.0f} rows/s" if seconds > 0 else "n/a"
+
+async def continuous_data_generation(sink: RecordSink,
+                                     generation_interval: float = 10,
+                                     pause_interval: int = 60,
+                                     batch_size: int = 5000,
+                                     batch_interval: float = 2.0,
+                                     batcher: MedicalRecordBatcher = None,
+                                     records_per_tick: int = 1,
+                                     pipeline: Optional[LoadPipeline] = None):
     """
     Continuously generates and inserts medical records with specified intervals.
     
+    Records are loaded in micro-batches: a batch is flushed once it holds
+    `batch_size` records or its oldest record has waited `batch_interval` seconds.
+    After each cycle the time spent generating and loading is reported separately.
+    
     Args:
-        conn: Snowflake connection object
-        generation_interval (int): Seconds between each record generation
+        sink (RecordSink): Destination the records are written to
+        generation_interval (float): Seconds between each record generation
         pause_interval (int): Seconds to pause after each minute of generation
+        batch_size (int): Maximum number of records loaded per flush
+        batch_interval (float): Maximum seconds a record is buffered before a flush
+        batcher (MedicalRecordBatcher): Optional batcher to use instead of a new one
+        records_per_tick (int): Records generated per interval; values above 1 use
+            the vectorized generate_medical_records
+        pipeline (Optional[LoadPipeline]): Pipeline loading the batcher's windows
+            concurrently with generation; without one they are loaded inline
     """
+    if batcher is None:
+        batcher = MedicalRecordBatcher(sink, batch_size=batch_size, batch_interval=batch_interval)
+    if pipeline is None:
+        pipeline = LoadPipeline(batcher, num_loaders=0)
+    
+    text_pools = draw_text_pools() if records_per_tick > 1 else None
+
     try:
         while True:
             print("\nStarting medical record generation cycle...")
             cycle_start = time.time()
+            generated_rows = 0
+            generation_seconds = 0.0
+            loaded_rows = batcher.total_rows
+            load_seconds = batcher.total_load_seconds
             
             # Generate records for one minute
             while time.time() - cycle_start < 60:
-                record = generate_medical_record()
-                await insert_medical_record(conn, record)
+                generation_start = time.monotonic()
+                if records_per_tick > 1:
+                    records = generate_medical_records(records_per_tick, text_pools=text_pools)
+                    generation_seconds += time.monotonic() - generation_start
+                    batcher.add_dataframe(records)
+                else:
+                    record = generate_medical_record()
+                    generation_seconds += time.monotonic() - generation_start
+                    batcher.add(record)
+                generated_rows += max(records_per_tick, 1)
                 await asyncio.sleep(generation_interval)
+                await pipeline.flush_if_due()
             
+            await pipeline.flush()
+            loaded_rows = batcher.total_rows - loaded_rows
+            load_seconds = batcher.total_load_seconds - load_seconds
+            print(f"Cycle summary: generated {generated_rows} records "
+                  f"({format_rate(generated_rows, generation_seconds)}), "
+                  f"loaded {loaded_rows} records into {sink.name} "
+                  f"({format_rate(loaded_rows, load_seconds)})")
+            if pipeline.num_loaders:
+                print(f"Pipeline: {pipeline.format_stats()}")
+            if isinstance(sink, RetryingSink):
+                print(f"Retries: {sink.format_stats()}")
             print(f"\nPausing for {pause_interval} seconds...")
             await asyncio.sleep(pause_interval)
-            
+    
+    except asyncio.CancelledError:
+        await pipeline.close()
+        print("\nData generation stopped.")
+    except Exception as e:
+        print(f"\nAn error occurred during data generation: {e}")
+
+async def profiled_data_generation(sink: RecordSink,
+                                   profile: LoadProfile,
+                                   batch_size: int = 5000,
+                                   batch_interval: float = 2.0,
+                                   batcher: MedicalRecordBatcher = None,
+                                   chunk_size: int = 5000,
+                                   report_interval: float = 5.0,
+                                   duration: Optional[float] = None,
+                                   seed: Optional[int] = None,
+                                   pipeline: Optional[LoadPipeline] = None):
+    """
+    Generates records at the rate given by a load profile and reports target vs. achieved rates.
+    
+    A token-bucket RateScheduler decides how many records are due on every tick,
+    so time spent generating and loading is made up on the following ticks
+    instead of lowering the achieved rate.
+    
+    Args:
+        sink (RecordSink): Destination the records are written to
+        profile (LoadProfile): Target records per second over time
+        batch_size (int): Maximum number of records loaded per flush
+        batch_interval (float): Maximum seconds a record is buffered before a flush
+        batcher (MedicalRecordBatcher): Optional batcher to use instead of a new one
+        chunk_size (int): Maximum records produced per generate_medical_records call
+        report_interval (float): Seconds between target vs. achieved reports
+        duration (Optional[float]): Seconds to run for, or None to run until stopped
+        seed (Optional[int]): Seed for the generated records
+        pipeline (Optional[LoadPipeline]): Pipeline loading the batcher's windows
+            concurrently with generation; without one they are loaded inline
+    """
+    if batcher is None:
+        batcher = MedicalRecordBatcher(sink, batch_size=batch_size, batch_interval=batch_interval)
+    if pipeline is None:
+        pipeline = LoadPipeline(batcher, num_loaders=0)
+    
+    chunk_seeds = np.random.default_rng(seed)
+    text_pools = draw_text_pools(seed=int(chunk_seeds.integers(0, 2**63)))
+    scheduler = RateScheduler(profile)
+    reporter = RateReporter(scheduler, report_interval=report_interval)
+    generated_rows = 0
+    loaded_rows = batcher.total_rows
+    
+    print(f"\nGenerating records with load profile: {profile!r}")
+    try:
+        while duration is None or scheduler.elapsed < duration:
+            due_rows = scheduler.due(max_records=chunk_size)
+            if due_rows:
+                records = generate_medical_records(due_rows,
+                                                   seed=int(chunk_seeds.integers(0, 2**63)),
+                                                   text_pools=text_pools)
+                batcher.add_dataframe(records)
+                generated_rows += due_rows
+            await pipeline.flush_if_due()
+            if reporter.maybe_report(generated_rows, batcher.total_rows - loaded_rows):
+                if pipeline.num_loaders:
+                    print(f"Pipeline: {pipeline.format_stats()}")
+                if isinstance(sink, RetryingSink):
+                    print(f"Retries: {sink.format_stats()}")
+            await asyncio.sleep(scheduler.seconds_until_due())
+        
+        await pipeline.flush()
+        print(f"Load profile finished: generated {generated_rows} records for a target of "
+              f"{scheduler.target_records:,.0f} in {scheduler.elapsed:.1f}s")
+    
     except asyncio.CancelledError:
+        await pipeline.close()
         print("\nData generation stopped.")
     except Exception as e:
         print(f"\nAn error occurred during data generation: {e}")
 
-def handle_termination(conn):
+def create_sink(sink_name: str = 'snowflake',
+                sink_path: Optional[str] = None,
+                spool_dir: Optional[str] = None,
+                spool_max_mb: float = 64,
+                max_retries: int = 3,
+                dead_letter_dir: Optional[str] = None,
+                flattened: bool = False) -> RecordSink:
+    """
+    Creates the record sink selected on the command line.
+    
+    Args:
+        sink_name (str): One of SINK_NAMES
+        sink_path (Optional[str]): Database file or directory for the local sinks
+        spool_dir (Optional[str]): Parquet spool directory for the Snowflake sink
+        spool_max_mb (float): Size of pending Parquet files that triggers a load
+        max_retries (int): Retries with backoff before a batch is dead-lettered
+        dead_letter_dir (Optional[str]): Dead-letter spool for batches that still
+            fail; without one they are dropped and counted
+        flattened (bool): Whether every batch is also written to FLATTENED_MEDICAL_RECORDS
+    
+    Returns:
+        RecordSink: The sink, which owns any connection it opened
+    
+    Raises:
+        ValueError: If the sink name is unknown
+    """
+    if sink_name == SnowflakeSink.name:
+        conn = create_snowflake_connection()
+        print("Connected to Snowflake successfully")
+        sink = SnowflakeSink(conn, spool_dir=spool_dir, spool_max_mb=spool_max_mb, flattened=flattened)
+    elif sink_name in LOCAL_SINKS:
+        sink_class = LOCAL_SINKS[sink_name]
+        sink = sink_class(sink_path, flattened=flattened) if sink_path else sink_class(flattened=flattened)
+    else:
+        raise ValueError(f"Unknown sink '{sink_name}', expected one of {SINK_NAMES}")
+    
+    return RetryingSink(sink, policy=RetryPolicy(max_retries=max_retries), dead_letter_dir=dead_letter_dir)
+
+def handle_termination(sink: RecordSink, batcher: MedicalRecordBatcher = None,
+                       pipeline: Optional[LoadPipeline] = None):
     """
-    Handles graceful termination of the Snowflake connection.
+    Handles graceful termination of the sink and its connection.
     
     Args:
-        conn: Snowflake connection to close
+        sink (RecordSink): Sink to close
+        batcher (MedicalRecordBatcher): Optional batcher to flush before closing
+        pipeline (Optional[LoadPipeline]): Optional pipeline whose queued batches
+            are loaded before closing
     """
-    print("\nTermination signal received. Closing Snowflake connection...")
-    conn.close()
+    print(f"\nTermination signal received. Closing {sink.name} sink...")
+    if pipeline is not None and pipeline.num_loaders:
+        print("Waiting for queued batches to load...")
+        pipeline.close_now()
+    if batcher is not None and len(batcher):
+        print(f"Flushing {len(batcher)} buffered records...")
+        batcher.flush()
+    sink.close()
     print("Connection closed. Exiting.")
     sys.exit(0)
 
-async def main():
+def shard_worker(shard_index: int,
+                 seed_sequence: np.random.SeedSequence,
+                 stop_event,
+                 stats_queue,
+                 chunk_size: int = 1000,
+                 batch_size: int = 5000,
+                 batch_interval: float = 2.0,
+                 generation_interval: float = 0,
+                 sink_name: str = 'snowflake',
+                 sink_path: Optional[str] = None,
+                 spool_dir: Optional[str] = None,
+                 spool_max_mb: float = 64,
+                 profile_spec: Optional[str] = None,
+                 num_workers: int = 1,
+                 max_retries: int = 3,
+                 dead_letter_dir: Optional[str] = None,
+                 flattened: bool = False,
+                 duration: Optional[float] = None):
+    """
+    Runs one shard of the sharded producer in its own process.
+    
+    Each shard opens its own sink (and Snowflake connection) and draws every
+    batch from its own seed stream, so shards never share state and a run is
+    reproducible. Statistics are sent to the parent as
+    (shard_index, kind, rows, seconds) tuples where kind is 'generated' or
+    'loaded'; a final 'done' tuple marks a clean exit.
+    
+    Args:
+        shard_index (int): Index of this shard
+        seed_sequence (np.random.SeedSequence): Seed stream owned by this shard
+        stop_event: multiprocessing.Event set by the parent to request shutdown
+        stats_queue: multiprocessing.Queue the statistics are sent to
+        chunk_size (int): Records produced per generate_medical_records call
+        batch_size (int): Maximum number of records loaded per flush
+        batch_interval (float): Maximum seconds a record is buffered before a flush
+        generation_interval (float): Seconds to sleep between generated chunks
+        sink_name (str): Sink the shard writes to
+        sink_path (Optional[str]): Local sink path; each shard gets its own derived path
+        spool_dir (Optional[str]): Parquet spool directory; the shard spools into
+            its own `shard-<index>` subdirectory
+        spool_max_mb (float): Size of pending Parquet files that triggers a load
+        profile_spec (Optional[str]): Load profile for the whole producer; each shard
+            generates its 1/num_workers share instead of running flat out
+        num_workers (int): Number of shards the load profile is split across
+        max_retries (int): Retries with backoff before a batch is dead-lettered
+        dead_letter_dir (Optional[str]): Dead-letter spool directory; the shard uses
+            its own `shard-<index>` subdirectory
+        flattened (bool): Whether batches are also written to FLATTENED_MEDICAL_RECORDS
+        duration (Optional[float]): Seconds to run the load profile for, or None to run until stopped
+    """
+    # The parent owns SIGINT handling and tells shards to stop through stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    
+    sink = None
+    try:
+        sink = create_sink(sink_name,
+                           sink_path=shard_sink_path(sink_path, shard_index),
+                           spool_dir=os.path.join(spool_dir, f"shard-{shard_index}") if spool_dir else None,
+                           spool_max_mb=spool_max_mb,
+                           max_retries=max_retries,
+                           dead_letter_dir=os.path.join(dead_letter_dir, f"shard-{shard_index}") if dead_letter_dir else None,
+                           flattened=flattened)
+        sink.create_table()
+        batcher = MedicalRecordBatcher(
+            sink,
+            batch_size=batch_size,
+            batch_interval=batch_interval,
+            on_flush=lambda nrows, latency: stats_queue.put((shard_index, 'loaded', nrows, latency)),
+            verbose=False
+        )
+        chunk_seeds = np.random.default_rng(seed_sequence)
+        text_pools = draw_text_pools(seed=int(chunk_seeds.integers(0, 2**63)))
+        scheduler = None
+        if profile_spec:
+            scheduler = RateScheduler(parse_profile(profile_spec).scaled(1 / num_workers))
+
+        while not stop_event.is_set() and (duration is None or scheduler is None or scheduler.elapsed < duration):
+            due_rows = scheduler.due(max_records=chunk_size) if scheduler else chunk_size
+            if due_rows:
+                chunk_seed = int(chunk_seeds.integers(0, 2**63))
+                generation_start = time.monotonic()
+                records = generate_medical_records(due_rows, seed=chunk_seed, text_pools=text_pools)
+                stats_queue.put((shard_index, 'generated', len(records), time.monotonic() - generation_start))
+                batcher.add_dataframe(records)
+            if scheduler:
+                stop_event.wait(scheduler.seconds_until_due())
+            elif generation_interval:
+                stop_event.wait(generation_interval)
+            batcher.flush_if_due()
+        batcher.flush()
+    except Exception as e:
+        print(f"Shard {shard_index} stopped with an error: {e}")
+    finally:
+        if sink is not None:
+            sink.close()
+        stats_queue.put((shard_index, 'done', 0, 0.0))
+
+def run_sharded_producer(num_workers: int,
+                         seed: Optional[int] = None,
+                         chunk_size: int = 1000,
+                         batch_size: int = 5000,
+                         batch_interval: float = 2.0,
+                         generation_interval: float = 0,
+                         report_interval: float = 5.0,
+                         shutdown_timeout: float = 30.0,
+                         sink_name: str = 'snowflake',
+                         sink_path: Optional[str] = None,
+                         spool_dir: Optional[str] = None,
+                         spool_max_mb: float = 64,
+                         profile_spec: Optional[str] = None,
+                         max_retries: int = 3,
+                         dead_letter_dir: Optional[str] = None,
+                         flattened: bool = False,
+                         duration: Optional[float] = None):
+    """
+    Runs the producer as `num_workers` processes and aggregates their throughput.
+    
+    The parent spawns the shards with independent seed streams derived from
+    `seed`, prints aggregate end-to-end, generation and load throughput every
+    `report_interval` seconds and on Ctrl+C, or once `duration` has passed, asks
+    every shard to flush and exit.
+    
+    Args:
+        num_workers (int): Number of shard processes to spawn
+        seed (Optional[int]): Root seed; each shard gets its own derived stream
+        chunk_size (int): Records produced per generate_medical_records call
+        batch_size (int): Maximum number of records loaded per flush
+        batch_interval (float): Maximum seconds a record is buffered before a flush
+        generation_interval (float): Seconds each shard sleeps between chunks
+        report_interval (float): Seconds between aggregate throughput reports
+        shutdown_timeout (float): Seconds to wait for shards to flush on shutdown
+        sink_name (str): Sink the shards write to
+        sink_path (Optional[str]): Local sink path, suffixed per shard
+        spool_dir (Optional[str]): Parquet spool directory shared by the shards
+        spool_max_mb (float): Size of pending Parquet files that triggers a load
+        profile_spec (Optional[str]): Load profile shared across the shards, see
+            parse_profile; target vs. achieved rates are reported every `report_interval`
+        max_retries (int): Retries with backoff before a batch is dead-lettered
+        dead_letter_dir (Optional[str]): Dead-letter spool directory shared by the shards
+        flattened (bool): Whether batches are also written to FLATTENED_MEDICAL_RECORDS
+        duration (Optional[float]): Seconds to run for, or None to run until stopped
+    """
+    ctx = multiprocessing.get_context('spawn')
+    stop_event = ctx.Event()
+    stats_queue = ctx.Queue()
+    seed_sequences = np.random.SeedSequence(seed).spawn(num_workers)
+    
+    workers = [
+        ctx.Process(
+            target=shard_worker,
+            args=(shard_index, seed_sequences[shard_index], stop_event, stats_queue,
+                  chunk_size, batch_size, batch_interval, generation_interval,
+                  sink_name, sink_path, spool_dir, spool_max_mb, profile_spec, num_workers,
+                  max_retries, dead_letter_dir, flattened, duration),
+            name=f"producer-shard-{shard_index}"
+        )
+        for shard_index in range(num_workers)
+    ]
+    
+    stop_time = None
+    
+    def sigint_handler(signum, frame):
+        nonlocal stop_time
+        print("\nTermination signal received. Waiting for shards to flush...")
+        stop_time = time.monotonic()
+        stop_event.set()
+    
+    signal.signal(signal.SIGINT, sigint_handler)
+    
+    for worker in workers:
+        worker.start()
+    print(f"\nSharded generation started with {num_workers} workers writing to {sink_name}. "
+          f"Press Ctrl+C to stop.")
+    
+    start_time = time.monotonic()
+    report_start = start_time
+    report_rows = 0
+    total_rows = 0
+    shard_rows = [0] * num_workers
+    generated_rows, generation_seconds = 0, 0.0
+    loaded_rows, load_seconds = 0, 0.0
+    finished = set()
+    # The shards pace themselves; the parent only tracks the combined target,
+    # starting from the first generated chunk so process startup isn't counted
+    reporter = None
+    generation_start = None
+    
+    while len(finished) < num_workers:
+        try:
+            shard_index, kind, nrows, seconds = stats_queue.get(timeout=0.5)
+            if kind == 'done':
+                finished.add(shard_index)
+            elif kind == 'generated':
+                if generation_start is None:
+                    generation_start = time.monotonic()
+                if profile_spec and reporter is None:
+                    reporter = RateReporter(RateScheduler(parse_profile(profile_spec)),
+                                            report_interval=report_interval)
+                generated_rows += nrows
+                generation_seconds += seconds
+            else:
+                shard_rows[shard_index] += nrows
+                report_rows += nrows
+                total_rows += nrows
+                loaded_rows += nrows
+                load_seconds += seconds
+        except queue.Empty:
+            # Shards that were killed never send their final message
+            finished.update(i for i, worker in enumerate(workers)
+                            if not worker.is_alive() and worker.exitcode not in (None, 0))
+        
+        now = time.monotonic()
+        if duration is not None and stop_time is None and generation_start is not None and now - generation_start >= duration:
+            # Shards stop on their own after `duration`; this stops any that lag behind
+            print(f"\nRan for {duration:.1f}s. Waiting for shards to flush...")
+            stop_time = now
+            stop_event.set()
+        if stop_time is not None and now - stop_time > shutdown_timeout:
+            break
+        if now - report_start >= report_interval:
+            print(f"{format_rate(report_rows, now - report_start)} over the last {now - report_start:.1f}s, "
+                  f"{total_rows} rows total ({', '.join(str(rows) for rows in shard_rows)} per shard); "
+                  f"per shard: generation {format_rate(generated_rows, generation_seconds)}, "
+                  f"load {format_rate(loaded_rows, load_seconds)}")
+            report_start, report_rows = now, 0
+        if reporter is not None:
+            reporter.maybe_report(generated_rows, total_rows)
+    
+    for worker in workers:
+        worker.join(timeout=shutdown_timeout)
+        if worker.is_alive():
+            print(f"{worker.name} did not exit in time; terminating it")
+            worker.terminate()
+    
+    elapsed = time.monotonic() - start_time
+    print(f"Sharded generation stopped: {total_rows} rows in {elapsed:.1f}s "
+          f"({format_rate(total_rows, elapsed)})")
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    Parses the producer command line options.
+    
+    Args:
+        argv (Optional[List[str]]): Arguments to parse, defaults to sys.argv
+    
+    Returns:
+        argparse.Namespace: Parsed options
+    """
+    parser = argparse.ArgumentParser(description="Generate synthetic medical records into Snowflake or a local sink.")
+    parser.add_argument('--sink', choices=SINK_NAMES, default='snowflake',
+                        help="Where generated records are written")
+    parser.add_argument('--sink-path', default=None,
+                        help="Database file (duckdb, sqlite) or directory (parquet) for local sinks")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of producer processes; values above 1 run the sharded producer")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Root seed for the sharded producer")
+    parser.add_argument('--generation-interval', type=float, default=None,
+                        help="Seconds between generated records, or between chunks in sharded mode "
+                             "(default: 10, or 0 in sharded mode)")
+    parser.add_argument('--pause-interval', type=int, default=60,
+                        help="Seconds to pause after each minute of generation")
+    parser.add_argument('--records-per-tick', type=int, default=1,
+                        help="Records generated per interval")
+    parser.add_argument('--chunk-size', type=int, default=1000,
+                        help="Records generated per chunk in sharded mode, and the most "
+                             "generated at once under a load profile")
+    parser.add_argument('--profile', default=None,
+                        help="Generate at a target rate instead of the fixed interval cycle: "
+                             "constant:<rate>, step:<seconds>x<rate>,..., "
+                             "burst:<base>,<burst>,<every_seconds>,<burst_seconds> or "
+                             "diurnal:<peak>[,<trough>[,<period_seconds>]]")
+    parser.add_argument('--target-rps', type=float, default=None,
+                        help="Shorthand for --profile constant:<rate>")
+    parser.add_argument('--duration', type=float, default=None,
+                        help="Seconds to run a load profile for, in single and sharded mode (default: until stopped)")
+    parser.add_argument('--report-interval', type=float, default=5.0,
+                        help="Seconds between throughput reports")
+    parser.add_argument('--batch-size', type=int, default=5000,
+                        help="Maximum records loaded per flush")
+    parser.add_argument('--batch-interval', type=float, default=2.0,
+                        help="Maximum seconds a record is buffered before a flush")
+    parser.add_argument('--loaders', type=int, default=None,
+                        help="Concurrent loader tasks loading batches while generation continues; "
+                             "0 loads each batch inline (default: 1; shards always load inline)")
+    parser.add_argument('--queue-size', type=int, default=None,
+                        help="Batches waiting to be loaded before generation blocks (default: 4)")
+    parser.add_argument('--flattened', action='store_true',
+                        help="Also write every batch to FLATTENED_MEDICAL_RECORDS with the vital signs "
+                             "as typed columns, so it is as fresh as MEDICAL_RECORDS")
+    parser.add_argument('--max-retries', type=int, default=3,
+                        help="Retries with exponential backoff and jitter before a failed batch is dead-lettered")
+    parser.add_argument('--dead-letter-dir', default=None,
+                        help="Append failed batches to a local spool here and replay them once loads "
+                             "succeed again, skipping records already loaded (default: drop and count them)")
+    parser.add_argument('--spool-dir', default=None,
+                        help="Spool batches to Parquet files in this directory and load them "
+                             "with one PUT/COPY INTO per rotation instead of write_pandas")
+    parser.add_argument('--spool-max-mb', type=float, default=64,
+                        help="Size of pending Parquet files that triggers a rotation")
+    args = parser.parse_args(argv)
+    if args.target_rps is not None:
+        if args.profile:
+            parser.error("--target-rps and --profile are mutually exclusive")
+        args.profile = f"constant:{args.target_rps}"
+    if args.profile:
+        try:
+            parse_profile(args.profile)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.duration is not None and not args.profile:
+        parser.error("--duration requires --profile or --target-rps")
+    if args.workers > 1 and (args.loaders is not None or args.queue_size is not None):
+        parser.error("--loaders and --queue-size only apply with --workers 1; shards load their batches inline")
+    args.loaders = 1 if args.loaders is None else args.loaders
+    args.queue_size = 4 if args.queue_size is None else args.queue_size
+    return args
+
+async def main(generation_interval: float = 10,
+               pause_interval: int = 60,
+               batch_size: int = 5000,
+               batch_interval: float = 2.0,
+               records_per_tick: int = 1,
+               sink_name: str = 'snowflake',
+               sink_path: Optional[str] = None,
+               spool_dir: Optional[str] = None,
+               spool_max_mb: float = 64,
+               profile_spec: Optional[str] = None,
+               chunk_size: int = 5000,
+               report_interval: float = 5.0,
+               duration: Optional[float] = None,
+               num_loaders: int = 1,
+               queue_size: int = 4,
+               max_retries: int = 3,
+               dead_letter_dir: Optional[str] = None,
+               flattened: bool = False):
     """
     Main async function to set up and run medical record generation.
+    
+    Args:
+        generation_interval (float): Seconds between each record generation
+        pause_interval (int): Seconds to pause after each minute of generation
+        batch_size (int): Maximum number of records loaded per flush
+        batch_interval (float): Maximum seconds a record is buffered before a flush
+        records_per_tick (int): Records generated per interval
+        sink_name (str): Sink the records are written to
+        sink_path (Optional[str]): Database file or directory for local sinks
+        spool_dir (Optional[str]): Parquet spool directory, if spooling is enabled
+        spool_max_mb (float): Size of pending Parquet files that triggers a load
+        profile_spec (Optional[str]): Load profile to generate at instead of the
+            fixed interval cycle, see parse_profile
+        chunk_size (int): Maximum records generated at once under a load profile
+        report_interval (float): Seconds between target vs. achieved reports
+        duration (Optional[float]): Seconds to run a load profile for
+        num_loaders (int): Concurrent loader tasks; 0 loads each batch inline
+        queue_size (int): Maximum batches waiting to be loaded before generation blocks
+        max_retries (int): Retries with backoff before a batch is dead-lettered
+        dead_letter_dir (Optional[str]): Dead-letter spool for batches that still fail
+        flattened (bool): Whether batches are also written to FLATTENED_MEDICAL_RECORDS
     """
     try:
-        # Create Snowflake connection
-        conn = create_snowflake_connection()
-        print("Connected to Snowflake successfully")
+        # Create the sink (and its Snowflake connection)
+        sink = create_sink(sink_name, sink_path=sink_path, spool_dir=spool_dir, spool_max_mb=spool_max_mb,
+                           max_retries=max_retries, dead_letter_dir=dead_letter_dir, flattened=flattened)
         
         # Create table if it doesn't exist
-        create_medical_table(conn)
+        sink.create_table()
         print("Medical records table ready")
         
+        batcher = MedicalRecordBatcher(sink, batch_size=batch_size, batch_interval=batch_interval)
+        pipeline = LoadPipeline(batcher, num_loaders=num_loaders, queue_size=queue_size)
+        
         # Set up termination handling
         def sigint_handler(signum, frame):
-            handle_termination(conn)
+            handle_termination(sink, batcher, pipeline)
         
         signal.signal(signal.SIGINT, sigint_handler)
         
         print("\nMedical Records Generation Started. Press Ctrl+C to stop.")
         
         # Start continuous generation
-        await continuous_data_generation(conn)
-        
+        if profile_spec:
+            await profiled_data_generation(sink,
+                                           parse_profile(profile_spec),
+                                           batcher=batcher,
+                                           chunk_size=chunk_size,
+                                           report_interval=report_interval,
+                                           duration=duration,
+                                           pipeline=pipeline)
+        else:
+            await continuous_data_generation(sink,
+                                             generation_interval=generation_interval,
+                                             pause_interval=pause_interval,
+                                             batcher=batcher,
+                                             records_per_tick=records_per_tick,
+                                             pipeline=pipeline)
+    
     except Exception as e:
         print(f"An error occurred in main: {e}")
     finally:
-        if 'conn' in locals():
-            conn.close()
+        if 'pipeline' in locals():
+            await pipeline.close()
+        if 'sink' in locals():
+            sink.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    args = parse_args()
+    if args.workers > 1:
+        run_sharded_producer(args.workers,
+                             seed=args.seed,
+                             chunk_size=args.chunk_size,
+                             batch_size=args.batch_size,
+                             batch_interval=args.batch_interval,
+                             generation_interval=args.generation_interval or 0,
+                             report_interval=args.report_interval,
+                             sink_name=args.sink,
+                             sink_path=args.sink_path,
+                             spool_dir=args.spool_dir,
+                             spool_max_mb=args.spool_max_mb,
+                             profile_spec=args.profile,
+                             max_retries=args.max_retries,
+                             dead_letter_dir=args.dead_letter_dir,
+                             flattened=args.flattened,
+                             duration=args.duration)
+    else:
+        generation_interval = 10 if args.generation_interval is None else args.generation_interval
+        asyncio.run(main(generation_interval=generation_interval,
+                         pause_interval=args.pause_interval,
+                         batch_size=args.batch_size,
+                         batch_interval=args.batch_interval,
+                         records_per_tick=args.records_per_tick,
+                         sink_name=args.sink,
+                         sink_path=args.sink_path,
+                         spool_dir=args.spool_dir,
+                         spool_max_mb=args.spool_max_mb,
+                         profile_spec=args.profile,
+                         chunk_size=args.chunk_size,
+                         report_interval=args.report_interval,
+                         duration=args.duration,
+                         num_loaders=args.loaders,
+                         queue_size=args.queue_size,
+                         max_retries=args.max_retries,
+                         dead_letter_dir=args.dead_letter_dir,
+                         flattened=args.flattened))
\ No newline at end of file
@@ -0,0 +1,295 @@
+import os
+import random
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from producer_utilities.parquet_spool import MEDICAL_RECORDS_ARROW_SCHEMA
+from producer_utilities.flattened_table import FLATTENED_MEDICAL_RECORDS_TABLE
+from producer_utilities.sinks import MEDICAL_RECORDS_TABLE, RecordSink
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter between write attempts.
+
+    Args:
+        max_retries (int): Retries after the first failed attempt
+        base_delay (float): Upper bound of the first backoff in seconds
+        max_delay (float): Upper bound of any backoff in seconds
+    """
+
+    def __init__(self, max_retries: int = 3, base_delay: float = 0.5, max_delay: float = 30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, retry: int) -> float:
+        """
+        Returns the backoff before a retry.
+
+        Args:
+            retry (int): Zero-based index of the retry
+
+        Returns:
+            float: Seconds to wait, drawn uniformly up to the exponential bound
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+
+class DeadLetterSpool:
+    """
+    Append-only local spool for batches that could not be loaded.
+
+    Every failed batch becomes one immutable Parquet segment, written to a
+    temporary name and renamed into place, so a crash never leaves a torn
+    segment. Segments are only removed once they have been replayed.
+
+    Args:
+        spool_dir (str): Directory holding the segments
+        schema (pa.Schema): Arrow schema the segments are written with
+    """
+
+    def __init__(self, spool_dir: str, schema: pa.Schema = MEDICAL_RECORDS_ARROW_SCHEMA):
+        self.spool_dir = Path(spool_dir)
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self.schema = schema
+        for temp_path in self.spool_dir.glob('*.tmp'):
+            temp_path.unlink()
+
+    def append(self, df: pd.DataFrame) -> Path:
+        """
+        Persists a batch as a new segment.
+
+        Args:
+            df (pd.DataFrame): Medical records with vital_signs as dictionaries
+
+        Returns:
+            Path: The segment written
+        """
+        table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        file_name = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+        temp_path = self.spool_dir / f"{file_name}.tmp"
+        pq.write_table(table, temp_path, compression='snappy')
+        os.replace(temp_path, self.spool_dir / file_name)
+        return self.spool_dir / file_name
+
+    def segments(self):
+        """
+        Returns the spooled segments, oldest first.
+        """
+        return sorted(self.spool_dir.glob('*.parquet'))
+
+    def read(self, segment: Path) -> pd.DataFrame:
+        """
+        Reads a segment back into the record batch layout.
+
+        Args:
+            segment (Path): Segment returned by segments()
+
+        Returns:
+            pd.DataFrame: Medical records with vital_signs as dictionaries
+        """
+        return pq.read_table(segment, schema=self.schema).to_pandas()
+
+    def remove(self, segment: Path):
+        """
+        Deletes a segment once it has been replayed.
+        """
+        segment.unlink(missing_ok=True)
+
+    def __len__(self):
+        return len(self.segments())
+
+
+class RetryingSink(RecordSink):
+    """
+    Wraps a sink with retries and a dead-letter spool so failed writes aren't lost.
+
+    A failed write is retried with exponential backoff and jitter. Before every
+    retry, rows whose record_id the sink already holds are removed, since a
+    write can fail after it was committed; flattened sinks look up
+    MEDICAL_RECORDS and FLATTENED_MEDICAL_RECORDS separately, since a write can
+    fail between the two. Batches that still fail are appended to the
+    dead-letter spool, and after the next successful write the spooled segments
+    are replayed with the same record_id checks, so replaying never loads a
+    record into either table twice. Without a spool, such batches are dropped
+    and counted. The backoff sleeps the calling thread, so callers on an event
+    loop run writes in a worker thread.
+
+    Args:
+        sink (RecordSink): Sink the batches are written to
+        policy (RetryPolicy): Backoff between attempts
+        dead_letter_dir (Optional[str]): Dead-letter spool directory
+        replay_interval (float): Minimum seconds between replays of the spool
+    """
+
+    def __init__(self, sink: RecordSink, policy: Optional[RetryPolicy] = None,
+                 dead_letter_dir: Optional[str] = None, replay_interval: float = 30.0):
+        self.sink = sink
+        self.name = sink.name
+        self.concurrent_writes = sink.concurrent_writes
+        self.flattened = sink.flattened
+        self.policy = policy or RetryPolicy()
+        self.dead_letters = DeadLetterSpool(dead_letter_dir) if dead_letter_dir else None
+        self.replay_interval = replay_interval
+        self._last_replay = 0.0
+        self._replay_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self.retried_rows = 0
+        self.failed_rows = 0
+        self.dropped_rows = 0
+        self.replayed_rows = 0
+        self.duplicate_rows = 0
+
+    def _count(self, counter: str, rows: int):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + rows)
+
+    def create_table(self):
+        self.sink.create_table()
+        if self.dead_letters is not None and len(self.dead_letters):
+            print(f"Replaying {len(self.dead_letters)} dead-letter segments from {self.dead_letters.spool_dir}")
+            self.replay()
+
+    def _without_loaded_records(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
+        # The records MEDICAL_RECORDS is missing, and for flattened sinks the ones
+        # FLATTENED_MEDICAL_RECORDS is missing
+        loaded_ids = self.sink.existing_record_ids(df['record_id'])
+        remaining = df[~df['record_id'].isin(loaded_ids)] if loaded_ids else df
+        self._count('duplicate_rows', len(df) - len(remaining))
+        if not self.flattened:
+            return remaining, None
+        flattened_ids = self.sink.existing_record_ids(df['record_id'], FLATTENED_MEDICAL_RECORDS_TABLE)
+        return remaining, df[~df['record_id'].isin(flattened_ids)] if flattened_ids else df
+
+    def _write_with_retries(self, df: pd.DataFrame, flattened_records: Optional[pd.DataFrame] = None) -> int:
+        try:
+            return self.sink.write(df, flattened_records)
+        except Exception as e:
+            error = e
+
+        for retry in range(self.policy.max_retries):
+            delay = self.policy.delay(retry)
+            print(f"Error inserting batch of {len(df)} records into {self.name}: {error}. "
+                  f"Retry {retry + 1}/{self.policy.max_retries} in {delay:.2f}s")
+            time.sleep(delay)
+            self._count('retried_rows', len(df))
+            try:
+                # Checked against the whole batch: a record can be in one table only
+                remaining, missing_flattened = self._without_loaded_records(df)
+                # Rows a failed attempt already committed count as loaded
+                return len(df) - len(remaining) + self.sink.write(remaining, missing_flattened)
+            except Exception as e:
+                error = e
+        raise error
+
+    def write(self, df: pd.DataFrame, flattened_records: Optional[pd.DataFrame] = None) -> int:
+        if df.empty:
+            return 0
+        try:
+            nrows = self._write_with_retries(df, flattened_records)
+        except Exception as e:
+            self._dead_letter(df, e)
+            return 0
+        self.replay_if_due()
+        return nrows
+
+    def _dead_letter(self, df: pd.DataFrame, error: Exception):
+        if self.dead_letters is None:
+            self._count('dropped_rows', len(df))
+            print(f"Dropped batch of {len(df)} records after {self.policy.max_retries} retries: {error}")
+            return
+        try:
+            segment = self.dead_letters.append(df)
+        except Exception as spool_error:
+            self._count('dropped_rows', len(df))
+            print(f"Dropped batch of {len(df)} records, dead-letter spool failed: {spool_error}")
+            return
+        self._count('failed_rows', len(df))
+        print(f"Spooled batch of {len(df)} records to {segment} after "
+              f"{self.policy.max_retries} retries: {error}")
+
+    def replay_if_due(self) -> int:
+        """
+        Replays the dead-letter spool if it holds segments and `replay_interval` has passed.
+
+        Returns:
+            int: Number of rows replayed
+        """
+        if self.dead_letters is None or time.monotonic() - self._last_replay < self.replay_interval:
+            return 0
+        return self.replay()
+
+    def replay(self) -> int:
+        """
+        Loads every dead-letter segment, skipping records the sink already holds.
+        Stops at the first segment that fails so the rest are retried later.
+
+        Returns:
+            int: Number of rows replayed
+        """
+        if self.dead_letters is None or not self._replay_lock.acquire(blocking=False):
+            return 0
+        rows = 0
+        try:
+            self._last_replay = time.monotonic()
+            for segment in self.dead_letters.segments():
+                df = self.dead_letters.read(segment).drop_duplicates('record_id')
+                try:
+                    remaining, missing_flattened = self._without_loaded_records(df)
+                    nrows = self.sink.write(remaining, missing_flattened)
+                except Exception as e:
+                    print(f"Replay of {segment.name} failed, will retry: {e}")
+                    break
+                self.dead_letters.remove(segment)
+                rows += nrows
+            self._count('replayed_rows', rows)
+        finally:
+            self._replay_lock.release()
+        return rows
+
+    def existing_record_ids(self, record_ids, table_name: str = MEDICAL_RECORDS_TABLE):
+        return self.sink.existing_record_ids(record_ids, table_name)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the retry and dead-letter counters.
+
+        Returns:
+            Dict[str, Any]: Rows retried, spooled after failing, dropped, replayed
+                and skipped as already loaded, plus the segments still spooled
+        """
+        return {
+            'retried_rows': self.retried_rows,
+            'failed_rows': self.failed_rows,
+            'dropped_rows': self.dropped_rows,
+            'replayed_rows': self.replayed_rows,
+            'duplicate_rows': self.duplicate_rows,
+            'spooled_segments': len(self.dead_letters) if self.dead_letters is not None else 0,
+        }
+
+    def format_stats(self) -> str:
+        """
+        Formats the counters for the producer reports.
+
+        Returns:
+            str: One line summary of the counters
+        """
+        stats = self.stats()
+        return (f"retried {stats['retried_rows']} rows, {stats['failed_rows']} failed to the "
+                f"dead-letter spool, {stats['dropped_rows']} dropped, {stats['replayed_rows']} replayed, "
+                f"{stats['duplicate_rows']} already loaded, {stats['spooled_segments']} segments pending")
+
+    def close(self):
+        if self.dead_letters is not None and len(self.dead_letters):
+            self.replay()
+        print(f"{self.name} sink: {self.format_stats()}")
+        self.sink.close()
@@ -0,0 +1,221 @@
+import argparse
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+
+from producer_utilities.parquet_spool import MEDICAL_RECORDS_ARROW_SCHEMA, VITAL_SIGNS_TYPE
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+
+FLATTENED_MEDICAL_RECORDS_TABLE = 'FLATTENED_MEDICAL_RECORDS'
+
+VITAL_SIGN_COLUMNS = ['heart_rate', 'blood_pressure', 'temperature', 'respiratory_rate', 'oxygen_saturation']
+
+# Column order of FLATTENED_MEDICAL_RECORDS, see SQL_Scripts/create_flattened_table.txt
+FLATTENED_MEDICAL_RECORDS_COLUMNS = ['record_id'] + VITAL_SIGN_COLUMNS + [
+    'created_at', 'patient_id', 'patient_name', 'date_of_birth', 'age', 'gender',
+    'blood_type', 'diagnosis', 'treatment_plan', 'medication', 'allergies',
+    'insurance_provider', 'insurance_id', 'attending_physician', 'department',
+    'admission_date', 'discharge_date', 'last_updated_at',
+]
+
+FLATTENED_MEDICAL_RECORDS_ARROW_SCHEMA = pa.schema(
+    [MEDICAL_RECORDS_ARROW_SCHEMA.field('record_id')]
+    + [VITAL_SIGNS_TYPE.field(column) for column in VITAL_SIGN_COLUMNS]
+    + [MEDICAL_RECORDS_ARROW_SCHEMA.field(column) for column in FLATTENED_MEDICAL_RECORDS_COLUMNS[len(VITAL_SIGN_COLUMNS) + 1:]]
+)
+
+SNOWFLAKE_FLATTENED_MEDICAL_RECORDS_DDL = """
+    CREATE TABLE IF NOT EXISTS FLATTENED_MEDICAL_RECORDS (
+        record_id VARCHAR(36),
+        heart_rate INTEGER,
+        blood_pressure VARCHAR,
+        temperature FLOAT,
+        respiratory_rate INTEGER,
+        oxygen_saturation INTEGER,
+        created_at TIMESTAMP_NTZ,
+        patient_id VARCHAR(36),
+        patient_name VARCHAR(100),
+        date_of_birth DATE,
+        age INTEGER,
+        gender VARCHAR(20),
+        blood_type VARCHAR(5),
+        diagnosis VARCHAR(200),
+        treatment_plan TEXT,
+        medication VARCHAR(500),
+        allergies VARCHAR(500),
+        insurance_provider VARCHAR(100),
+        insurance_id VARCHAR(50),
+        attending_physician VARCHAR(100),
+        department VARCHAR(50),
+        admission_date TIMESTAMP_NTZ,
+        discharge_date TIMESTAMP_NTZ,
+        last_updated_at TIMESTAMP_NTZ
+    )
+"""
+
+SQLITE_FLATTENED_MEDICAL_RECORDS_DDL = """
+    CREATE TABLE IF NOT EXISTS FLATTENED_MEDICAL_RECORDS (
+        record_id TEXT,
+        heart_rate INTEGER,
+        blood_pressure TEXT,
+        temperature REAL,
+        respiratory_rate INTEGER,
+        oxygen_saturation INTEGER,
+        created_at TEXT,
+        patient_id TEXT,
+        patient_name TEXT,
+        date_of_birth TEXT,
+        age INTEGER,
+        gender TEXT,
+        blood_type TEXT,
+        diagnosis TEXT,
+        treatment_plan TEXT,
+        medication TEXT,
+        allergies TEXT,
+        insurance_provider TEXT,
+        insurance_id TEXT,
+        attending_physician TEXT,
+        department TEXT,
+        admission_date TEXT,
+        discharge_date TEXT,
+        last_updated_at TEXT
+    )
+"""
+
+DUCKDB_FLATTENED_MEDICAL_RECORDS_DDL = """
+    CREATE TABLE IF NOT EXISTS FLATTENED_MEDICAL_RECORDS (
+        record_id VARCHAR,
+        heart_rate INTEGER,
+        blood_pressure VARCHAR,
+        temperature DOUBLE,
+        respiratory_rate INTEGER,
+        oxygen_saturation INTEGER,
+        created_at TIMESTAMP,
+        patient_id VARCHAR,
+        patient_name VARCHAR,
+        date_of_birth DATE,
+        age INTEGER,
+        gender VARCHAR,
+        blood_type VARCHAR,
+        diagnosis VARCHAR,
+        treatment_plan VARCHAR,
+        medication VARCHAR,
+        allergies VARCHAR,
+        insurance_provider VARCHAR,
+        insurance_id VARCHAR,
+        attending_physician VARCHAR,
+        department VARCHAR,
+        admission_date TIMESTAMP,
+        discharge_date TIMESTAMP,
+        last_updated_at TIMESTAMP
+    )
+"""
+
+# DuckDB stand-in for the MERGE in SQL_Scripts/update_flattened_table_procedure.txt;
+# the DuckDB sink stores vital_signs as JSON text. DuckDB has no streams, so new rows
+# are found by record_id rather than by last_updated_at, which is when a record was
+# generated, not when it was loaded: dead-letter replays, recovered spools and lagging
+# shards load rows older than the watermark. The watermark only picks up updates.
+DUCKDB_FLATTENED_MERGE_SQL = f"""
+    MERGE INTO FLATTENED_MEDICAL_RECORDS AS target
+    USING (
+        SELECT
+            record_id,
+            json_extract_string(vital_signs, '$.heart_rate')::INTEGER AS heart_rate,
+            json_extract_string(vital_signs, '$.blood_pressure') AS blood_pressure,
+            json_extract_string(vital_signs, '$.temperature')::DOUBLE AS temperature,
+            json_extract_string(vital_signs, '$.respiratory_rate')::INTEGER AS respiratory_rate,
+            json_extract_string(vital_signs, '$.oxygen_saturation')::INTEGER AS oxygen_saturation,
+            {', '.join(FLATTENED_MEDICAL_RECORDS_COLUMNS[len(VITAL_SIGN_COLUMNS) + 1:])}
+        FROM MEDICAL_RECORDS AS records
+        WHERE last_updated_at >= ?
+            OR NOT EXISTS (SELECT 1 FROM FLATTENED_MEDICAL_RECORDS AS flattened
+                           WHERE flattened.record_id = records.record_id)
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY record_id ORDER BY last_updated_at DESC) = 1
+    ) AS source
+    ON target.record_id = source.record_id
+    WHEN MATCHED AND source.last_updated_at > target.last_updated_at THEN UPDATE SET
+        {', '.join(f'{column} = source.{column}' for column in FLATTENED_MEDICAL_RECORDS_COLUMNS[1:])}
+    WHEN NOT MATCHED THEN INSERT ({', '.join(FLATTENED_MEDICAL_RECORDS_COLUMNS)})
+        VALUES ({', '.join(f'source.{column}' for column in FLATTENED_MEDICAL_RECORDS_COLUMNS)})
+"""
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def flatten_records(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Expands vital_signs into typed columns in the FLATTENED_MEDICAL_RECORDS layout.
+
+    Args:
+        df (pd.DataFrame): Medical records with vital_signs as dictionaries
+
+    Returns:
+        pd.DataFrame: One row per record with heart_rate, blood_pressure,
+            temperature, respiratory_rate and oxygen_saturation columns
+    """
+    vital_signs = pd.DataFrame(df['vital_signs'].tolist(), index=df.index, columns=VITAL_SIGN_COLUMNS)
+    vital_signs = vital_signs.astype({
+        'heart_rate': 'int32',
+        'temperature': 'float64',
+        'respiratory_rate': 'int32',
+        'oxygen_saturation': 'int32',
+    })
+    return pd.concat([df.drop(columns='vital_signs'), vital_signs], axis=1)[FLATTENED_MEDICAL_RECORDS_COLUMNS]
+
+
+def flattened_watermark(conn) -> datetime:
+    """
+    Returns the newest last_updated_at already in FLATTENED_MEDICAL_RECORDS.
+
+    Args:
+        conn: DuckDB connection
+
+    Returns:
+        datetime: The watermark, or the Unix epoch if the table is empty
+    """
+    watermark = conn.execute(f"SELECT MAX(last_updated_at) FROM {FLATTENED_MEDICAL_RECORDS_TABLE}").fetchone()[0]
+    return watermark or EPOCH
+
+
+def refresh_flattened_table(conn) -> Tuple[datetime, int]:
+    """
+    Incrementally refreshes FLATTENED_MEDICAL_RECORDS from MEDICAL_RECORDS in DuckDB.
+
+    Merges the records missing from FLATTENED_MEDICAL_RECORDS, whatever their
+    last_updated_at, and the ones updated since the watermark, so the
+    UPDATE_FLATTENED_TABLE procedure can be exercised against a local stand-in
+    such as the database written by the producer's duckdb sink.
+
+    Args:
+        conn: DuckDB connection holding MEDICAL_RECORDS
+
+    Returns:
+        Tuple[datetime, int]: The watermark used and the number of rows merged
+    """
+    conn.execute(DUCKDB_FLATTENED_MEDICAL_RECORDS_DDL)
+    watermark = flattened_watermark(conn)
+    rows_merged = conn.execute(DUCKDB_FLATTENED_MERGE_SQL, [watermark]).fetchone()[0]
+    return watermark, rows_merged
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Incrementally refresh FLATTENED_MEDICAL_RECORDS in a local DuckDB database.")
+    parser.add_argument('database', help="DuckDB file written by the producer's duckdb sink")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if duckdb is None:
+        raise SystemExit("The flattened table refresh requires the duckdb package: pip install duckdb")
+    with duckdb.connect(args.database) as conn:
+        watermark, rows_merged = refresh_flattened_table(conn)
+    print(f"FLATTENED_MEDICAL_RECORDS merged {rows_merged} new rows and rows updated since {watermark}")
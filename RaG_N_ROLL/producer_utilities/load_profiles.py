@@ -0,0 +1,362 @@
+import math
+import time
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+
+# Relative hospital admissions per hour of the day (0 = midnight), peaking late
+# morning with a smaller emergency-department peak in the early evening
+HOURLY_ADMISSION_WEIGHTS = [
+    0.35, 0.28, 0.22, 0.18, 0.15, 0.17, 0.25, 0.45,
+    0.70, 0.90, 1.00, 0.98, 0.92, 0.90, 0.88, 0.85,
+    0.82, 0.80, 0.82, 0.78, 0.70, 0.60, 0.50, 0.42,
+]
+
+
+def _check_rate(name: str, value: float):
+    # Written as `not >=` so NaN is rejected too
+    if not value >= 0:
+        raise ValueError(f"{name} must be >= 0, got {value:g}")
+
+
+def _check_seconds(name: str, value: float):
+    if not value > 0:
+        raise ValueError(f"{name} must be > 0, got {value:g}")
+
+
+class LoadProfile:
+    """
+    Target records-per-second as a function of seconds since the run started.
+    """
+
+    def rate_at(self, elapsed: float) -> float:
+        """
+        Returns the target rate at a point in the run.
+
+        Args:
+            elapsed (float): Seconds since the run started
+
+        Returns:
+            float: Target records per second
+        """
+        raise NotImplementedError
+
+    def scaled(self, factor: float) -> 'ScaledProfile':
+        """
+        Returns this profile with every rate multiplied by `factor`, e.g. to
+        split a target rate across sharded workers.
+        """
+        return ScaledProfile(self, factor)
+
+
+class ConstantProfile(LoadProfile):
+    """
+    A fixed target rate.
+
+    Args:
+        rate (float): Records per second
+    """
+
+    def __init__(self, rate: float):
+        _check_rate("rate", rate)
+        self.rate = rate
+
+    def rate_at(self, elapsed: float) -> float:
+        return self.rate
+
+    def __repr__(self):
+        return f"constant {self.rate:g}/s"
+
+
+class StepProfile(LoadProfile):
+    """
+    A sequence of (duration, rate) steps, repeated once the last step ends.
+
+    Args:
+        steps (List[Tuple[float, float]]): Step durations in seconds and their rates
+    """
+
+    def __init__(self, steps: List[Tuple[float, float]]):
+        if not steps:
+            raise ValueError("A step profile needs at least one step")
+        for duration, rate in steps:
+            _check_seconds("step duration", duration)
+            _check_rate("step rate", rate)
+        self.steps = steps
+        self.period = sum(duration for duration, _ in steps)
+
+    def rate_at(self, elapsed: float) -> float:
+        position = elapsed % self.period
+        for duration, rate in self.steps:
+            if position < duration:
+                return rate
+            position -= duration
+        return self.steps[-1][1]
+
+    def __repr__(self):
+        return "steps " + ", ".join(f"{duration:g}s@{rate:g}/s" for duration, rate in self.steps)
+
+
+class BurstProfile(LoadProfile):
+    """
+    A base rate with a burst of `burst_rate` for `burst_seconds` every `every_seconds`.
+
+    Args:
+        base_rate (float): Records per second between bursts
+        burst_rate (float): Records per second during a burst
+        every_seconds (float): Seconds from the start of one burst to the next
+        burst_seconds (float): Length of each burst in seconds
+    """
+
+    def __init__(self, base_rate: float, burst_rate: float, every_seconds: float, burst_seconds: float):
+        _check_rate("base rate", base_rate)
+        _check_rate("burst rate", burst_rate)
+        _check_seconds("burst period", every_seconds)
+        _check_seconds("burst duration", burst_seconds)
+        self.base_rate = base_rate
+        self.burst_rate = burst_rate
+        self.every_seconds = every_seconds
+        self.burst_seconds = burst_seconds
+
+    def rate_at(self, elapsed: float) -> float:
+        if elapsed % self.every_seconds < self.burst_seconds:
+            return self.burst_rate
+        return self.base_rate
+
+    def __repr__(self):
+        return (f"bursts of {self.burst_rate:g}/s for {self.burst_seconds:g}s every "
+                f"{self.every_seconds:g}s over {self.base_rate:g}/s")
+
+
+class DiurnalProfile(LoadProfile):
+    """
+    A 24 hour hospital admissions curve between `trough_rate` and `peak_rate`.
+
+    The hourly weights in HOURLY_ADMISSION_WEIGHTS are interpolated linearly.
+    `period_seconds` compresses the day, e.g. 3600 replays a full day every hour.
+
+    Args:
+        peak_rate (float): Records per second at the busiest hour
+        trough_rate (float): Records per second at the quietest hour
+        period_seconds (float): Length of one simulated day in seconds
+        start_hour (Optional[float]): Simulated hour the run starts at; defaults to
+            the current local time for a real-time day and midnight otherwise
+    """
+
+    def __init__(self, peak_rate: float, trough_rate: float = 0.0,
+                 period_seconds: float = 86400, start_hour: Optional[float] = None):
+        _check_rate("peak rate", peak_rate)
+        _check_rate("trough rate", trough_rate)
+        _check_seconds("period", period_seconds)
+        if trough_rate > peak_rate:
+            raise ValueError(f"trough rate {trough_rate:g} is above peak rate {peak_rate:g}")
+        self.peak_rate = peak_rate
+        self.trough_rate = trough_rate
+        self.period_seconds = period_seconds
+        if start_hour is None:
+            now = datetime.now()
+            start_hour = now.hour + now.minute / 60 if period_seconds == 86400 else 0.0
+        self.start_hour = start_hour
+        lowest, highest = min(HOURLY_ADMISSION_WEIGHTS), max(HOURLY_ADMISSION_WEIGHTS)
+        self._weights = [(weight - lowest) / (highest - lowest) for weight in HOURLY_ADMISSION_WEIGHTS]
+
+    def rate_at(self, elapsed: float) -> float:
+        hour = (self.start_hour + 24 * elapsed / self.period_seconds) % 24
+        index = int(hour)
+        fraction = hour - index
+        weight = self._weights[index] * (1 - fraction) + self._weights[(index + 1) % 24] * fraction
+        return self.trough_rate + (self.peak_rate - self.trough_rate) * weight
+
+    def __repr__(self):
+        return (f"diurnal {self.trough_rate:g}-{self.peak_rate:g}/s over "
+                f"{self.period_seconds:g}s from hour {self.start_hour:.1f}")
+
+
+class ScaledProfile(LoadProfile):
+    """
+    Another profile with every rate multiplied by a constant factor.
+    """
+
+    def __init__(self, profile: LoadProfile, factor: float):
+        self.profile = profile
+        self.factor = factor
+
+    def rate_at(self, elapsed: float) -> float:
+        return self.profile.rate_at(elapsed) * self.factor
+
+    def __repr__(self):
+        return f"{self.profile!r} x {self.factor:g}"
+
+
+def parse_profile(spec: str) -> LoadProfile:
+    """
+    Parses a load profile from its command line form.
+
+    Supported forms:
+        constant:<rate>
+        step:<seconds>x<rate>,<seconds>x<rate>,...
+        burst:<base_rate>,<burst_rate>,<every_seconds>,<burst_seconds>
+        diurnal:<peak_rate>[,<trough_rate>[,<period_seconds>]]
+
+    Args:
+        spec (str): Profile specification, e.g. 'step:60x100,60x5000'
+
+    Returns:
+        LoadProfile: The parsed profile
+
+    Raises:
+        ValueError: If the specification cannot be parsed, or has a negative rate
+            or a duration or period that isn't positive
+    """
+    kind, _, arguments = spec.partition(':')
+    kind = kind.strip().lower()
+    try:
+        if kind == 'constant':
+            return ConstantProfile(float(arguments))
+        if kind == 'step':
+            steps = []
+            for step in arguments.split(','):
+                duration, rate = step.lower().split('x')
+                steps.append((float(duration), float(rate)))
+            return StepProfile(steps)
+        if kind == 'burst':
+            base_rate, burst_rate, every_seconds, burst_seconds = (float(value) for value in arguments.split(','))
+            return BurstProfile(base_rate, burst_rate, every_seconds, burst_seconds)
+        if kind == 'diurnal':
+            values = [float(value) for value in arguments.split(',')]
+            return DiurnalProfile(*values)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid load profile '{spec}': {e}")
+    raise ValueError(f"Unknown load profile '{kind}', expected constant, step, burst or diurnal")
+
+
+class RateScheduler:
+    """
+    Token-bucket scheduler that turns a load profile into batch sizes.
+
+    Tokens accrue continuously at the profile's current rate, so time spent
+    generating or loading a batch is paid back on the next call to `due()`.
+    The bucket holds at most `max_burst_seconds` worth of tokens, which bounds
+    how much is caught up after a stall.
+
+    Args:
+        profile (LoadProfile): Target rate over time
+        max_burst_seconds (float): Seconds of tokens the bucket can hold
+        clock (Callable[[], float]): Monotonic clock, replaceable for testing
+    """
+
+    def __init__(self, profile: LoadProfile, max_burst_seconds: float = 2.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.profile = profile
+        self.max_burst_seconds = max_burst_seconds
+        self.clock = clock
+        self.start_time = clock()
+        self._last_refill = self.start_time
+        self._tokens = 0.0
+        self.target_records = 0.0
+        self.issued_records = 0
+
+    @property
+    def elapsed(self) -> float:
+        return self.clock() - self.start_time
+
+    def refill(self):
+        """
+        Accrues the tokens, and target records, for the time since the last refill.
+        """
+        now = self.clock()
+        if now <= self._last_refill:
+            return
+        # Trapezoidal integration of the profile over the refill interval
+        start, end = self._last_refill - self.start_time, now - self.start_time
+        accrued = (self.profile.rate_at(start) + self.profile.rate_at(end)) / 2 * (end - start)
+        self.target_records += accrued
+        capacity = max(1.0, self.profile.rate_at(end) * self.max_burst_seconds)
+        self._tokens = min(self._tokens + accrued, capacity)
+        self._last_refill = now
+
+    def due(self, max_records: Optional[int] = None) -> int:
+        """
+        Takes every whole token currently available.
+
+        Args:
+            max_records (Optional[int]): Upper bound on the number of records returned
+
+        Returns:
+            int: Number of records to generate now
+        """
+        self.refill()
+        records = int(self._tokens)
+        if max_records is not None:
+            records = min(records, max_records)
+        self._tokens -= records
+        self.issued_records += records
+        return records
+
+    def seconds_until_due(self, max_wait: float = 0.25) -> float:
+        """
+        Returns how long to wait until at least one token is available.
+
+        Args:
+            max_wait (float): Upper bound on the wait, so rate changes are picked up
+
+        Returns:
+            float: Seconds to wait
+        """
+        self.refill()
+        if self._tokens >= 1:
+            return 0.0
+        rate = self.profile.rate_at(self.elapsed)
+        if rate <= 0:
+            return max_wait
+        return min(max_wait, (1 - self._tokens) / rate)
+
+
+class RateReporter:
+    """
+    Periodically reports target vs. achieved generation and load rates.
+
+    Args:
+        scheduler (RateScheduler): Scheduler whose target is reported
+        report_interval (float): Seconds between reports
+    """
+
+    def __init__(self, scheduler: RateScheduler, report_interval: float = 5.0):
+        self.scheduler = scheduler
+        self.report_interval = report_interval
+        self._last_time = scheduler.clock()
+        self._last_target = 0.0
+        self._last_generated = 0
+        self._last_loaded = 0
+
+    def maybe_report(self, generated_records: int, loaded_records: int) -> Optional[str]:
+        """
+        Prints and returns a report line if `report_interval` has passed.
+
+        Args:
+            generated_records (int): Total records generated so far
+            loaded_records (int): Total records loaded so far
+
+        Returns:
+            Optional[str]: The report line, if one was printed
+        """
+        now = self.scheduler.clock()
+        interval = now - self._last_time
+        if interval < self.report_interval:
+            return None
+
+        self.scheduler.refill()
+        target_rate = (self.scheduler.target_records - self._last_target) / interval
+        generated_rate = (generated_records - self._last_generated) / interval
+        loaded_rate = (loaded_records - self._last_loaded) / interval
+        accuracy = generated_rate / target_rate * 100 if target_rate > 0 else math.nan
+        line = (f"[{self.scheduler.elapsed:8.1f}s] target {target_rate:,.1f}/s, "
+                f"generated {generated_rate:,.1f}/s ({accuracy:.1f}% of target), "
+                f"loaded {loaded_rate:,.1f}/s")
+        print(line)
+
+        self._last_time = now
+        self._last_target = self.scheduler.target_records
+        self._last_generated = generated_records
+        self._last_loaded = loaded_records
+        return line
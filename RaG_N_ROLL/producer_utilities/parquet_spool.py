@@ -0,0 +1,272 @@
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, List
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# vital_signs is written as a nested struct so COPY INTO loads it as an OBJECT
+VITAL_SIGNS_TYPE = pa.struct([
+    ('blood_pressure', pa.string()),
+    ('heart_rate', pa.int32()),
+    ('temperature', pa.float64()),
+    ('respiratory_rate', pa.int32()),
+    ('oxygen_saturation', pa.int32()),
+])
+
+MEDICAL_RECORDS_ARROW_SCHEMA = pa.schema([
+    ('record_id', pa.string()),
+    ('created_at', pa.string()),
+    ('patient_id', pa.string()),
+    ('patient_name', pa.string()),
+    ('date_of_birth', pa.string()),
+    ('age', pa.int32()),
+    ('gender', pa.string()),
+    ('blood_type', pa.string()),
+    ('diagnosis', pa.string()),
+    ('treatment_plan', pa.string()),
+    ('medication', pa.string()),
+    ('allergies', pa.string()),
+    ('vital_signs', VITAL_SIGNS_TYPE),
+    ('insurance_provider', pa.string()),
+    ('insurance_id', pa.string()),
+    ('attending_physician', pa.string()),
+    ('department', pa.string()),
+    ('admission_date', pa.string()),
+    ('discharge_date', pa.string()),
+    ('last_updated_at', pa.string()),
+])
+
+# A loader receives a sealed rotation directory and the Parquet files in it
+# and returns the number of rows it loaded
+RotationLoader = Callable[[Path, List[Path]], int]
+
+
+class SnowflakeCopyLoader:
+    """
+    Loads a sealed spool rotation with one PUT and one COPY INTO.
+
+    Files are uploaded to the table stage under a folder named after the rotation,
+    so replaying a rotation after a crash reuses the same stage path and COPY INTO's
+    load metadata skips files that were already loaded.
+
+    Args:
+        conn: Snowflake connection object
+        table_name (str): Table to copy the rotation into
+        parallel (int): Number of threads PUT uses to upload files
+    """
+
+    def __init__(self, conn, table_name: str = 'MEDICAL_RECORDS', parallel: int = 8):
+        self.conn = conn
+        self.table_name = table_name
+        self.parallel = parallel
+
+    def __call__(self, rotation_dir: Path, files: List[Path]) -> int:
+        stage_path = f"@%{self.table_name}/{rotation_dir.name}/"
+        source = f"file://{rotation_dir.resolve().as_posix()}/*.parquet"
+
+        with self.conn.cursor() as cursor:
+            cursor.execute(
+                f"PUT '{source}' {stage_path} AUTO_COMPRESS = FALSE "
+                f"OVERWRITE = TRUE PARALLEL = {self.parallel}"
+            )
+            cursor.execute(
+                f"COPY INTO {self.table_name} FROM {stage_path} "
+                f"FILE_FORMAT = (TYPE = PARQUET) "
+                f"MATCH_BY_COLUMN_NAME = CASE_INSENSITIVE "
+                f"PURGE = TRUE"
+            )
+            columns = [column[0].lower() for column in cursor.description]
+            if 'rows_loaded' not in columns:
+                # "Copy executed with 0 files processed."
+                return 0
+            rows_loaded = columns.index('rows_loaded')
+            return sum(row[rows_loaded] or 0 for row in cursor.fetchall())
+
+
+class DirectoryLoader:
+    """
+    Stand-in loader that copies sealed rotations into a local directory.
+
+    Lets the spool-and-load path run end to end without Snowflake access.
+
+    Args:
+        target_dir (str): Directory the loaded Parquet files are copied into
+    """
+
+    def __init__(self, target_dir: str):
+        self.target_dir = Path(target_dir)
+        self.target_dir.mkdir(parents=True, exist_ok=True)
+
+    def __call__(self, rotation_dir: Path, files: List[Path]) -> int:
+        rows = 0
+        for file in files:
+            rows += pq.ParquetFile(file).metadata.num_rows
+            shutil.copy2(file, self.target_dir / f"{rotation_dir.name}-{file.name}")
+        return rows
+
+
+class ParquetSpool:
+    """
+    Spools record batches to compressed Parquet files and loads them in rotations.
+
+    Every write produces one complete Parquet file in `<spool_dir>/pending`, written
+    to a temporary name and renamed into place, so a crash never leaves a torn file.
+    Once the pending files reach `max_rotation_bytes` (or the oldest is
+    `max_rotation_seconds` old) they are moved into `<spool_dir>/rotations/<id>` and
+    handed to the loader in one call. A rotation directory is only removed after
+    the loader succeeds; rotations that failed to load are retried at the next
+    rotation and rotations left behind by a crash are replayed by `recover()`.
+
+    Args:
+        spool_dir (str): Local directory holding the spool
+        loader (RotationLoader): Callable that loads a sealed rotation
+        max_rotation_bytes (int): Size of pending files that triggers a rotation
+        max_rotation_seconds (float): Age of the oldest pending file that triggers a rotation
+        compression (str): Parquet compression codec
+        schema (pa.Schema): Arrow schema the batches are written with
+    """
+
+    def __init__(self, spool_dir: str, loader: RotationLoader,
+                 max_rotation_bytes: int = 64 * 1024 * 1024,
+                 max_rotation_seconds: float = 60.0,
+                 compression: str = 'snappy',
+                 schema: pa.Schema = MEDICAL_RECORDS_ARROW_SCHEMA):
+        self.spool_dir = Path(spool_dir)
+        self.pending_dir = self.spool_dir / 'pending'
+        self.rotations_dir = self.spool_dir / 'rotations'
+        self.pending_dir.mkdir(parents=True, exist_ok=True)
+        self.rotations_dir.mkdir(parents=True, exist_ok=True)
+
+        self.loader = loader
+        self.max_rotation_bytes = max_rotation_bytes
+        self.max_rotation_seconds = max_rotation_seconds
+        self.compression = compression
+        self.schema = schema
+
+        self._pending_bytes = sum(path.stat().st_size for path in self.pending_dir.glob('*.parquet'))
+        self._oldest_pending = time.monotonic() if self._pending_bytes else None
+        self.total_rows_spooled = 0
+        self.total_rows_loaded = 0
+        self.total_rotations = 0
+
+    def write(self, df: pd.DataFrame) -> int:
+        """
+        Writes a batch to a new pending Parquet file and rotates if due.
+
+        Args:
+            df (pd.DataFrame): Medical records with vital_signs as dictionaries
+
+        Returns:
+            int: Number of rows spooled
+        """
+        if df.empty:
+            return 0
+
+        table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        file_name = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+        temp_path = self.pending_dir / f"{file_name}.tmp"
+        pq.write_table(table, temp_path, compression=self.compression)
+        os.replace(temp_path, self.pending_dir / file_name)
+
+        if self._oldest_pending is None:
+            self._oldest_pending = time.monotonic()
+        self._pending_bytes += (self.pending_dir / file_name).stat().st_size
+        self.total_rows_spooled += table.num_rows
+
+        try:
+            self.rotate_if_due()
+        except Exception as e:
+            # The batch is safely spooled; its rotation is retried at the next rotation
+            print(f"Error loading spooled rotation, will retry: {e}")
+        return table.num_rows
+
+    def is_due(self) -> bool:
+        """
+        Checks whether the pending files should be sealed into a rotation.
+
+        Returns:
+            bool: True if the pending size or age limit has been reached
+        """
+        if self._oldest_pending is None:
+            return False
+        if self._pending_bytes >= self.max_rotation_bytes:
+            return True
+        return time.monotonic() - self._oldest_pending >= self.max_rotation_seconds
+
+    def rotate_if_due(self) -> int:
+        """
+        Seals and loads a rotation if one is due.
+
+        Returns:
+            int: Number of rows loaded
+        """
+        if self.is_due():
+            return self.rotate()
+        return 0
+
+    def rotate(self) -> int:
+        """
+        Seals every pending file into a new rotation and loads every sealed rotation.
+
+        Returns:
+            int: Number of rows loaded
+        """
+        pending_files = sorted(self.pending_dir.glob('*.parquet'))
+        self._pending_bytes = 0
+        self._oldest_pending = None
+
+        if pending_files:
+            rotation_dir = self.rotations_dir / f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+            rotation_dir.mkdir()
+            for path in pending_files:
+                os.replace(path, rotation_dir / path.name)
+        return self._load_rotations()
+
+    def recover(self) -> int:
+        """
+        Replays rotations left behind by a previous run and drops torn temporary files.
+
+        Returns:
+            int: Number of rows loaded
+        """
+        for temp_path in self.pending_dir.glob('*.tmp'):
+            temp_path.unlink()
+        return self._load_rotations()
+
+    def close(self) -> int:
+        """
+        Seals and loads whatever is still pending.
+
+        Returns:
+            int: Number of rows loaded
+        """
+        return self.rotate()
+
+    def _load_rotations(self) -> int:
+        rows = 0
+        for rotation_dir in sorted(path for path in self.rotations_dir.iterdir() if path.is_dir()):
+            rows += self._load_rotation(rotation_dir)
+        return rows
+
+    def _load_rotation(self, rotation_dir: Path) -> int:
+        files = sorted(rotation_dir.glob('*.parquet'))
+        if not files:
+            rotation_dir.rmdir()
+            return 0
+
+        load_start = time.monotonic()
+        rows = self.loader(rotation_dir, files)
+        load_latency = time.monotonic() - load_start
+
+        # Only forget the rotation once the loader has succeeded
+        shutil.rmtree(rotation_dir)
+        self.total_rows_loaded += rows
+        self.total_rotations += 1
+        print(f"Loaded rotation {rotation_dir.name}: {rows} rows from {len(files)} files in {load_latency:.3f}s")
+        return rows
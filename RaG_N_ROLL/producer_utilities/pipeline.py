@@ -0,0 +1,176 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+
+class LoadPipeline:
+    """
+    Bounded producer/consumer pipeline between record generation and loading.
+
+    Due windows are drained from a MedicalRecordBatcher into a bounded asyncio
+    queue and written by `num_loaders` loader tasks, each running the blocking
+    sink write in a thread pool so generation keeps running while batches load.
+    When the queue is full `submit()` waits, which slows generation down to the
+    rate the sink can absorb instead of buffering without limit.
+
+    With `num_loaders=0` every batch is loaded before generation continues,
+    which is the sequential generate-then-load behaviour; the write still runs
+    in a worker thread so its retry backoff doesn't stall the event loop.
+
+    Args:
+        batcher: MedicalRecordBatcher whose windows are loaded; it must expose
+            is_due(), drain() and write(df)
+        num_loaders (int): Number of concurrent loader tasks
+        queue_size (int): Maximum number of batches waiting to be loaded
+    """
+
+    def __init__(self, batcher, num_loaders: int = 1, queue_size: int = 4):
+        self.batcher = batcher
+        self.num_loaders = num_loaders
+        self.queue_size = queue_size
+        self.queue: Optional[asyncio.Queue] = None
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self._loaders: List[asyncio.Task] = []
+        self._closed = False
+
+        self.submitted_batches = 0
+        self.blocked_submits = 0
+        self.blocked_seconds = 0.0
+        self.max_queue_depth = 0
+        self._queue_depth_total = 0
+        self.loader_busy_seconds = 0.0
+        self._start_time = time.monotonic()
+
+        # Windows are handed to the pipeline instead of being written by add()
+        self.batcher.auto_flush = False
+
+    def start(self):
+        """
+        Starts the loader tasks. Must be called from a running event loop.
+        """
+        if self.num_loaders == 0 or self._loaders:
+            return
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.executor = ThreadPoolExecutor(max_workers=self.num_loaders, thread_name_prefix='loader')
+        self._loaders = [asyncio.create_task(self._load_batches()) for _ in range(self.num_loaders)]
+        self._start_time = time.monotonic()
+
+    async def _load_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            df = await self.queue.get()
+            try:
+                load_start = time.monotonic()
+                await loop.run_in_executor(self.executor, self.batcher.write, df)
+                self.loader_busy_seconds += time.monotonic() - load_start
+            finally:
+                self.queue.task_done()
+
+    async def submit(self, df: pd.DataFrame):
+        """
+        Queues a batch for loading, waiting while the queue is full.
+
+        Args:
+            df (pd.DataFrame): Batch of medical records
+        """
+        if df is None or df.empty:
+            return
+        if self.num_loaders == 0:
+            await asyncio.to_thread(self.batcher.write, df)
+            return
+
+        self.start()
+        if self.queue.full():
+            self.blocked_submits += 1
+            blocked_start = time.monotonic()
+            await self.queue.put(df)
+            self.blocked_seconds += time.monotonic() - blocked_start
+        else:
+            self.queue.put_nowait(df)
+        self.submitted_batches += 1
+        self._queue_depth_total += self.queue.qsize()
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+
+    async def flush_if_due(self):
+        """
+        Submits the batcher's current window if it is due.
+        """
+        if self.batcher.is_due():
+            await self.submit(self.batcher.drain())
+
+    async def flush(self):
+        """
+        Submits the batcher's current window and waits until every queued batch is loaded.
+        """
+        await self.submit(self.batcher.drain())
+        if self.queue is not None:
+            await self.queue.join()
+
+    async def close(self):
+        """
+        Loads everything still buffered or queued and stops the loader tasks.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        await self.flush()
+        for loader in self._loaders:
+            loader.cancel()
+        await asyncio.gather(*self._loaders, return_exceptions=True)
+        self._loaders = []
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+    def close_now(self):
+        """
+        Synchronously finishes in-flight loads and writes queued batches, for use
+        from a signal handler where the event loop can't be awaited.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        while self.queue is not None and not self.queue.empty():
+            self.batcher.write(self.queue.get_nowait())
+            self.queue.task_done()
+        df = self.batcher.drain()
+        if df is not None:
+            self.batcher.write(df)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the pipeline metrics.
+
+        Returns:
+            Dict[str, Any]: Queue depth, time generation spent blocked on a full
+                queue and loader utilisation
+        """
+        elapsed = time.monotonic() - self._start_time
+        capacity = elapsed * self.num_loaders
+        return {
+            'queue_depth': self.queue.qsize() if self.queue is not None else 0,
+            'max_queue_depth': self.max_queue_depth,
+            'mean_queue_depth': self._queue_depth_total / self.submitted_batches if self.submitted_batches else 0.0,
+            'submitted_batches': self.submitted_batches,
+            'blocked_submits': self.blocked_submits,
+            'blocked_seconds': self.blocked_seconds,
+            'loader_utilisation': self.loader_busy_seconds / capacity if capacity > 0 else 0.0,
+        }
+
+    def format_stats(self) -> str:
+        """
+        Formats the pipeline metrics for the producer reports.
+
+        Returns:
+            str: One line summary of the metrics
+        """
+        stats = self.stats()
+        return (f"queue depth {stats['queue_depth']}/{self.queue_size} "
+                f"(mean {stats['mean_queue_depth']:.1f}, max {stats['max_queue_depth']}), "
+                f"blocked {stats['blocked_seconds']:.2f}s on {stats['blocked_submits']} of "
+                f"{stats['submitted_batches']} batches, "
+                f"{self.num_loaders} loaders {stats['loader_utilisation']:.0%} busy")
@@ -0,0 +1,515 @@
+import json
+import os
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set, Type
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from producer_utilities.parquet_spool import (MEDICAL_RECORDS_ARROW_SCHEMA,
+                                              ParquetSpool,
+                                              SnowflakeCopyLoader
+                                              )
+from producer_utilities.flattened_table import (DUCKDB_FLATTENED_MEDICAL_RECORDS_DDL,
+                                                FLATTENED_MEDICAL_RECORDS_ARROW_SCHEMA,
+                                                FLATTENED_MEDICAL_RECORDS_COLUMNS,
+                                                FLATTENED_MEDICAL_RECORDS_TABLE,
+                                                SNOWFLAKE_FLATTENED_MEDICAL_RECORDS_DDL,
+                                                SQLITE_FLATTENED_MEDICAL_RECORDS_DDL,
+                                                flatten_records
+                                                )
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+
+MEDICAL_RECORDS_TABLE = 'MEDICAL_RECORDS'
+
+SNOWFLAKE_MEDICAL_RECORDS_DDL = """
+    CREATE TABLE IF NOT EXISTS MEDICAL_RECORDS (
+        record_id VARCHAR(36) PRIMARY KEY,
+        created_at TIMESTAMP_NTZ,
+        patient_id VARCHAR(36),
+        patient_name VARCHAR(100),
+        date_of_birth DATE,
+        age INTEGER,
+        gender VARCHAR(20),
+        blood_type VARCHAR(5),
+        diagnosis VARCHAR(200),
+        treatment_plan TEXT,
+        medication VARCHAR(500),
+        allergies VARCHAR(500),
+        vital_signs VARIANT,
+        insurance_provider VARCHAR(100),
+        insurance_id VARCHAR(50),
+        attending_physician VARCHAR(100),
+        department VARCHAR(50),
+        admission_date TIMESTAMP_NTZ,
+        discharge_date TIMESTAMP_NTZ,
+        last_updated_at TIMESTAMP_NTZ
+    )
+"""
+
+DUCKDB_MEDICAL_RECORDS_DDL = """
+    CREATE TABLE IF NOT EXISTS MEDICAL_RECORDS (
+        record_id VARCHAR,
+        created_at TIMESTAMP,
+        patient_id VARCHAR,
+        patient_name VARCHAR,
+        date_of_birth DATE,
+        age INTEGER,
+        gender VARCHAR,
+        blood_type VARCHAR,
+        diagnosis VARCHAR,
+        treatment_plan VARCHAR,
+        medication VARCHAR,
+        allergies VARCHAR,
+        vital_signs VARCHAR,
+        insurance_provider VARCHAR,
+        insurance_id VARCHAR,
+        attending_physician VARCHAR,
+        department VARCHAR,
+        admission_date TIMESTAMP,
+        discharge_date TIMESTAMP,
+        last_updated_at TIMESTAMP
+    )
+"""
+
+SQLITE_MEDICAL_RECORDS_DDL = """
+    CREATE TABLE IF NOT EXISTS MEDICAL_RECORDS (
+        record_id TEXT,
+        created_at TEXT,
+        patient_id TEXT,
+        patient_name TEXT,
+        date_of_birth TEXT,
+        age INTEGER,
+        gender TEXT,
+        blood_type TEXT,
+        diagnosis TEXT,
+        treatment_plan TEXT,
+        medication TEXT,
+        allergies TEXT,
+        vital_signs TEXT,
+        insurance_provider TEXT,
+        insurance_id TEXT,
+        attending_physician TEXT,
+        department TEXT,
+        admission_date TEXT,
+        discharge_date TEXT,
+        last_updated_at TEXT
+    )
+"""
+
+MEDICAL_RECORDS_COLUMNS = MEDICAL_RECORDS_ARROW_SCHEMA.names
+
+# Number of record ids looked up per existing_record_ids query
+RECORD_ID_LOOKUP_CHUNK = 1000
+
+
+def vital_signs_to_json(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns a copy of a record batch with vital_signs serialized as JSON strings.
+
+    Args:
+        df (pd.DataFrame): Medical records with vital_signs as dictionaries
+
+    Returns:
+        pd.DataFrame: Records with vital_signs as JSON text
+    """
+    return df.assign(vital_signs=df['vital_signs'].map(json.dumps))
+
+
+class RecordSink:
+    """
+    Destination for batches of MEDICAL_RECORDS rows.
+
+    A sink creates the MEDICAL_RECORDS table in its backend and appends whole
+    DataFrames in one bulk operation. Batches use the MEDICAL_RECORDS column
+    order with vital_signs as dictionaries; each sink serializes them the way
+    its backend expects. Sinks created with `flattened=True` also write every
+    batch to FLATTENED_MEDICAL_RECORDS, with the vital signs as typed columns,
+    as part of the same write.
+    """
+
+    name = 'sink'
+    # Whether write() may be called from several loader threads at once
+    concurrent_writes = False
+    flattened = False
+
+    def create_table(self):
+        """
+        Creates the MEDICAL_RECORDS table, and FLATTENED_MEDICAL_RECORDS for
+        flattened sinks, if they don't exist.
+        """
+        raise NotImplementedError
+
+    def write(self, df: pd.DataFrame, flattened_records: Optional[pd.DataFrame] = None) -> int:
+        """
+        Appends a batch of records.
+
+        Args:
+            df (pd.DataFrame): Medical records to append
+            flattened_records (Optional[pd.DataFrame]): Medical records flattened
+                sinks write to FLATTENED_MEDICAL_RECORDS instead of `df`, e.g. on a
+                retry the ones that table is still missing
+
+        Returns:
+            int: Number of rows written to MEDICAL_RECORDS
+        """
+        raise NotImplementedError
+
+    def _flattened_batch(self, df: pd.DataFrame, flattened_records: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+        # The FLATTENED_MEDICAL_RECORDS rows of a write, or None if there are none
+        if not self.flattened:
+            return None
+        records = df if flattened_records is None else flattened_records
+        return flatten_records(records) if not records.empty else None
+
+    def existing_record_ids(self, record_ids: Iterable[str], table_name: str = MEDICAL_RECORDS_TABLE) -> Set[str]:
+        """
+        Looks up which of the given record ids are already loaded, so failed
+        batches can be retried and replayed without loading a record twice.
+        Sinks that can't look records up return an empty set.
+
+        Args:
+            record_ids (Iterable[str]): Record ids to look up
+            table_name (str): MEDICAL_RECORDS or FLATTENED_MEDICAL_RECORDS
+
+        Returns:
+            Set[str]: The record ids already in the table
+        """
+        return set()
+
+    def close(self):
+        """
+        Flushes anything the sink still holds and releases its resources.
+        """
+        pass
+
+
+def _record_id_chunks(record_ids: Iterable[str]):
+    record_ids = list(record_ids)
+    for start in range(0, len(record_ids), RECORD_ID_LOOKUP_CHUNK):
+        yield record_ids[start:start + RECORD_ID_LOOKUP_CHUNK]
+
+
+class SnowflakeSink(RecordSink):
+    """
+    Loads batches into Snowflake with write_pandas, or through a Parquet spool
+    with one PUT/COPY INTO per rotation when `spool_dir` is given.
+
+    Args:
+        conn: Snowflake connection object
+        spool_dir (Optional[str]): Local Parquet spool directory
+        spool_max_mb (float): Size of pending Parquet files that triggers a load
+        close_connection (bool): Whether close() also closes `conn`
+        flattened (bool): Whether batches are also loaded into FLATTENED_MEDICAL_RECORDS
+    """
+
+    name = 'snowflake'
+
+    def __init__(self, conn, spool_dir: Optional[str] = None, spool_max_mb: float = 64,
+                 close_connection: bool = True, flattened: bool = False):
+        self.conn = conn
+        self.close_connection = close_connection
+        self.flattened = flattened
+        self.spool = None
+        self.flattened_spool = None
+        # The connector allows threads to share a connection; the spool does not
+        self.concurrent_writes = not spool_dir
+        if spool_dir:
+            self.spool = ParquetSpool(spool_dir,
+                                      loader=SnowflakeCopyLoader(conn, table_name=MEDICAL_RECORDS_TABLE),
+                                      max_rotation_bytes=int(spool_max_mb * 1024 * 1024))
+            if flattened:
+                self.flattened_spool = ParquetSpool(os.path.join(spool_dir, 'flattened'),
+                                                    loader=SnowflakeCopyLoader(conn, table_name=FLATTENED_MEDICAL_RECORDS_TABLE),
+                                                    max_rotation_bytes=int(spool_max_mb * 1024 * 1024),
+                                                    schema=FLATTENED_MEDICAL_RECORDS_ARROW_SCHEMA)
+            recovered_rows = self.spool.recover()
+            if self.flattened_spool is not None:
+                self.flattened_spool.recover()
+            if recovered_rows:
+                print(f"Replayed {recovered_rows} spooled records from {spool_dir}")
+
+    def create_table(self):
+        with self.conn.cursor() as cursor:
+            cursor.execute(SNOWFLAKE_MEDICAL_RECORDS_DDL)
+            if self.flattened:
+                cursor.execute(SNOWFLAKE_FLATTENED_MEDICAL_RECORDS_DDL)
+
+    def _write_pandas(self, df: pd.DataFrame, table_name: str) -> int:
+        # write_pandas is only imported when a Snowflake load actually happens
+        from snowflake.connector.pandas_tools import write_pandas
+
+        # One write_pandas call means one stage upload, one COPY and one commit
+        success, nchunks, nrows, _ = write_pandas(
+            conn=self.conn,
+            df=df,
+            table_name=table_name,
+            quote_identifiers=False
+        )
+
+        if not success:
+            raise RuntimeError(f"write_pandas reported failure for a batch of {len(df)} records into {table_name}")
+        return nrows
+
+    def write(self, df: pd.DataFrame, flattened_records: Optional[pd.DataFrame] = None) -> int:
+        flattened = self._flattened_batch(df, flattened_records)
+        # MEDICAL_RECORDS is loaded first: if the flattened load then fails, a retry
+        # finds the records there and only loads what FLATTENED_MEDICAL_RECORDS misses
+        nrows = 0
+        if self.spool is not None:
+            if not df.empty:
+                nrows = self.spool.write(df)
+            if flattened is not None:
+                self.flattened_spool.write(flattened)
+            return nrows
+
+        if not df.empty:
+            # Convert vital_signs dictionary to JSON string
+            nrows = self._write_pandas(df.assign(vital_signs=df['vital_signs'].map(str)), MEDICAL_RECORDS_TABLE)
+        if flattened is not None:
+            self._write_pandas(flattened, FLATTENED_MEDICAL_RECORDS_TABLE)
+        return nrows
+
+    def existing_record_ids(self, record_ids: Iterable[str], table_name: str = MEDICAL_RECORDS_TABLE) -> Set[str]:
+        found = set()
+        with self.conn.cursor() as cursor:
+            for chunk in _record_id_chunks(record_ids):
+                cursor.execute(
+                    f"SELECT record_id FROM {table_name} "
+                    f"WHERE record_id IN ({', '.join(['%s'] * len(chunk))})",
+                    chunk
+                )
+                found.update(row[0] for row in cursor.fetchall())
+        return found
+
+    def close(self):
+        if self.flattened_spool is not None:
+            self.flattened_spool.close()
+        if self.spool is not None:
+            self.spool.close()
+        if self.close_connection:
+            self.conn.close()
+
+
+class DuckDBSink(RecordSink):
+    """
+    Appends batches to a local DuckDB database.
+
+    Args:
+        path (str): Database file, or ':memory:' for an in-memory database
+        flattened (bool): Whether batches are also written to FLATTENED_MEDICAL_RECORDS
+    """
+
+    name = 'duckdb'
+
+    def __init__(self, path: str = ':memory:', flattened: bool = False):
+        if duckdb is None:
+            raise ImportError("The duckdb sink requires the duckdb package: pip install duckdb")
+        self.path = path
+        self.flattened = flattened
+        self.conn = duckdb.connect(path)
+
+    def create_table(self):
+        self.conn.execute(DUCKDB_MEDICAL_RECORDS_DDL)
+        if self.flattened:
+            self.conn.execute(DUCKDB_FLATTENED_MEDICAL_RECORDS_DDL)
+
+    def write(self, df: pd.DataFrame, flattened_records: Optional[pd.DataFrame] = None) -> int:
+        flattened = self._flattened_batch(df, flattened_records)
+        if df.empty and flattened is None:
+            return 0
+        batch = vital_signs_to_json(df)
+        self.conn.register('medical_records_batch', batch)
+        if flattened is not None:
+            self.conn.register('flattened_batch', flattened)
+        try:
+            # Both tables are written in one transaction
+            self.conn.begin()
+            if not batch.empty:
+                self.conn.execute(f"INSERT INTO {MEDICAL_RECORDS_TABLE} SELECT * FROM medical_records_batch")
+            if flattened is not None:
+                self.conn.execute(f"INSERT INTO {FLATTENED_MEDICAL_RECORDS_TABLE} SELECT * FROM flattened_batch")
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            self.conn.unregister('medical_records_batch')
+            if flattened is not None:
+                self.conn.unregister('flattened_batch')
+        return len(batch)
+
+    def existing_record_ids(self, record_ids: Iterable[str], table_name: str = MEDICAL_RECORDS_TABLE) -> Set[str]:
+        lookup = pd.DataFrame({'record_id': list(record_ids)})
+        self.conn.register('record_id_lookup', lookup)
+        try:
+            rows = self.conn.execute(
+                f"SELECT record_id FROM {table_name} "
+                f"WHERE record_id IN (SELECT record_id FROM record_id_lookup)"
+            ).fetchall()
+        finally:
+            self.conn.unregister('record_id_lookup')
+        return {row[0] for row in rows}
+
+    def close(self):
+        self.conn.close()
+
+
+class SQLiteSink(RecordSink):
+    """
+    Appends batches to a local SQLite database in one transaction per batch.
+
+    Args:
+        path (str): Database file, or ':memory:' for an in-memory database
+        flattened (bool): Whether batches are also written to FLATTENED_MEDICAL_RECORDS
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path: str = ':memory:', flattened: bool = False):
+        self.path = path
+        self.flattened = flattened
+        # Loader threads write through this connection, one at a time
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self._insert_sql = (f"INSERT INTO {MEDICAL_RECORDS_TABLE} ({', '.join(MEDICAL_RECORDS_COLUMNS)}) "
+                            f"VALUES ({', '.join('?' * len(MEDICAL_RECORDS_COLUMNS))})")
+        self._insert_flattened_sql = (f"INSERT INTO {FLATTENED_MEDICAL_RECORDS_TABLE} "
+                                      f"({', '.join(FLATTENED_MEDICAL_RECORDS_COLUMNS)}) "
+                                      f"VALUES ({', '.join('?' * len(FLATTENED_MEDICAL_RECORDS_COLUMNS))})")
+
+    def create_table(self):
+        with self.conn:
+            self.conn.execute(SQLITE_MEDICAL_RECORDS_DDL)
+            if self.flattened:
+                self.conn.execute(SQLITE_FLATTENED_MEDICAL_RECORDS_DDL)
+
+    def write(self, df: pd.DataFrame, flattened_records: Optional[pd.DataFrame] = None) -> int:
+        flattened = self._flattened_batch(df, flattened_records)
+        if df.empty and flattened is None:
+            return 0
+        batch = vital_signs_to_json(df)[MEDICAL_RECORDS_COLUMNS]
+        batch = batch.astype({'age': int}).astype(object)
+        with self.conn:
+            self.conn.executemany(self._insert_sql, batch.itertuples(index=False, name=None))
+            if flattened is not None:
+                flattened = flattened.astype({'age': int}).astype(object)
+                self.conn.executemany(self._insert_flattened_sql, flattened.itertuples(index=False, name=None))
+        return len(batch)
+
+    def existing_record_ids(self, record_ids: Iterable[str], table_name: str = MEDICAL_RECORDS_TABLE) -> Set[str]:
+        found = set()
+        for chunk in _record_id_chunks(record_ids):
+            rows = self.conn.execute(
+                f"SELECT record_id FROM {table_name} "
+                f"WHERE record_id IN ({', '.join('?' * len(chunk))})",
+                chunk
+            ).fetchall()
+            found.update(row[0] for row in rows)
+        return found
+
+    def close(self):
+        self.conn.close()
+
+
+class ParquetSink(RecordSink):
+    """
+    Writes every batch to its own compressed Parquet file in a directory.
+
+    Args:
+        path (str): Directory the Parquet files are written to
+        compression (str): Parquet compression codec
+        flattened (bool): Whether batches are also written, flattened, to a
+            `flattened` subdirectory
+    """
+
+    name = 'parquet'
+    concurrent_writes = True
+
+    def __init__(self, path: str = 'medical_records_parquet', compression: str = 'snappy',
+                 flattened: bool = False):
+        self.path = Path(path)
+        self.compression = compression
+        self.flattened = flattened
+
+    def create_table(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        if self.flattened:
+            (self.path / 'flattened').mkdir(exist_ok=True)
+
+    def _write_file(self, table: pa.Table, directory: Path):
+        file_name = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+        temp_path = directory / f"{file_name}.tmp"
+        pq.write_table(table, temp_path, compression=self.compression)
+        os.replace(temp_path, directory / file_name)
+
+    def write(self, df: pd.DataFrame, flattened_records: Optional[pd.DataFrame] = None) -> int:
+        flattened = self._flattened_batch(df, flattened_records)
+        if flattened is not None:
+            self._write_file(pa.Table.from_pandas(flattened, schema=FLATTENED_MEDICAL_RECORDS_ARROW_SCHEMA,
+                                                  preserve_index=False),
+                             self.path / 'flattened')
+        if df.empty:
+            return 0
+        table = pa.Table.from_pandas(df, schema=MEDICAL_RECORDS_ARROW_SCHEMA, preserve_index=False)
+        self._write_file(table, self.path)
+        return table.num_rows
+
+
+class NullSink(RecordSink):
+    """
+    Discards every batch, for measuring generation throughput on its own.
+    """
+
+    name = 'null'
+    concurrent_writes = True
+
+    def __init__(self, path: Optional[str] = None, flattened: bool = False):
+        self.flattened = flattened
+        self.total_rows = 0
+
+    def create_table(self):
+        pass
+
+    def write(self, df: pd.DataFrame, flattened_records: Optional[pd.DataFrame] = None) -> int:
+        # Flatten anyway so the cost shows up in the throughput figures
+        self._flattened_batch(df, flattened_records)
+        self.total_rows += len(df)
+        return len(df)
+
+
+LOCAL_SINKS: Dict[str, Type[RecordSink]] = {
+    DuckDBSink.name: DuckDBSink,
+    SQLiteSink.name: SQLiteSink,
+    ParquetSink.name: ParquetSink,
+    NullSink.name: NullSink,
+}
+
+SINK_NAMES = [SnowflakeSink.name] + list(LOCAL_SINKS)
+
+
+def shard_sink_path(path: Optional[str], shard_index: int) -> Optional[str]:
+    """
+    Derives a per-shard path so sharded producers never share a local database file.
+
+    Args:
+        path (Optional[str]): Sink path given on the command line
+        shard_index (int): Index of the shard
+
+    Returns:
+        Optional[str]: Path for this shard
+    """
+    if not path or path == ':memory:':
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}-shard-{shard_index}{extension}"
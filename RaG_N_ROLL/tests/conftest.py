@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The producer imports producer_utilities relative to RaG_N_ROLL
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
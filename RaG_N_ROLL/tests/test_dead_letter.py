@@ -0,0 +1,87 @@
+import pytest
+
+from producer import generate_medical_records
+from producer_utilities.dead_letter import RetryingSink, RetryPolicy
+from producer_utilities.flattened_table import FLATTENED_MEDICAL_RECORDS_TABLE
+from producer_utilities.sinks import MEDICAL_RECORDS_TABLE, SQLiteSink
+
+
+class FlakySQLiteSink(SQLiteSink):
+    """
+    SQLite sink whose first `failures` writes fail after committing part of the batch.
+
+    `committed` picks what a failing write commits before raising: 'medical'
+    commits only MEDICAL_RECORDS, as when the flattened load fails after it,
+    'none' commits nothing.
+    """
+
+    def __init__(self, failures: int = 1, committed: str = 'medical', flattened: bool = True):
+        super().__init__(flattened=flattened)
+        self.failures = failures
+        self.committed = committed
+
+    def write(self, df, flattened_records=None):
+        if self.failures:
+            self.failures -= 1
+            if self.committed == 'medical':
+                super().write(df, flattened_records=df.iloc[:0])
+            raise RuntimeError("load failed")
+        return super().write(df, flattened_records)
+
+
+def _counts(sink, table):
+    return sink.conn.execute(f"SELECT COUNT(*), COUNT(DISTINCT record_id) FROM {table}").fetchone()
+
+
+def _retrying(sink, **kwargs):
+    retrying = RetryingSink(sink, policy=RetryPolicy(max_retries=2, base_delay=0, max_delay=0), **kwargs)
+    retrying.create_table()
+    return retrying
+
+
+@pytest.mark.parametrize("flattened", [True, False])
+def test_retry_after_a_partly_committed_write_loads_every_record_once(flattened):
+    sink = FlakySQLiteSink(flattened=flattened)
+    retrying = _retrying(sink)
+    df = generate_medical_records(20, seed=1)
+
+    assert retrying.write(df) == 20
+
+    assert _counts(sink, MEDICAL_RECORDS_TABLE) == (20, 20)
+    if flattened:
+        assert _counts(sink, FLATTENED_MEDICAL_RECORDS_TABLE) == (20, 20)
+    assert retrying.stats()['duplicate_rows'] == 20
+
+
+def test_replay_loads_only_the_records_each_table_is_missing(tmp_path):
+    # Every attempt fails after committing MEDICAL_RECORDS, so the batch is dead-lettered
+    sink = FlakySQLiteSink(failures=3)
+    retrying = _retrying(sink, dead_letter_dir=tmp_path / 'dead_letters', replay_interval=0)
+    df = generate_medical_records(20, seed=2)
+
+    assert retrying.write(df) == 0
+    assert len(retrying.dead_letters) == 1
+    assert _counts(sink, MEDICAL_RECORDS_TABLE) == (20, 20)
+    assert _counts(sink, FLATTENED_MEDICAL_RECORDS_TABLE) == (0, 0)
+
+    # The next successful write replays the segment
+    assert retrying.write(generate_medical_records(5, seed=3)) == 5
+
+    assert len(retrying.dead_letters) == 0
+    assert _counts(sink, MEDICAL_RECORDS_TABLE) == (25, 25)
+    assert _counts(sink, FLATTENED_MEDICAL_RECORDS_TABLE) == (25, 25)
+
+
+def test_replaying_a_loaded_segment_again_loads_nothing(tmp_path):
+    sink = FlakySQLiteSink(failures=3, committed='none')
+    retrying = _retrying(sink, dead_letter_dir=tmp_path / 'dead_letters')
+    df = generate_medical_records(10, seed=4)
+
+    assert retrying.write(df) == 0
+    assert retrying.replay() == 10
+    # e.g. a crash between the load and removing the segment
+    retrying.dead_letters.append(df)
+    assert retrying.replay() == 0
+
+    assert _counts(sink, MEDICAL_RECORDS_TABLE) == (10, 10)
+    assert _counts(sink, FLATTENED_MEDICAL_RECORDS_TABLE) == (10, 10)
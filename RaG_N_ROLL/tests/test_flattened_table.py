@@ -0,0 +1,55 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("duckdb")
+
+from producer import generate_medical_records
+from producer_utilities.flattened_table import FLATTENED_MEDICAL_RECORDS_TABLE, refresh_flattened_table
+from producer_utilities.sinks import MEDICAL_RECORDS_TABLE, DuckDBSink
+
+
+def _records(n: int, last_updated_at: str, seed: int):
+    return generate_medical_records(n, seed=seed).assign(last_updated_at=last_updated_at)
+
+
+def _count(sink: DuckDBSink, table: str) -> int:
+    return sink.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+@pytest.fixture
+def sink():
+    sink = DuckDBSink()
+    sink.create_table()
+    yield sink
+    sink.close()
+
+
+def test_refresh_merges_rows_loaded_after_newer_ones(sink):
+    sink.write(_records(50, '2026-06-01 00:00:00', seed=1))
+    assert refresh_flattened_table(sink.conn)[1] == 50
+
+    # A replayed or recovered batch: loaded now, generated before the watermark
+    sink.write(_records(50, '2026-01-01 00:00:00', seed=2))
+    watermark, rows_merged = refresh_flattened_table(sink.conn)
+
+    assert watermark == datetime(2026, 6, 1)
+    assert rows_merged == 50
+    assert _count(sink, FLATTENED_MEDICAL_RECORDS_TABLE) == _count(sink, MEDICAL_RECORDS_TABLE) == 100
+
+
+def test_refresh_is_idempotent_and_applies_updates(sink):
+    records = _records(20, '2026-06-01 00:00:00', seed=3)
+    sink.write(records)
+    refresh_flattened_table(sink.conn)
+    assert refresh_flattened_table(sink.conn)[1] == 0
+
+    updated = records.head(5).assign(last_updated_at='2026-06-02 00:00:00', department='Cardiology')
+    sink.write(updated)
+    assert refresh_flattened_table(sink.conn)[1] == 5
+
+    assert _count(sink, FLATTENED_MEDICAL_RECORDS_TABLE) == 20
+    assert sink.conn.execute(
+        f"SELECT COUNT(*) FROM {FLATTENED_MEDICAL_RECORDS_TABLE} "
+        f"WHERE department = 'Cardiology' AND last_updated_at = '2026-06-02'"
+    ).fetchone()[0] == 5
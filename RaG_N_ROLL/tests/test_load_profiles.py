@@ -0,0 +1,44 @@
+import pytest
+
+from producer_utilities.load_profiles import (BurstProfile, ConstantProfile, DiurnalProfile, StepProfile,
+                                              parse_profile)
+
+
+@pytest.mark.parametrize("spec, profile_type, rates", [
+    ("constant:250", ConstantProfile, {0: 250, 90: 250}),
+    ("step:60x100,60x5000", StepProfile, {0: 100, 59: 100, 60: 5000, 120: 100}),
+    ("burst:10,1000,60,5", BurstProfile, {0: 1000, 4: 1000, 5: 10, 60: 1000}),
+    ("constant:0", ConstantProfile, {0: 0}),
+])
+def test_parses_valid_profiles(spec, profile_type, rates):
+    profile = parse_profile(spec)
+    assert isinstance(profile, profile_type)
+    assert {elapsed: profile.rate_at(elapsed) for elapsed in rates} == rates
+
+
+def test_parses_diurnal_profile_between_trough_and_peak():
+    profile = parse_profile("diurnal:1000,100,3600")
+    assert isinstance(profile, DiurnalProfile)
+    rates = [profile.rate_at(elapsed) for elapsed in range(0, 3600, 60)]
+    assert min(rates) == pytest.approx(100) and max(rates) == pytest.approx(1000)
+
+
+@pytest.mark.parametrize("spec", [
+    "step:0x100",
+    "step:60x100,0x5000",
+    "step:-5x100",
+    "step:60x-1",
+    "burst:10,1000,0,5",
+    "burst:10,1000,60,0",
+    "burst:-10,1000,60,5",
+    "constant:-1",
+    "constant:nan",
+    "diurnal:1000,100,0",
+    "diurnal:100,1000",
+    "constant:abc",
+    "burst:10,1000",
+    "poisson:100",
+])
+def test_rejects_invalid_profiles_with_the_spec(spec):
+    with pytest.raises(ValueError, match="profile"):
+        parse_profile(spec)
@@ -0,0 +1,91 @@
+import pyarrow.parquet as pq
+import pytest
+
+from producer import generate_medical_records
+from producer_utilities.parquet_spool import DirectoryLoader, ParquetSpool
+
+
+class FlakyLoader(DirectoryLoader):
+    """
+    DirectoryLoader that fails its first `failures` calls.
+    """
+
+    def __init__(self, target_dir, failures: int = 1):
+        super().__init__(target_dir)
+        self.failures = failures
+
+    def __call__(self, rotation_dir, files):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("COPY INTO failed")
+        return super().__call__(rotation_dir, files)
+
+
+def _loaded_record_ids(target_dir):
+    return sorted(record_id for path in target_dir.glob('*.parquet')
+                  for record_id in pq.read_table(path, columns=['record_id']).column('record_id').to_pylist())
+
+
+@pytest.fixture
+def records():
+    return [generate_medical_records(25, seed=seed) for seed in range(4)]
+
+
+def test_rotates_once_the_pending_files_reach_the_size_limit(tmp_path, records):
+    loader = DirectoryLoader(tmp_path / 'loaded')
+    spool = ParquetSpool(tmp_path / 'spool', loader=loader, max_rotation_bytes=1, max_rotation_seconds=3600)
+
+    for df in records[:2]:
+        assert spool.write(df) == 25
+
+    assert spool.total_rotations == 2
+    assert spool.total_rows_loaded == 50
+    assert not list(spool.pending_dir.iterdir()) and not list(spool.rotations_dir.iterdir())
+    assert _loaded_record_ids(loader.target_dir) == sorted(records[0]['record_id'].tolist() + records[1]['record_id'].tolist())
+
+
+def test_close_loads_everything_pending_in_one_rotation(tmp_path, records):
+    loader = DirectoryLoader(tmp_path / 'loaded')
+    spool = ParquetSpool(tmp_path / 'spool', loader=loader, max_rotation_seconds=3600)
+
+    for df in records:
+        spool.write(df)
+    assert spool.total_rotations == 0
+
+    assert spool.close() == 100
+    assert spool.total_rotations == 1
+    assert len(_loaded_record_ids(loader.target_dir)) == 100
+
+
+def test_a_failed_load_is_kept_and_retried_at_the_next_rotation(tmp_path, records):
+    loader = FlakyLoader(tmp_path / 'loaded')
+    spool = ParquetSpool(tmp_path / 'spool', loader=loader, max_rotation_bytes=1, max_rotation_seconds=3600)
+
+    # write() reports the batch as spooled even though its rotation failed to load
+    assert spool.write(records[0]) == 25
+    assert spool.total_rows_loaded == 0
+    assert len(list(spool.rotations_dir.iterdir())) == 1
+
+    spool.write(records[1])
+    assert spool.total_rows_loaded == 50
+    assert not list(spool.rotations_dir.iterdir())
+    assert len(_loaded_record_ids(loader.target_dir)) == 50
+
+
+def test_recovers_pending_files_and_rotations_after_a_crash(tmp_path, records):
+    spool_dir = tmp_path / 'spool'
+    crashed = ParquetSpool(spool_dir, loader=FlakyLoader(tmp_path / 'loaded', failures=10), max_rotation_seconds=3600)
+    crashed.write(records[0])
+    with pytest.raises(RuntimeError):
+        crashed.rotate()
+    crashed.write(records[1])
+    # A write torn by the crash
+    (crashed.pending_dir / 'torn.parquet.tmp').write_bytes(b'PAR1')
+
+    loader = DirectoryLoader(tmp_path / 'loaded')
+    spool = ParquetSpool(spool_dir, loader=loader, max_rotation_seconds=3600)
+    assert spool.recover() == 25
+    assert not list(spool.pending_dir.glob('*.tmp'))
+    assert spool.close() == 25
+
+    assert _loaded_record_ids(loader.target_dir) == sorted(records[0]['record_id'].tolist() + records[1]['record_id'].tolist())
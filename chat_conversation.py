@@ -1,10 +1,15 @@
 import sys
+import os
 sys.path.append("..")
 import streamlit as st
+import time
 from mixtral_chat import MixtralAgents, client, ResponseCache
 import pandas as pd
 from typing import Union, Tuple
 from pages_markdowns import PagesMarkdowns
+from mixtral_chat_utilities.result_limits import truncation_message
+from mixtral_chat_utilities.async_queries import QueryHandle, QueryStatus
+from mixtral_chat_utilities.mixtral_tools import async_queries
 
 
 ma = MixtralAgents()
@@ -12,8 +17,11 @@ rc = ResponseCache()
 
 class ChatInterface:
 
-    def __init__(self, markdown: Tuple, chat_key = "main"):
+    def __init__(self, markdown: Tuple, chat_key = "main", agent_mode = os.getenv("CHAT_AGENT_MODE", "two_step")):
         self.chat_key = chat_key
+        self.query_key = f"{chat_key}_pending_query"
+        # "two_step" improves the prompt and generates its SQL in separate LLM calls, "fused" in one
+        self.agent_mode = agent_mode
         
         self.markdown_header, self.markdown_body = markdown
         st.markdown(self.markdown_header)
@@ -28,19 +36,63 @@ class ChatInterface:
     def generate_dataframe_from_prompt(self)->Union[pd.DataFrame, str]:
         prompt = st.chat_input("Say something", key = self.chat_key)
         if prompt:
+            self.cancel_pending_query()
             st.write(f"You: {prompt}")
 
-            new_sql_prompt = ma.prompt_agent(prompt, client)
+            sql_response = ma.generate_sql_response(prompt, client, self.agent_mode)
 
-            sql_response = ma.sql_query_agent(new_sql_prompt, client)
+            df_or_text = ma.submit_agent_response(sql_response)
+            if isinstance(df_or_text, QueryHandle):
+                # Only the handle id lives in the session; the query keeps running across reruns
+                st.session_state[self.query_key] = {"id": df_or_text.id, "prompt": prompt}
+                df_or_text = self.poll_pending_query()
 
-            df_or_text = ma.parse_agent_response(sql_response)
-    
-            self.update_current_dataframe(df_or_text)
+        elif st.session_state.get(self.query_key):
+            # A query is still in flight: poll it again on this rerun
+            st.write(f"You: {st.session_state[self.query_key]['prompt']}")
+            df_or_text = self.poll_pending_query()
+
+        else:
+            return None
+
+        self.update_current_dataframe(df_or_text)
+
+        if message := truncation_message(df_or_text):
+            st.warning(message)
+
+        if isinstance(df_or_text, pd.DataFrame) and "sql_validation" in df_or_text.attrs:
+            issues = df_or_text.attrs["sql_validation"]["issues"]
+            st.error("The generated query could not be run: " + " ".join(issue["message"] for issue in issues))
+
+        st.write(df_or_text)
+
+        return df_or_text
+
+
+    def poll_pending_query(self)-> Union[pd.DataFrame, str]:
+        # Reruns the page until the query finishes, so the script thread never waits on it
+        handle = async_queries.get(st.session_state[self.query_key]["id"])
+        if handle is not None and not handle.done():
+            state = "Running" if handle.poll() == QueryStatus.RUNNING else "Waiting for a free connection"
+            st.status(f"{state}... {handle.elapsed:.0f}s", state = "running")
+            time.sleep(0.5)
+            st.rerun()
+
+        st.session_state[self.query_key] = None
+        if handle is None or handle.poll() != QueryStatus.SUCCEEDED:
+            st.status("Query failed", state = "error")
+            reason = (handle.error or handle.poll().value) if handle is not None else "the query expired"
+            return f"The query could not be run: {reason}"
+        st.status(f"Query finished in {handle.elapsed:.1f}s", state = "complete")
+        return handle.result()
 
-            st.write(df_or_text)
 
-            return df_or_text
+    def cancel_pending_query(self):
+        # A new prompt replaces the query still in flight; it is cancelled if it hasn't started
+        pending = st.session_state.get(self.query_key)
+        if pending:
+            async_queries.cancel([pending["id"]])
+        st.session_state[self.query_key] = None
 
 
     def update_current_dataframe(self, df_or_text: Union[pd.DataFrame, str]):
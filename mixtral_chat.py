@@ -1,19 +1,25 @@
 import os
 import json
 import io
+import asyncio
 from dotenv import load_dotenv
 from pydantic import BaseModel
-from groq import Groq
+from groq import AsyncGroq, Groq
 import groq
-from typing import Dict
+from typing import Dict, Optional
 from enum import Enum
 from mixtral_chat_utilities.mixtral_context import (ContextTexts,
                                                     PromptTexts,
                                                     SqlPrompt,
                                                     PromptGenerator,
+                                                    FusedSqlPrompt,
                                                     StreamlitBot
                                                     )
-from mixtral_chat_utilities.mixtral_tools import get_dataframe_from_query
+from mixtral_chat_utilities.mixtral_tools import get_dataframe_from_query, submit_query, validate_query
+from mixtral_chat_utilities.completion_cache import CompletionCache, HashingEmbedder
+from mixtral_chat_utilities.prompt_registry import PromptRegistry
+from mixtral_chat_utilities.llm_concurrency import ConcurrentLLMRunner
+from mixtral_chat_utilities.rate_limiter import TokenBucketRateLimiter, estimate_tokens
 import json
 from pydantic import ValidationError
 import pandas as pd
@@ -26,87 +32,205 @@ client = Groq(
     # This is the default and can be omitted
     api_key=os.environ.get("GROQ_API_KEY"),
 )
+
+MODEL_NAME = "mixtral-8x7b-32768"
+
+# One budget for every session and thread of the process, matching the Groq account's limits
+rate_limiter = TokenBucketRateLimiter(
+    requests_per_minute = float(os.getenv("GROQ_REQUESTS_PER_MINUTE", 30)),
+    tokens_per_minute = float(os.getenv("GROQ_TOKENS_PER_MINUTE", 5000))
+)
+
+# Tokens reserved for a completion until the response reports the actual usage
+EXPECTED_COMPLETION_TOKENS = 256
+
+# Seconds an async Groq request may take once the rate limiter lets it through
+llm_request_timeout = float(os.getenv("LLM_TIMEOUT_SECONDS", 120))
+
+# Independent calls of the dashboard pipeline (one per report or topic) run concurrently;
+# their requests time out in MixtralAgents, so waiting for the rate limit doesn't count
+llm_runner = ConcurrentLLMRunner(
+    lambda: AsyncGroq(api_key=os.environ.get("GROQ_API_KEY")),
+    max_concurrency = int(os.getenv("LLM_CONCURRENCY", 3))
+)
+
+# Shared by every session, so a question answered once skips the LLM round trip;
+# LLM_CACHE_SIMILARITY enables near-duplicate lookup above that cosine similarity
+completion_cache = CompletionCache(
+    max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 1000)),
+    ttl_seconds = float(os.getenv("LLM_CACHE_TTL_SECONDS", 24 * 3600)),
+    embedder = HashingEmbedder() if os.getenv("LLM_CACHE_SIMILARITY") else None,
+    similarity_threshold = float(os.getenv("LLM_CACHE_SIMILARITY") or 1.0)
+)
+
+# System prompts are built once per process; requests only format their dynamic parts
+prompt_registry = PromptRegistry()
     
 class MixtralAgents:
 
-    def __init__(self):
-        pass
+    def __init__(self, cache: CompletionCache = completion_cache, rate_limiter: TokenBucketRateLimiter = rate_limiter,
+                 request_timeout: Optional[float] = llm_request_timeout):
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.request_timeout = request_timeout
     
-    def sql_query_agent(self, text: str, client: Groq, temperature: float= 0.0):
-
-        prompt_context = ContextTexts.TABLE_ASSISTANT.value.format(output_format = json.dumps(SqlPrompt.model_json_schema(), indent = 2)) 
-        contextual_prompt = PromptTexts.TABLE_ASSISTANT.value.format(user_prompt = text)
-            
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": prompt_context
-                    },
-                {
-                    "role": "user",
-                    "content": contextual_prompt,
-                    }
-            ],
-            model="mixtral-8x7b-32768",
-            temperature = temperature,
-            stream = False,
-            response_format = {"type": "json_object"}
-        )
-        parsed_content = json.loads(chat_completion.choices[0].message.content)
+    def _messages(self, context: str, text: str):
+        return [
+            {
+                "role": "system",
+                "content": context
+                },
+            {
+                "role": "user",
+                "content": text,
+                }
+        ]
+
+    def _create_chat_completion(self, client: Groq, context: str, text: str, temperature: float= 0.0,
+                                retry_seconds: float = 30, **kwargs):
+        # Waits for the shared rate limit, then aligns it with the response's rate-limit headers and usage
+        estimated_tokens = estimate_tokens(context, text) + EXPECTED_COMPLETION_TOKENS
+        self.rate_limiter.acquire(estimated_tokens)
+        completions = client.chat.completions
+        try:
+            if hasattr(completions, "with_raw_response"):
+                raw_response = completions.with_raw_response.create(messages = self._messages(context, text), model = MODEL_NAME,
+                                                                    temperature = temperature, **kwargs)
+                self.rate_limiter.update_from_headers(raw_response.headers)
+                chat_completion = raw_response.parse()
+            else:
+                chat_completion = completions.create(messages = self._messages(context, text), model = MODEL_NAME,
+                                                     temperature = temperature, **kwargs)
+        except groq.RateLimitError as e:
+            # The rejected request used no tokens; everyone waits for the API's retry-after instead
+            self.rate_limiter.record_usage(estimated_tokens, 0)
+            self.rate_limiter.penalize(e.response.headers, retry_seconds)
+            raise
+        
+        usage = getattr(chat_completion, "usage", None)
+        self.rate_limiter.record_usage(estimated_tokens, getattr(usage, "total_tokens", None))
+        return chat_completion
+
+    async def _create_chat_completion_async(self, client: AsyncGroq, context: str, text: str, temperature: float= 0.0,
+                                            retry_seconds: float = 30, **kwargs):
+        estimated_tokens = estimate_tokens(context, text) + EXPECTED_COMPLETION_TOKENS
+        await self.rate_limiter.acquire_async(estimated_tokens)
+        try:
+            # The timeout starts once the rate limit allows the request, so time spent queued can't use it up
+            chat_completion = await asyncio.wait_for(self._send_chat_completion_async(client, context, text, temperature, **kwargs),
+                                                     self.request_timeout)
+        except groq.RateLimitError as e:
+            self.rate_limiter.record_usage(estimated_tokens, 0)
+            self.rate_limiter.penalize(e.response.headers, retry_seconds)
+            raise
+        
+        usage = getattr(chat_completion, "usage", None)
+        self.rate_limiter.record_usage(estimated_tokens, getattr(usage, "total_tokens", None))
+        return chat_completion
+    
+    async def _send_chat_completion_async(self, client: AsyncGroq, context: str, text: str, temperature: float, **kwargs):
+        completions = client.chat.completions
+        if hasattr(completions, "with_raw_response"):
+            raw_response = await completions.with_raw_response.create(messages = self._messages(context, text), model = MODEL_NAME,
+                                                                      temperature = temperature, **kwargs)
+            self.rate_limiter.update_from_headers(raw_response.headers)
+            return await raw_response.parse()
+        return await completions.create(messages = self._messages(context, text), model = MODEL_NAME,
+                                        temperature = temperature, **kwargs)
+    
+    def _parse_response(self, content: str, output_format: BaseModel):
+        parsed_content = json.loads(content)
 
         if "output" in parsed_content:
             parsed_content = parsed_content["output"]
 
         try:
-            validated_response = SqlPrompt.model_validate(parsed_content)
-            return validated_response
+            return output_format.model_validate(parsed_content)
         except ValidationError as e:
             print(f"SQL Query Validation Error: \n{e}")
+
+    def _cached_completion(self, context: str, text: str, client: Groq, output_format: BaseModel, temperature: float= 0.0):
+        # Only completions that parse are cached, so a malformed answer is not replayed
+        content = self.cache.get(MODEL_NAME, context, text, temperature)
+        if content is not None:
+            return self._parse_response(content, output_format)
+
+        start = time.perf_counter()
+        chat_completion = self._create_chat_completion(client, context, text, temperature,
+                                                       stream = False,
+                                                       response_format = {"type": "json_object"}
+                                                       )
+        content = chat_completion.choices[0].message.content
+        validated_response = self._parse_response(content, output_format)
+        if validated_response is not None:
+            self.cache.put(MODEL_NAME, context, text, temperature, content, time.perf_counter() - start)
+        return validated_response
+    
+    def sql_query_agent(self, text: str, client: Groq, temperature: float= 0.0, max_repairs: int = 2):
+
+        prompt_context = prompt_registry.prompt(ContextTexts.TABLE_ASSISTANT, output_format = prompt_registry.schema_json(SqlPrompt)).format()
+        contextual_prompt = PromptTexts.TABLE_ASSISTANT.value.format(user_prompt = text)
+            
+        validated_response = self._cached_completion(prompt_context, contextual_prompt, client, SqlPrompt, temperature)
+        if validated_response is None:
+            return
+
+        if validated_response.sql_query == "null":
+            return validated_response
+
+        # Let the LLM fix queries that can't run before they reach the warehouse
+        validation = validate_query(validated_response.sql_query)
+        if not validation.valid and max_repairs > 0:
+            print(f"Repairing the SQL query: {[issue.message for issue in validation.issues]}")
+            return self.sql_query_agent(f"{text}\n\n{validation.to_repair_prompt()}", client, temperature, max_repairs - 1)
+        return validated_response
         
 
+
+    def fused_sql_agent(self, text: str, client: Groq, temperature: float= 0.0, max_repairs: int = 2):
+        # One round trip that improves the prompt and answers it, instead of prompt_agent then sql_query_agent
+        prompt_context = prompt_registry.prompt(ContextTexts.TABLE_ASSISTANT, output_format = prompt_registry.schema_json(FusedSqlPrompt)).format()
+        contextual_prompt = PromptTexts.FUSED_TABLE_ASSISTANT.value.format(user_prompt = text)
+
+        validated_response = self._cached_completion(prompt_context, contextual_prompt, client, FusedSqlPrompt, temperature)
+        if validated_response is None or validated_response.sql_query == "null":
+            return validated_response
+
+        validation = validate_query(validated_response.sql_query)
+        if not validation.valid and max_repairs > 0:
+            print(f"Repairing the SQL query: {[issue.message for issue in validation.issues]}")
+            repaired_response = self.sql_query_agent(f"{validated_response.optimized_prompt}\n\n{validation.to_repair_prompt()}",
+                                                     client, temperature, max_repairs - 1)
+            if repaired_response is None:
+                return
+            return FusedSqlPrompt(optimized_prompt = validated_response.optimized_prompt, **repaired_response.model_dump())
+        return validated_response
+
+
+    def generate_sql_response(self, text: str, client: Groq, agent_mode: str = "two_step", temperature: float= 0.0):
+        if agent_mode == "fused":
+            return self.fused_sql_agent(text, client, temperature)
+        
+        new_sql_prompt = self.prompt_agent(text, client, temperature = temperature)
+        return self.sql_query_agent(new_sql_prompt, client, temperature)
+
     
     def prompt_agent(self, text: str, client: Groq, cached_context: Dict = {}, temperature: float= 0.0):
 
-        prompt_context = ContextTexts.NOMINAL_CONTEXT.value.format(output_format = json.dumps(PromptGenerator.model_json_schema(), indent = 2)) 
+        output_format = prompt_registry.schema_json(PromptGenerator)
+        prompt_context = prompt_registry.prompt(ContextTexts.NOMINAL_CONTEXT, output_format = output_format).format()
         contextual_prompt = PromptTexts.NOMINAL_PROMPT_ASSISTANT.value.format(user_prompt = text)
         
         if cached_context:
             user_previous_prompts = list(cached_context.keys())
             previous_responses = list(cached_context.values())
-            prompt_context = ContextTexts.PREVIOUS_CONTEXT.value.format(user_previous_prompts = user_previous_prompts,
-                                                                        previous_responses = previous_responses,
-                                                                        output_format = json.dumps(PromptGenerator.model_json_schema(), indent = 2)
-                                                                        )
+            prompt_context = prompt_registry.prompt(ContextTexts.PREVIOUS_CONTEXT, output_format = output_format).format(
+                user_previous_prompts = user_previous_prompts,
+                previous_responses = previous_responses
+                )
             contextual_prompt = PromptTexts.PROMPT_ASSISTANT.value.format(user_prompt = text)
         
-            
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": prompt_context
-                    },
-                {
-                    "role": "user",
-                    "content": contextual_prompt,
-                    }
-            ],
-            model="mixtral-8x7b-32768",
-            temperature = temperature,
-            stream = False,
-            response_format = {"type": "json_object"}
-        )
-        parsed_content = json.loads(chat_completion.choices[0].message.content)
-
-        if "output" in parsed_content:
-            parsed_content = parsed_content["output"]
-
-        try:
-            validated_response = PromptGenerator.model_validate(parsed_content)
-            return validated_response
-        except ValidationError as e:
-            print(f"SQL Query Validation Error: \n{e}")
+        return self._cached_completion(prompt_context, contextual_prompt, client, PromptGenerator, temperature)
             
     
 
@@ -116,51 +240,27 @@ class MixtralAgents:
 
         df_buffer = io.StringIO()
         df.info(buf=df_buffer)
-        prompt_context = ContextTexts.STREAMLIT_NOMINAL_CONTEXT.value.format(output_format = json.dumps(StreamlitBot.model_json_schema(), indent = 2),
-                                                                             df = df.sample(20),
-                                                                             df_info = df_buffer.getvalue(),
-                                                                             df_description = df.describe(include = "all")
-                                                                             ) 
+        output_format = prompt_registry.schema_json(StreamlitBot)
+        prompt_context = prompt_registry.prompt(ContextTexts.STREAMLIT_NOMINAL_CONTEXT, output_format = output_format).format(
+            df = df.sample(20, random_state = 0),
+            df_info = df_buffer.getvalue(),
+            df_description = df.describe(include = "all")
+            )
         contextual_prompt = PromptTexts.STREAMLIT_NOMINAL_ASSISTANT.value.format(user_prompt = text)
         
         if cached_context:
             user_previous_prompts = list(cached_context.keys())
             previous_responses = list(cached_context.values())
-            prompt_context = ContextTexts.STREAMILT_PREVIOUS_CONTEXT.value.format(user_previous_prompts = user_previous_prompts,
-                                                                                  previous_responses = previous_responses,
-                                                                                  output_format = json.dumps(StreamlitBot.model_json_schema(), indent = 2),
-                                                                                  df = df.sample(20),
-                                                                                  df_info = df_buffer.getvalue(),
-                                                                                  df_description = df.describe(include = "all")
-                                                                                  )
+            prompt_context = prompt_registry.prompt(ContextTexts.STREAMILT_PREVIOUS_CONTEXT, output_format = output_format).format(
+                user_previous_prompts = user_previous_prompts,
+                previous_responses = previous_responses,
+                df = df.sample(20, random_state = 0),
+                df_info = df_buffer.getvalue(),
+                df_description = df.describe(include = "all")
+                )
             contextual_prompt = PromptTexts.STREAMLIT_ASSISTANT.value.format(user_prompt = text)
 
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": prompt_context
-                    },
-                {
-                    "role": "user",
-                    "content": contextual_prompt,
-                    }
-            ],
-            model="mixtral-8x7b-32768",
-            temperature = temperature,
-            stream = False,
-            response_format = {"type": "json_object"}
-        )
-        parsed_content = json.loads(chat_completion.choices[0].message.content)
-
-        if "output" in parsed_content:
-            parsed_content = parsed_content["output"]
-
-        try:
-            validated_response = StreamlitBot.model_validate(parsed_content)
-            return validated_response
-        except ValidationError as e:
-            print(f"SQL Query Validation Error: \n{e}")
+        return self._cached_completion(prompt_context, contextual_prompt, client, StreamlitBot, temperature)
     
     
     def get_mixtral_response(self, text: str,
@@ -172,31 +272,64 @@ class MixtralAgents:
                              max_retries: int = 3
                              ):
         num_retries = 0
+        cached_content = self.cache.get(MODEL_NAME, context, text, temperature)
+        content = cached_content
+        start = time.perf_counter()
 
-        while num_retries < max_retries:
+        # The rate limiter spaces the attempts; a rate-limit error pauses until the API's retry-after
+        while content is None and num_retries < max_retries:
             try:            
-                chat_completion = client.chat.completions.create(
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": context
-                            },
-                        {
-                            "role": "user",
-                            "content": text,
-                            }
-                    ],
-                    model="mixtral-8x7b-32768",
-                    temperature = temperature
-                )
+                chat_completion = self._create_chat_completion(client, context, text, temperature, retry_seconds)
+                content = chat_completion.choices[0].message.content
 
             except groq.RateLimitError as e:
-                print(f"You have hit the rate limit. Waiting {retry_seconds} seconds")
-                time.sleep(retry_seconds)
+                print("You have hit the rate limit. Retrying when the limit resets")
 
             num_retries += 1
 
-        parsed_content = chat_completion.choices[0].message.content
+        if content is None:
+            raise RuntimeError(f"No response from the LLM after {max_retries} attempts")
+        validated_response = self._parse_mixtral_content(content, output_format)
+
+        if cached_content is None and isinstance(validated_response, BaseModel):
+            self.cache.put(MODEL_NAME, context, text, temperature, content, time.perf_counter() - start)
+        return validated_response
+
+
+    async def get_mixtral_response_async(self, text: str,
+                                         context: str,
+                                         output_format: BaseModel,
+                                         client: AsyncGroq,
+                                         temperature: float= 0.0,
+                                         retry_seconds: int = 30,
+                                         max_retries: int = 3
+                                         ):
+        # Same as get_mixtral_response on an AsyncGroq client, so independent calls can overlap
+        num_retries = 0
+        cached_content = self.cache.get(MODEL_NAME, context, text, temperature)
+        content = cached_content
+        start = time.perf_counter()
+
+        while content is None and num_retries < max_retries:
+            try:
+                chat_completion = await self._create_chat_completion_async(client, context, text, temperature, retry_seconds)
+                content = chat_completion.choices[0].message.content
+
+            except groq.RateLimitError as e:
+                print("You have hit the rate limit. Retrying when the limit resets")
+
+            num_retries += 1
+
+        if content is None:
+            raise RuntimeError(f"No response from the LLM after {max_retries} attempts")
+        validated_response = self._parse_mixtral_content(content, output_format)
+
+        if cached_content is None and isinstance(validated_response, BaseModel):
+            self.cache.put(MODEL_NAME, context, text, temperature, content, time.perf_counter() - start)
+        return validated_response
+
+
+    def _parse_mixtral_content(self, parsed_content: str, output_format: BaseModel):
         print(f"{parsed_content = }")
         if "properties" in parsed_content:
             return parsed_content
@@ -211,8 +344,7 @@ class MixtralAgents:
             raise ValueError("Failed to decode the response as JSON. Please check the format.")
 
         try:    
-            validated_response = output_format.model_validate(parsed_content)
-            return validated_response
+            return output_format.model_validate(parsed_content)
         except ValidationError as e:
             print(f"SQL Query Validation Error: \n{e}")
 
@@ -228,20 +360,7 @@ class MixtralAgents:
                                                               )
         
             
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": "you are a helpful assistant."
-                    },
-                {
-                    "role": "user",
-                    "content": text,
-                    }
-            ],
-            model="mixtral-8x7b-32768",
-            temperature = temperature
-        )
+        chat_completion = self._create_chat_completion(client, "you are a helpful assistant.", text, temperature)
 
         return chat_completion.choices[0].message.content
 
@@ -253,6 +372,13 @@ class MixtralAgents:
 
         df = get_dataframe_from_query(sql_query)
         return df
+
+
+    def submit_agent_response(self, sql_response: SqlPrompt):
+        if sql_response.sql_query == "null":
+            return sql_response.normal_response
+        
+        return submit_query(sql_response.sql_query)
         
 
 
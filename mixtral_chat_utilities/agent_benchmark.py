@@ -0,0 +1,150 @@
+import argparse
+import json
+import statistics
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from mixtral_chat_utilities.completion_cache import CompletionCache
+from mixtral_chat_utilities.rate_limiter import TokenBucketRateLimiter
+
+
+AGENT_MODES = ['two_step', 'fused']
+
+DEFAULT_PROMPTS = [
+    "patients with highest heart rate",
+    "Give me information about women in their late 60s",
+    "average temperature by department",
+    "how many patients were admitted last week per diagnosis",
+    "What does a blood pressure of 140/90 mean?",
+]
+
+# Stand-in answers for --dry-run; the query must pass the local SQL validator
+DRY_RUN_SQL = "SELECT * FROM MISTRALHEALTHDB.MEDICALRECORDDATAMART.FLATTENED_MEDICAL_RECORDS LIMIT 10"
+
+
+class RecordingClient:
+    """
+    Wraps a Groq client and records latency and token usage of every completion.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self.chat = SimpleNamespace(completions=self)
+        self.calls: List[Dict[str, Any]] = []
+
+    def create(self, **kwargs):
+        start = time.perf_counter()
+        chat_completion = self._client.chat.completions.create(**kwargs)
+        usage = getattr(chat_completion, 'usage', None)
+        self.calls.append({
+            'seconds': time.perf_counter() - start,
+            'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or 0,
+            'completion_tokens': getattr(usage, 'completion_tokens', 0) or 0,
+        })
+        return chat_completion
+
+
+class DryRunClient:
+    """
+    Answers without calling Groq, estimating tokens as characters / 4.
+
+    Shows how much context each mode sends without spending quota; latency
+    needs the real API.
+    """
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, messages: List[Dict[str, str]], **kwargs):
+        system = messages[0]['content']
+        if '"optimized_prompt"' in system and '"sql_query"' in system:
+            content = {'optimized_prompt': messages[-1]['content'][-80:], 'sql_query': DRY_RUN_SQL, 'normal_response': 'null'}
+        elif '"optimized_prompt"' in system:
+            content = {'optimized_prompt': messages[-1]['content'][-80:]}
+        else:
+            content = {'sql_query': DRY_RUN_SQL, 'normal_response': 'null'}
+        content = json.dumps(content)
+        prompt_characters = sum(len(message['content']) for message in messages)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=prompt_characters // 4, completion_tokens=len(content) // 4),
+        )
+
+
+def run_benchmark(prompts: List[str], client, repeats: int = 1,
+                  rate_limiter: Optional[TokenBucketRateLimiter] = None) -> List[Dict[str, Any]]:
+    """
+    Times the two-step prompt rewrite + SQL chain against the fused single call.
+
+    The completion cache is bypassed so every run pays the LLM round trips.
+
+    Args:
+        prompts (List[str]): User prompts to answer
+        client: Groq client, or a DryRunClient
+        repeats (int): Runs per prompt and mode
+        rate_limiter (Optional[TokenBucketRateLimiter]): Limiter to use instead of the shared one
+
+    Returns:
+        List[Dict[str, Any]]: One result per mode with latency and token usage per prompt
+    """
+    from mixtral_chat import MixtralAgents
+
+    if rate_limiter is None:
+        agents = MixtralAgents(cache=CompletionCache(max_entries=0))
+    else:
+        agents = MixtralAgents(cache=CompletionCache(max_entries=0), rate_limiter=rate_limiter)
+    results = []
+    for agent_mode in AGENT_MODES:
+        runs = []
+        for prompt in prompts:
+            for _ in range(repeats):
+                recorder = RecordingClient(client)
+                start = time.perf_counter()
+                response = agents.generate_sql_response(prompt, recorder, agent_mode)
+                runs.append({
+                    'seconds': time.perf_counter() - start,
+                    'calls': len(recorder.calls),
+                    'prompt_tokens': sum(call['prompt_tokens'] for call in recorder.calls),
+                    'completion_tokens': sum(call['completion_tokens'] for call in recorder.calls),
+                    'answered': response is not None,
+                })
+        results.append({
+            'mode': agent_mode,
+            'runs': len(runs),
+            'median_seconds': statistics.median(run['seconds'] for run in runs),
+            'p90_seconds': sorted(run['seconds'] for run in runs)[int(0.9 * (len(runs) - 1))],
+            'calls': statistics.mean(run['calls'] for run in runs),
+            'prompt_tokens': statistics.mean(run['prompt_tokens'] for run in runs),
+            'completion_tokens': statistics.mean(run['completion_tokens'] for run in runs),
+            'answered': sum(run['answered'] for run in runs),
+        })
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare the two-step prompt rewrite + SQL chain with the fused single call.")
+    parser.add_argument('--prompts', nargs='*', default=DEFAULT_PROMPTS, help="User prompts to answer")
+    parser.add_argument('--repeats', type=int, default=1, help="Runs per prompt and mode")
+    parser.add_argument('--dry-run', action='store_true', help="Estimate token usage without calling Groq")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    rate_limiter = None
+    if args.dry_run:
+        client = DryRunClient()
+        # No quota is spent, so the estimates aren't paced by the account's rate limit
+        rate_limiter = TokenBucketRateLimiter(requests_per_minute=1e9, tokens_per_minute=1e12)
+    else:
+        from mixtral_chat import client
+
+    results = run_benchmark(args.prompts, client, args.repeats, rate_limiter)
+    for result in results:
+        print(f"{result['mode']:>8}: median {result['median_seconds']:.2f}s, p90 {result['p90_seconds']:.2f}s, "
+              f"{result['calls']:.1f} calls, {result['prompt_tokens']:,.0f} prompt + {result['completion_tokens']:,.0f} "
+              f"completion tokens per prompt, {result['answered']}/{result['runs']} answered")
+    two_step, fused = results
+    print(f"Fused: {fused['median_seconds'] / max(two_step['median_seconds'], 1e-9):.2f}x latency, "
+          f"{fused['prompt_tokens'] / max(two_step['prompt_tokens'], 1):.2f}x prompt tokens")
@@ -0,0 +1,217 @@
+from typing import Callable, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+from mixtral_chat_utilities.query_stats import QueryTrace
+from mixtral_chat_utilities.result_limits import mark_truncated
+
+
+def fetch_arrow_table(cursor) -> Optional[pa.Table]:
+    """
+    Fetches the result of an executed cursor as one Arrow table.
+
+    Uses the Snowflake connector's fetch_arrow_all, which downloads the result
+    chunks as Arrow record batches instead of converting every row into a Python
+    tuple, or DuckDB's fetch_arrow_table for local runs. Returns None for drivers
+    without an Arrow fetch so the caller can fall back to fetchall.
+    """
+    if hasattr(cursor, 'fetch_arrow_all'):
+        return cursor.fetch_arrow_all(force_return_table=True)
+    if hasattr(cursor, 'fetch_arrow_table'):
+        return cursor.fetch_arrow_table()
+    return None
+
+
+def _pandas_column(column: pa.ChunkedArray) -> pa.ChunkedArray:
+    column_type = column.type
+    if pa.types.is_decimal(column_type):
+        # NUMBER(p, 0) is an INTEGER column, any other scale is fractional
+        return column.cast(pa.int64() if column_type.scale == 0 else pa.float64())
+    if pa.types.is_integer(column_type) and column_type != pa.int64():
+        # Snowflake sends INTEGER columns in the narrowest width that fits the values
+        return column.cast(pa.int64())
+    if pa.types.is_timestamp(column_type) and column_type.unit != 'ns':
+        # TIMESTAMP_NTZ arrives with the column's precision; pd.read_sql returns datetime64[ns]
+        return column.cast(pa.timestamp('ns', tz=column_type.tz))
+    return column
+
+
+def arrow_table_to_dataframe(table: pa.Table, normalize_name: Optional[Callable[[str], str]] = None) -> pd.DataFrame:
+    """
+    Builds a DataFrame column-wise from an Arrow result.
+
+    Column dtypes match what pd.read_sql returns for FLATTENED_MEDICAL_RECORDS:
+    TIMESTAMP_NTZ -> datetime64[ns], FLOAT -> float64 and INTEGER -> int64, or
+    the nullable Int64 when the column has NULLs so the values aren't turned
+    into floats. Arrow buffers are released while the frame is built, so peak
+    memory stays close to the size of the DataFrame.
+
+    Args:
+        table (pa.Table): Query result
+        normalize_name (Optional[Callable[[str], str]]): Maps result column names,
+            e.g. the SQLAlchemy dialect's normalize_name, which lower-cases
+            Snowflake's upper-case identifiers
+
+    Returns:
+        pd.DataFrame: The result with one column per result column
+    """
+    columns = [_pandas_column(column) for column in table.columns]
+    names = [normalize_name(name) or name for name in table.column_names] if normalize_name else table.column_names
+    nullable_integers = {
+        name: column.to_pandas(types_mapper=lambda arrow_type: pd.Int64Dtype())
+        for name, column in zip(names, columns)
+        if pa.types.is_integer(column.type) and column.null_count
+    }
+    table = pa.table(
+        [column for name, column in zip(names, columns) if name not in nullable_integers],
+        names=[name for name in names if name not in nullable_integers],
+    )
+    del columns
+
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    del table
+    for name, values in nullable_integers.items():
+        df[name] = values.array
+    return df[names] if nullable_integers else df
+
+
+def iter_arrow_tables(cursor, chunk_rows: int = 100_000) -> Iterator[pa.Table]:
+    """
+    Yields the result of an executed cursor in Arrow chunks.
+
+    The Snowflake connector yields one table per downloaded result chunk and
+    DuckDB one per `chunk_rows` rows; other drivers are read with fetchmany.
+    Stopping the iteration early leaves the rest of the result unfetched.
+    """
+    if hasattr(cursor, 'fetch_arrow_batches'):
+        yield from cursor.fetch_arrow_batches()
+    elif hasattr(cursor, 'fetch_record_batch'):
+        for batch in cursor.fetch_record_batch(chunk_rows):
+            yield pa.Table.from_batches([batch])
+    else:
+        names = _column_names(cursor)
+        while rows := cursor.fetchmany(chunk_rows):
+            yield pa.Table.from_pandas(pd.DataFrame.from_records(rows, columns=names), preserve_index=False)
+
+
+def _column_names(cursor, normalize_name: Optional[Callable[[str], str]] = None) -> List[str]:
+    names = [description[0] for description in cursor.description]
+    if normalize_name:
+        names = [normalize_name(name) or name for name in names]
+    return names
+
+
+def _execute(cursor, query: str, timeout: Optional[float]):
+    if timeout is not None and hasattr(cursor, 'fetch_arrow_all'):
+        cursor.execute(query, timeout=int(timeout))
+    else:
+        cursor.execute(query)
+
+
+def read_arrow(query: str, connection, normalize_name: Optional[Callable[[str], str]] = None,
+               timeout: Optional[float] = None, max_rows: Optional[int] = None,
+               max_bytes: Optional[int] = None, trace: Optional[QueryTrace] = None) -> pd.DataFrame:
+    """
+    Runs a query on a DB-API connection and returns the result as a DataFrame,
+    fetched through Arrow when the driver supports it.
+
+    The result is fetched chunk by chunk and fetching stops once `max_rows` rows
+    or `max_bytes` bytes of Arrow data have been read, so an unbounded query
+    can't exhaust memory. A truncated result is marked with mark_truncated.
+
+    Args:
+        query (str): SQL query
+        connection: DB-API connection, e.g. a pooled SQLAlchemy connection's `.connection`
+        normalize_name (Optional[Callable[[str], str]]): See arrow_table_to_dataframe
+        timeout (Optional[float]): Seconds after which the Snowflake connector
+            cancels the query on the warehouse; ignored by other drivers
+        max_rows (Optional[int]): Row cap, None for no cap
+        max_bytes (Optional[int]): Cap on the fetched Arrow data, None for no cap
+        trace (Optional[QueryTrace]): Receives the execute, fetch and build times,
+            the Arrow bytes fetched and the Snowflake query ID
+
+    Returns:
+        pd.DataFrame: The query result
+    """
+    trace = trace or QueryTrace(query)
+    cursor = connection.cursor()
+    try:
+        with trace.phase('execute'):
+            _execute(cursor, query, timeout)
+        trace.query_id = getattr(cursor, 'sfqid', None)
+        if max_rows is None and max_bytes is None and hasattr(cursor, 'fetch_arrow_all'):
+            with trace.phase('fetch'):
+                table = cursor.fetch_arrow_all(force_return_table=True)
+            trace.bytes = table.nbytes
+            with trace.phase('build'):
+                return arrow_table_to_dataframe(table, normalize_name)
+
+        tables = []
+        rows = 0
+        nbytes = 0
+        truncated = None
+        chunks = iter_arrow_tables(cursor)
+        while True:
+            with trace.phase('fetch'):
+                table = next(chunks, None)
+            if table is None:
+                break
+            nbytes += table.nbytes
+            if max_rows is not None and rows + table.num_rows > max_rows:
+                tables.append(table.slice(0, max_rows - rows))
+                truncated = 'rows'
+                break
+            tables.append(table)
+            rows += table.num_rows
+            if max_bytes is not None and nbytes >= max_bytes:
+                with trace.phase('fetch'):
+                    if next(chunks, None) is not None:
+                        truncated = 'bytes'
+                break
+        trace.bytes = nbytes
+
+        if not tables:
+            return pd.DataFrame(columns=_column_names(cursor, normalize_name))
+        with trace.phase('build'):
+            df = arrow_table_to_dataframe(pa.concat_tables(tables, promote_options='permissive'), normalize_name)
+        if truncated:
+            print(f"Result truncated at {len(df)} rows ({truncated} cap)")
+            mark_truncated(df, truncated, max_rows, max_bytes)
+        return df
+    finally:
+        cursor.close()
+
+
+def iter_dataframe_chunks(query: str, connection, normalize_name: Optional[Callable[[str], str]] = None,
+                          timeout: Optional[float] = None, max_rows: Optional[int] = None,
+                          chunk_rows: int = 100_000) -> Iterator[pd.DataFrame]:
+    """
+    Runs a query and yields its result as DataFrame chunks, so the consumer can
+    stop as soon as it has the rows it needs.
+
+    Args:
+        query (str): SQL query
+        connection: DB-API connection
+        normalize_name (Optional[Callable[[str], str]]): See arrow_table_to_dataframe
+        timeout (Optional[float]): See read_arrow
+        max_rows (Optional[int]): Rows after which no more chunks are yielded
+        chunk_rows (int): Rows per chunk for drivers that don't chunk the result themselves
+
+    Yields:
+        pd.DataFrame: The next chunk of the result
+    """
+    cursor = connection.cursor()
+    try:
+        _execute(cursor, query, timeout)
+        rows = 0
+        for table in iter_arrow_tables(cursor, chunk_rows):
+            if max_rows is not None and rows + table.num_rows > max_rows:
+                table = table.slice(0, max_rows - rows)
+            rows += table.num_rows
+            if table.num_rows:
+                yield arrow_table_to_dataframe(table, normalize_name)
+            if max_rows is not None and rows >= max_rows:
+                return
+    finally:
+        cursor.close()
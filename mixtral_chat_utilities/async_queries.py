@@ -0,0 +1,181 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import pandas as pd
+
+
+class QueryStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class QueryHandle:
+    """
+    Status handle of a submitted query.
+
+    The page keeps the handle, or just its id, and polls it on every rerun
+    instead of blocking the script thread until the warehouse answers.
+    """
+
+    def __init__(self, sql: str):
+        self.id = uuid.uuid4().hex
+        self.sql = sql
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._future: Optional[Future] = None
+
+    @property
+    def status(self) -> QueryStatus:
+        future = self._future
+        if future.cancelled():
+            return QueryStatus.CANCELLED
+        if not future.done():
+            return QueryStatus.RUNNING if self.started_at is not None else QueryStatus.QUEUED
+        return QueryStatus.FAILED if future.exception() is not None else QueryStatus.SUCCEEDED
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def poll(self) -> QueryStatus:
+        return self.status
+
+    @property
+    def elapsed(self) -> float:
+        """
+        Seconds the query has been running, or ran for.
+        """
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def error(self) -> Optional[str]:
+        if not self._future.done() or self._future.cancelled():
+            return None
+        exception = self._future.exception()
+        return str(exception) if exception is not None else None
+
+    def result(self, timeout: Optional[float] = None) -> pd.DataFrame:
+        """
+        Waits for the query and returns its DataFrame.
+
+        Raises:
+            TimeoutError: The query hasn't finished within `timeout` seconds
+            CancelledError: The query was cancelled before it started
+        """
+        return self._future.result(timeout)
+
+    async def wait(self) -> pd.DataFrame:
+        """
+        Awaits the query from asyncio code without blocking the event loop.
+        """
+        return await asyncio.wrap_future(self._future)
+
+    def cancel(self) -> bool:
+        """
+        Cancels the query if it hasn't started yet.
+
+        Returns:
+            bool: Whether the query was cancelled
+        """
+        return self._future.cancel()
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status.value,
+            "elapsed": self.elapsed,
+            "error": self.error,
+        }
+
+
+class AsyncQueryClient:
+    """
+    Runs queries on a worker pool and hands back status handles.
+
+    Handles are kept by id so a Streamlit session can store just the ids in
+    st.session_state and look them up again after a rerun; the oldest finished
+    handles are forgotten once more than `max_handles` are kept.
+
+    Args:
+        run_query (Callable[..., pd.DataFrame]): Runs one query, e.g. get_dataframe_from_query
+        max_workers (int): Queries running at the same time across all sessions
+        max_handles (int): Handles kept for lookup by id
+    """
+
+    def __init__(self, run_query: Callable[..., pd.DataFrame], max_workers: int = 4, max_handles: int = 500):
+        self.run_query = run_query
+        self.max_handles = max_handles
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="async-query")
+        self._handles: "OrderedDict[str, QueryHandle]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _run(self, handle: QueryHandle, kwargs: Dict[str, Any]) -> pd.DataFrame:
+        handle.started_at = time.time()
+        try:
+            return self.run_query(handle.sql, **kwargs)
+        finally:
+            handle.finished_at = time.time()
+
+    def submit(self, sql: str, **kwargs) -> QueryHandle:
+        """
+        Queues a query and returns its handle immediately.
+
+        Args:
+            sql (str): Query to run
+            **kwargs: Passed on to run_query
+
+        Returns:
+            QueryHandle: Handle to poll, await or cancel
+        """
+        handle = QueryHandle(sql)
+        handle._future = self._pool.submit(self._run, handle, kwargs)
+        with self._lock:
+            self._handles[handle.id] = handle
+            self._forget_finished()
+        return handle
+
+    def _forget_finished(self):
+        for handle_id in list(self._handles):
+            if len(self._handles) <= self.max_handles:
+                return
+            if self._handles[handle_id].done():
+                del self._handles[handle_id]
+
+    def get(self, handle_id: str) -> Optional[QueryHandle]:
+        with self._lock:
+            return self._handles.get(handle_id)
+
+    def poll(self, handle_ids: Iterable[str]) -> Dict[str, QueryStatus]:
+        """
+        Returns the status of several queries, e.g. all of a dashboard's.
+        """
+        statuses = {}
+        for handle_id in handle_ids:
+            handle = self.get(handle_id)
+            statuses[handle_id] = handle.status if handle is not None else QueryStatus.CANCELLED
+        return statuses
+
+    def cancel(self, handle_ids: Iterable[str]) -> int:
+        """
+        Cancels the queries that haven't started.
+
+        Returns:
+            int: Number of queries cancelled
+        """
+        cancelled = 0
+        for handle_id in handle_ids:
+            handle = self.get(handle_id)
+            if handle is not None and handle.cancel():
+                cancelled += 1
+        return cancelled
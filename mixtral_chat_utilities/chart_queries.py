@@ -0,0 +1,116 @@
+import re
+from typing import Dict, Iterable, Optional
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+
+from mixtral_chat_utilities.sql_fingerprint import DIALECT
+
+
+# Rows per value or bin in a pre-aggregated histogram
+CHART_COUNT_COLUMN = 'row_count'
+
+HISTOGRAM_BINS = 50
+
+# Heatmap cells drawn by plot_heatmap (its num_vals)
+HEATMAP_TOP_N = 10
+
+# Parameter names of the plot functions, followed by the names ChartReference advertises to the LLM
+CHART_COLUMN_NAMES = {
+    'radar_chart': {'label': ('unique_label_col', 'unique_col'), 'value': ('aggregated_values_column', 'aggregated_column')},
+    'pie_chart': {'label': ('names',), 'value': ('values',)},
+    'heatmap': {'x': ('x_col',), 'y': ('y_col',), 'value': ('values',)},
+    'histogram': {'value': ('col', 'x_col')},
+}
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_$]*$')
+
+
+def _quote(column: str) -> Optional[str]:
+    # Result columns come back lower-cased from Snowflake's upper-case names, so
+    # lower-case names are quoted in upper case to refer to the same column
+    if not isinstance(column, str) or not _IDENTIFIER.match(column):
+        return None
+    return f'"{column.upper()}"' if column == column.lower() else f'"{column}"'
+
+
+def _column(chart_columns: Dict, names) -> Optional[str]:
+    for name in names:
+        if chart_columns.get(name):
+            return chart_columns[name]
+    return None
+
+
+def _chart_source(sql: str) -> Optional[str]:
+    # The topic query becomes a subquery through sqlglot, so its comments, literals
+    # and trailing semicolon can't break out of the parentheses
+    if not sql:
+        return None
+    try:
+        expression = sqlglot.parse_one(sql, read=DIALECT)
+    except SqlglotError:
+        return None
+    if not isinstance(expression, exp.Query):
+        return None
+    return expression.subquery('_chart_source').sql(dialect=DIALECT)
+
+
+def aggregate_query_for_chart(sql: str, chart_type: str, chart_columns: Dict,
+                              numeric_columns: Optional[Iterable[str]] = None,
+                              histogram_bins: int = HISTOGRAM_BINS) -> Optional[str]:
+    """
+    Wraps a topic query so the warehouse returns only the rows a chart draws.
+
+    - radar_chart: one row per label with the summed value, as plot_radar_chart groups
+    - pie_chart: one row per name with the summed value, which px.pie would sum anyway
+    - heatmap: the top rows by value, as plot_heatmap keeps with nlargest
+    - histogram: row counts per bin for numeric columns, or per value otherwise,
+      in CHART_COUNT_COLUMN; plot_histogram weights the bars with it
+
+    Aggregated values must be numeric, which is only known from an earlier result
+    of the topic query, so without `numeric_columns` nothing is rewritten. Neither
+    is a topic query sqlglot can't parse as a single query.
+
+    Args:
+        sql (str): Topic query
+        chart_type (str): Chart type from GenerateCharts
+        chart_columns (Dict): Chart columns from GenerateCharts
+        numeric_columns (Optional[Iterable[str]]): Numeric columns of the topic result
+        histogram_bins (int): Bins of a numeric histogram
+
+    Returns:
+        Optional[str]: The aggregating query, or None if the chart needs the raw rows
+    """
+    if chart_type not in CHART_COLUMN_NAMES or numeric_columns is None or not chart_columns:
+        return None
+    numeric_columns = set(numeric_columns)
+    columns = {role: _column(chart_columns, names) for role, names in CHART_COLUMN_NAMES[chart_type].items()}
+    quoted = {role: _quote(column) for role, column in columns.items()}
+    if None in quoted.values():
+        return None
+    if chart_type != 'histogram' and columns['value'] not in numeric_columns:
+        return None
+
+    source = _chart_source(sql)
+    if source is None:
+        return None
+    value = quoted['value']
+    if chart_type in ('radar_chart', 'pie_chart'):
+        label = quoted['label']
+        return (f"SELECT {label}, SUM({value}) AS {value} FROM {source} "
+                f"GROUP BY {label} ORDER BY {value} DESC")
+    if chart_type == 'heatmap':
+        return (f"SELECT {quoted['x']}, {quoted['y']}, {value} FROM {source} "
+                f"WHERE {value} IS NOT NULL ORDER BY {value} DESC LIMIT {HEATMAP_TOP_N}")
+
+    if columns['value'] not in numeric_columns:
+        return (f"SELECT {value}, COUNT(*) AS {CHART_COUNT_COLUMN} FROM {source} "
+                f"GROUP BY {value} ORDER BY {value}")
+    # Equal-width bins between the column's min and max, labelled by their lower edge
+    bin_width = f"NULLIF((_chart_max - _chart_min) / {histogram_bins}, 0)"
+    return (f"SELECT COALESCE(_chart_min + LEAST(FLOOR((_chart_value - _chart_min) / {bin_width}), {histogram_bins - 1}) "
+            f"* {bin_width}, _chart_min) AS {value}, COUNT(*) AS {CHART_COUNT_COLUMN} "
+            f"FROM (SELECT {value} AS _chart_value, MIN({value}) OVER () AS _chart_min, MAX({value}) OVER () AS _chart_max "
+            f"FROM {source} WHERE {value} IS NOT NULL) AS _chart_binned "
+            f"GROUP BY 1 ORDER BY 1")
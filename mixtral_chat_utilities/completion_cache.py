@@ -0,0 +1,173 @@
+import hashlib
+import json
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class HashingEmbedder:
+    """
+    Local stand-in for an embedding model: hashed word and character trigram counts.
+
+    Catches rephrasings that differ in case, punctuation, word order or small
+    typos, not synonyms. Any callable returning a vector can be used instead,
+    e.g. a sentence-transformers model's encode.
+
+    Args:
+        dimensions (int): Size of the vectors
+    """
+
+    def __init__(self, dimensions: int = 1024):
+        self.dimensions = dimensions
+
+    def __call__(self, text: str) -> np.ndarray:
+        words = re.findall(r"\w+", text.lower())
+        features = words + [f"#{word[i:i + 3]}" for word in words for i in range(max(len(word) - 2, 1))]
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature in features:
+            vector[zlib.crc32(feature.encode()) % self.dimensions] += 1.0
+        return vector
+
+
+class CompletionEntry:
+
+    def __init__(self, scope: str, text: str, content: str, stored_at: float, seconds: float,
+                 vector: Optional[np.ndarray]):
+        self.scope = scope
+        self.text = text
+        self.content = content
+        self.stored_at = stored_at
+        self.seconds = seconds
+        self.vector = vector
+
+
+class CompletionCache:
+    """
+    Caches LLM completions keyed on (model, system context hash, user text, temperature).
+
+    Entries expire after `ttl_seconds` and the least recently used ones are
+    evicted beyond `max_entries`. With an `embedder`, a miss falls back to the
+    most similar cached user text with the same model, system context and
+    temperature, if its cosine similarity is at least `similarity_threshold`.
+    Near-duplicate hits return the answer to a slightly different question, so
+    keep the threshold high: "highest heart rate" and "lowest heart rate" are
+    close in any embedding.
+
+    Args:
+        max_entries (int): Completions kept
+        ttl_seconds (float): Age after which a completion is no longer returned
+        embedder (Optional[Callable[[str], np.ndarray]]): Embeds user texts for near-duplicate lookup
+        similarity_threshold (float): Minimum cosine similarity of a near-duplicate hit
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 24 * 3600,
+                 embedder: Optional[Callable[[str], np.ndarray]] = None, similarity_threshold: float = 0.97):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[str, CompletionEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def _scope(model: str, context: str, temperature: float) -> str:
+        return json.dumps([model, _digest(context), temperature])
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        if self.embedder is None:
+            return None
+        vector = np.asarray(self.embedder(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _is_fresh(self, key: str, entry: CompletionEntry, now: float) -> bool:
+        if now - entry.stored_at <= self.ttl_seconds:
+            return True
+        del self._entries[key]
+        self.expirations += 1
+        return False
+
+    def _nearest(self, scope: str, vector: np.ndarray, now: float) -> Tuple[Optional[str], float]:
+        best_key, best_similarity = None, -1.0
+        for key, entry in list(self._entries.items()):
+            if entry.scope != scope or entry.vector is None or not self._is_fresh(key, entry, now):
+                continue
+            similarity = float(np.dot(vector, entry.vector))
+            if similarity > best_similarity:
+                best_key, best_similarity = key, similarity
+        return best_key, best_similarity
+
+    def get(self, model: str, context: str, text: str, temperature: float) -> Optional[str]:
+        """
+        Returns the cached completion content, or None on a miss.
+        """
+        scope = self._scope(model, context, temperature)
+        key = _digest(json.dumps([scope, text]))
+        vector = self._embed(text) if self.embedder is not None else None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_fresh(key, entry, now):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.saved_seconds += entry.seconds
+                return entry.content
+
+            if vector is not None:
+                nearest_key, similarity = self._nearest(scope, vector, now)
+                if nearest_key is not None and similarity >= self.similarity_threshold:
+                    entry = self._entries[nearest_key]
+                    self._entries.move_to_end(nearest_key)
+                    self.semantic_hits += 1
+                    self.saved_seconds += entry.seconds
+                    print(f"Reusing the completion of a similar prompt ({similarity:.3f}): {entry.text[:80]}")
+                    return entry.content
+            self.misses += 1
+            return None
+
+    def put(self, model: str, context: str, text: str, temperature: float, content: str, seconds: float = 0.0):
+        """
+        Stores a completion; `seconds` is the round trip a later hit saves.
+        """
+        scope = self._scope(model, context, temperature)
+        key = _digest(json.dumps([scope, text]))
+        entry = CompletionEntry(scope, text, content, time.time(), seconds, self._embed(text))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'saved_seconds': self.saved_seconds,
+            }
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from sqlalchemy import create_engine, event, Engine
+
+
+class ConnectionManager:
+    """
+    Long-lived, sized SQLAlchemy connection pool shared by the chat and dashboard pages.
+
+    Connections are pre-pinged on checkout so stale ones are replaced transparently,
+    recycled after `pool_recycle` seconds, and Snowflake sessions are kept alive
+    between queries so a query only pays for the login handshake when the pool
+    has to open a new connection. Every checkout is timed.
+    """
+
+    def __init__(self, url: str, pool_size: int = 5, max_overflow: int = 5,
+                 pool_timeout: float = 30, pool_recycle: int = 3600,
+                 connect_args: Optional[Dict[str, Any]] = None, history_size: int = 100):
+        self.engine: Engine = create_engine(
+            url,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_recycle=pool_recycle,
+            pool_pre_ping=True,
+            connect_args=connect_args or {},
+        )
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+        self.connections_invalidated = 0
+        self.checkouts = 0
+        self.checkout_seconds = 0.0
+        self.max_checkout_seconds = 0.0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        # (checkout seconds, opened a new connection) of the latest checkouts
+        self.recent_checkouts = deque(maxlen=history_size)
+
+        event.listen(self.engine, 'connect', self._on_connect)
+        event.listen(self.engine, 'invalidate', self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        connection_record.info['checkouts'] = 0
+        with self._lock:
+            self.connections_opened += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.connections_invalidated += 1
+
+    @contextmanager
+    def connection(self):
+        """
+        Checks a connection out of the pool for one query and returns it afterwards.
+        """
+        checkout_start = time.perf_counter()
+        conn = self.engine.connect()
+        checkout_seconds = time.perf_counter() - checkout_start
+        new_connection = conn.info['checkouts'] == 0
+        conn.info['checkouts'] += 1
+
+        with self._lock:
+            self.checkouts += 1
+            self.checkout_seconds += checkout_seconds
+            self.max_checkout_seconds = max(self.max_checkout_seconds, checkout_seconds)
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.recent_checkouts.append((checkout_seconds, new_connection))
+
+        try:
+            yield conn
+        finally:
+            conn.close()
+            with self._lock:
+                self.checked_out -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        pool = self.engine.pool
+        with self._lock:
+            return {
+                'pool_size': pool.size(),
+                'idle_connections': pool.checkedin(),
+                'checked_out': self.checked_out,
+                'max_checked_out': self.max_checked_out,
+                'connections_opened': self.connections_opened,
+                'connections_invalidated': self.connections_invalidated,
+                'checkouts': self.checkouts,
+                'mean_checkout_ms': self.checkout_seconds / self.checkouts * 1000 if self.checkouts else 0.0,
+                'max_checkout_ms': self.max_checkout_seconds * 1000,
+            }
+
+    def dispose(self):
+        """
+        Closes every pooled connection, e.g. at shutdown or after a credentials change.
+        """
+        self.engine.dispose()
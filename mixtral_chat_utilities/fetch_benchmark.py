@@ -0,0 +1,157 @@
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import tempfile
+import time
+import warnings
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+
+FLATTENED_MEDICAL_RECORDS_QUERY = "SELECT * FROM FLATTENED_MEDICAL_RECORDS"
+
+# Synthetic FLATTENED_MEDICAL_RECORDS rows with the table's column types,
+# see SQL_Scripts/create_flattened_table.txt
+DUCKDB_FLATTENED_MEDICAL_RECORDS_SQL = """
+    CREATE TABLE FLATTENED_MEDICAL_RECORDS AS
+    SELECT
+        uuid()::VARCHAR AS record_id,
+        (60 + i % 40)::INTEGER AS heart_rate,
+        (110 + i % 30)::VARCHAR || '/' || (70 + i % 20)::VARCHAR AS blood_pressure,
+        (36.1 + (i % 20) / 10)::DOUBLE AS temperature,
+        (12 + i % 8)::INTEGER AS respiratory_rate,
+        (95 + i % 5)::INTEGER AS oxygen_saturation,
+        TIMESTAMP '2024-01-01' + INTERVAL (i) SECOND AS created_at,
+        uuid()::VARCHAR AS patient_id,
+        'Patient ' || (i % 50000)::VARCHAR AS patient_name,
+        DATE '1950-01-01' + (i % 20000)::INTEGER AS date_of_birth,
+        (i % 90)::INTEGER AS age,
+        CASE i % 2 WHEN 0 THEN 'Male' ELSE 'Female' END AS gender,
+        CASE i % 4 WHEN 0 THEN 'A+' WHEN 1 THEN 'B+' WHEN 2 THEN 'O-' ELSE 'AB+' END AS blood_type,
+        'Diagnosis ' || (i % 200)::VARCHAR AS diagnosis,
+        'Treatment plan for diagnosis ' || (i % 200)::VARCHAR AS treatment_plan,
+        'Medication ' || (i % 100)::VARCHAR AS medication,
+        'Allergy ' || (i % 10)::VARCHAR AS allergies,
+        'Insurer ' || (i % 20)::VARCHAR AS insurance_provider,
+        'INS-' || i::VARCHAR AS insurance_id,
+        'Dr. ' || (i % 300)::VARCHAR AS attending_physician,
+        'Department ' || (i % 12)::VARCHAR AS department,
+        TIMESTAMP '2024-01-01' + INTERVAL (i) MINUTE AS admission_date,
+        TIMESTAMP '2024-01-02' + INTERVAL (i) MINUTE AS discharge_date,
+        TIMESTAMP '2024-01-01' + INTERVAL (i) SECOND AS last_updated_at
+    FROM range(?) AS t(i)
+"""
+
+METHODS = ['read_sql', 'arrow']
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _fetch(method: str, query: str, database: Optional[str]) -> pd.DataFrame:
+    if database is None:
+        from mixtral_chat_utilities.mixtral_tools import get_dataframe_from_query
+        return get_dataframe_from_query(query, arrow=method == 'arrow')
+
+    import duckdb
+    from mixtral_chat_utilities.arrow_fetch import read_arrow
+    with duckdb.connect(database, read_only=True) as conn:
+        if method == 'arrow':
+            return read_arrow(query, conn)
+        with warnings.catch_warnings():
+            # pandas warns about DB-API connections other than sqlite3; it reads them the same way
+            warnings.simplefilter('ignore', UserWarning)
+            return pd.read_sql(query, conn)
+
+
+def _run_method(method: str, query: str, database: Optional[str], results):
+    baseline_mb = _peak_rss_mb()
+    start = time.perf_counter()
+    df = _fetch(method, query, database)
+    seconds = time.perf_counter() - start
+    results.put({
+        'method': method,
+        'rows': len(df),
+        'seconds': seconds,
+        'rows_per_second': len(df) / seconds if seconds else 0.0,
+        'peak_memory_mb': _peak_rss_mb() - baseline_mb,
+        'frame_memory_mb': df.memory_usage(deep=True).sum() / 1024 ** 2,
+        'dtypes': df.dtypes.astype(str).to_dict(),
+    })
+
+
+def run_benchmark(query: str, database: Optional[str] = None, repeats: int = 3) -> List[Dict[str, Any]]:
+    """
+    Times pd.read_sql against the Arrow fetch path.
+
+    Every run happens in a fresh process so the peak memory of one method isn't
+    hidden by memory the allocator kept from a previous run.
+
+    Args:
+        query (str): Query to fetch
+        database (Optional[str]): Local DuckDB file, or None for the Snowflake warehouse
+        repeats (int): Runs per method, the fastest is reported
+
+    Returns:
+        List[Dict[str, Any]]: One result per method with rows/s and peak memory
+    """
+    context = mp.get_context('spawn')
+    best = []
+    for method in METHODS:
+        runs = []
+        for _ in range(repeats):
+            results = context.Queue()
+            process = context.Process(target=_run_method, args=(method, query, database, results))
+            process.start()
+            runs.append(results.get())
+            process.join()
+        best.append(min(runs, key=lambda run: run['seconds']))
+    return best
+
+
+def create_duckdb_table(database: str, rows: int):
+    """
+    Writes a synthetic FLATTENED_MEDICAL_RECORDS table to a DuckDB file.
+    """
+    import duckdb
+    with duckdb.connect(database) as conn:
+        conn.execute(DUCKDB_FLATTENED_MEDICAL_RECORDS_SQL, [rows])
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare pd.read_sql with the Arrow fetch path for warehouse queries.")
+    parser.add_argument('--rows', type=int, default=1_000_000, help="Rows in the local FLATTENED_MEDICAL_RECORDS table")
+    parser.add_argument('--repeats', type=int, default=3, help="Runs per method")
+    parser.add_argument('--snowflake', action='store_true', help="Query the configured Snowflake warehouse instead of a local DuckDB table")
+    parser.add_argument('--query', default=None, help="Query to fetch, defaults to the whole FLATTENED_MEDICAL_RECORDS table")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    query = args.query or (FLATTENED_MEDICAL_RECORDS_QUERY if args.snowflake
+                           else f"{FLATTENED_MEDICAL_RECORDS_QUERY} LIMIT {args.rows}")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        database = None
+        if not args.snowflake:
+            database = os.path.join(temp_dir, 'flattened_medical_records.duckdb')
+            create_duckdb_table(database, args.rows)
+
+        results = run_benchmark(query, database, args.repeats)
+
+    for result in results:
+        print(f"{result['method']:>8}: {result['rows']} rows in {result['seconds']:.2f}s "
+              f"({result['rows_per_second']:,.0f} rows/s), peak memory +{result['peak_memory_mb']:.0f} MB, "
+              f"DataFrame {result['frame_memory_mb']:.0f} MB")
+    read_sql, arrow = results
+    print(f"Arrow path: {arrow['rows_per_second'] / read_sql['rows_per_second']:.1f}x rows/s, "
+          f"{arrow['peak_memory_mb'] / max(read_sql['peak_memory_mb'], 1):.2f}x peak memory")
+    changed = {column: (dtype, arrow['dtypes'].get(column)) for column, dtype in read_sql['dtypes'].items()
+               if arrow['dtypes'].get(column) != dtype}
+    if changed:
+        print("Dtypes (read_sql -> arrow): " + ", ".join(f"{column} {old} -> {new}" for column, (old, new) in changed.items()))
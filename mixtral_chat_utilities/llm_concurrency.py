@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class ConcurrentLLMRunner:
+    """
+    Runs independent LLM calls concurrently on an async client.
+
+    At most `max_concurrency` calls are in flight at once, each call is
+    cancelled after `timeout` seconds, and setting `cancel` cancels every call
+    still running. A call that fails, times out or is cancelled gets None, so
+    one bad report doesn't lose the others.
+
+    `timeout` covers the whole call, including any rate-limit waits and retries
+    inside it; calls that pace themselves should time out their own requests
+    instead, as MixtralAgents does.
+
+    The client is created inside the event loop of each run, since async HTTP
+    clients can't be shared between event loops.
+
+    Args:
+        client_factory (Callable[[], Any]): Returns an async client usable with `async with`, e.g. AsyncGroq
+        max_concurrency (int): Calls in flight at the same time
+        timeout (Optional[float]): Seconds per call, None for no limit
+    """
+
+    def __init__(self, client_factory: Callable[[], Any], max_concurrency: int = 3, timeout: Optional[float] = None):
+        self.client_factory = client_factory
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+
+    async def _call(self, semaphore: asyncio.Semaphore, key: Hashable, call: Callable[[Any], Awaitable], client) -> Any:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(call(client), self.timeout)
+            except asyncio.TimeoutError:
+                print(f"LLM call for {key} timed out after {time.perf_counter() - start:.0f}s")
+                return None
+            except Exception as e:
+                print(f"LLM call for {key} failed: {e}")
+                return None
+            print(f"LLM call for {key} finished in {time.perf_counter() - start:.2f}s")
+            return result
+
+    @staticmethod
+    async def _watch(cancel: threading.Event, tasks: Dict[Hashable, asyncio.Task]):
+        while not cancel.is_set():
+            await asyncio.sleep(0.1)
+        print("Cancelling the remaining LLM calls")
+        for task in tasks.values():
+            task.cancel()
+
+    async def run_async(self, calls: Dict[Hashable, Callable[[Any], Awaitable]],
+                        cancel: Optional[threading.Event] = None) -> Dict[Hashable, Any]:
+        """
+        Awaits all calls; see run.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self.client_factory() as client:
+            tasks = {key: asyncio.create_task(self._call(semaphore, key, call, client)) for key, call in calls.items()}
+            watcher = asyncio.create_task(self._watch(cancel, tasks)) if cancel is not None else None
+            try:
+                results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+            finally:
+                if watcher is not None:
+                    watcher.cancel()
+        return {key: None if isinstance(result, BaseException) else result for key, result in zip(tasks, results)}
+
+    def run(self, calls: Dict[Hashable, Callable[[Any], Awaitable]],
+            cancel: Optional[threading.Event] = None) -> Dict[Hashable, Any]:
+        """
+        Runs the calls concurrently and returns their results by key.
+
+        Args:
+            calls (Dict[Hashable, Callable[[Any], Awaitable]]): Per key, a coroutine function taking the client
+            cancel (Optional[threading.Event]): Cancels the calls still running when set
+
+        Returns:
+            Dict[Hashable, Any]: The result of every call, None for the ones that didn't complete
+        """
+        return asyncio.run(self.run_async(calls, cancel))
@@ -16,6 +16,14 @@ class PromptGenerator(BaseModel):
     class Config:
         extra = Extra.forbid
 
+class FusedSqlPrompt(BaseModel):
+    optimized_prompt: str
+    sql_query: str
+    normal_response: str
+
+    class Config:
+        extra = Extra.forbid
+
 class StreamlitBot(BaseModel):
     bot_response: str
 
@@ -127,6 +135,33 @@ class PromptTexts(Enum):
     USER QUESTION: {user_prompt}
     """
 
+    FUSED_TABLE_ASSISTANT = """Your task is to first generate an improved version of the user's prompt, and then return an SQL Query, if necessary, that answers the improved prompt.
+    If the improved prompt does not require an SQL Query, please give an answer based on your current knowledge.
+    When returning the SQL Query, please adhere to the following instructions:
+    1. When you want to reference the table name in the sql script, be sure to use
+    <Database name>.<Database schema name>.<Table name>. For example:
+    SELECT * FROM MISTRALHEALTHDB.MEDICALRECORDDATAMART.FLATTENED_MEDICAL_RECORDS
+
+    2. If the answer to the prompt requires a complex SQL query, please use Common Table Expressions (CTE) or Subqueries where possible
+
+    3. Please generate a valid SQL query that can be executed directly without requiring concatenation operators (e.g., `+`).
+
+    4. The answer must be in the format defined below:
+        i. If the answer requires an SQL query, the output should be:
+            **output**:
+            optimized_prompt = "<THE IMPROVED USER PROMPT>"
+            sql_query = "<THE CORRECT SQL QUERY>"
+            normal_response = "null"
+        ii. If the answer does not require an SQL query, the output should be:
+            **output**:
+            optimized_prompt = "<THE IMPROVED USER PROMPT>"
+            sql_query = "null"
+            normal_response = "<An answer fitting for the question>"
+
+    The user's question is given below:
+    USER QUESTION: {user_prompt}
+    """
+
     PROMPT_ASSISTANT = """Please generate an improved version of the user's prompt given below.
     Ensure the previous conversation is taken into consideration if it is relevant to the user's current prompt.
 
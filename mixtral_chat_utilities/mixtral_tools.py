@@ -1,7 +1,19 @@
-from sqlalchemy import create_engine, Engine
+from sqlalchemy import Engine
 import pandas as pd
 from dotenv import load_dotenv
 import os
+import time
+
+from mixtral_chat_utilities.arrow_fetch import iter_dataframe_chunks, read_arrow
+from mixtral_chat_utilities.async_queries import AsyncQueryClient, QueryHandle
+from mixtral_chat_utilities.connection_manager import ConnectionManager
+from mixtral_chat_utilities.query_cache import QueryResultCache
+from mixtral_chat_utilities.query_executor import ConcurrentQueryExecutor
+from mixtral_chat_utilities.query_stats import QueryStats, QueryTrace
+from mixtral_chat_utilities.result_limits import TRUNCATION_ATTR, apply_row_limit, mark_truncated
+from mixtral_chat_utilities.sql_fingerprint import FingerprintStats, canonicalize_sql, sql_fingerprint
+from mixtral_chat_utilities.sql_validator import SqlValidationResult, SqlValidator
+from LLM_messaging.llm_context_and_format import LoadTableInfo
 
 
 load_dotenv(override = True)
@@ -14,31 +26,185 @@ warehouse = os.getenv("WAREHOUSE_NAME")
 database = os.getenv("DATABASE_NAME")
 schema = os.getenv("TABLE_SCHEMA")
 
-# Create an SQLAlchemy engine
-engine = create_engine(
-    f'snowflake://{username}:{password}@{account}/{database}/{schema}?warehouse={warehouse}'
+# One pool per process, shared by the chat and dashboard pages (and every Streamlit
+# session), so queries reuse logged-in Snowflake sessions instead of logging in each time
+connection_manager = ConnectionManager(
+    f'snowflake://{username}:{password}@{account}/{database}/{schema}?warehouse={warehouse}',
+    pool_size = int(os.getenv("DB_POOL_SIZE", 5)),
+    max_overflow = int(os.getenv("DB_POOL_MAX_OVERFLOW", 5)),
+    connect_args = {"client_session_keep_alive": True}
+)
+engine = connection_manager.engine
+
+# Caps on a single result, so one unbounded generated query can't exhaust the app server's memory
+query_max_rows = int(os.getenv("QUERY_MAX_ROWS", 100_000))
+query_max_bytes = int(os.getenv("QUERY_MAX_MB", 256)) * 1024 ** 2
+
+# Generated SQL is checked against the known table schemas before it reaches the warehouse
+sql_validator = SqlValidator(
+    {table_name: table_info[0] for table_name, table_info in LoadTableInfo(LoadTableInfo.default_table_name).get_table_col_map().items()},
+    catalog = database or "MISTRALHEALTHDB",
+    db = schema or "MEDICALRECORDDATAMART"
+)
+
+
+def validate_query(query: str) -> SqlValidationResult:
+    return sql_validator.validate(query)
+
+
+# Table whose MAX(last_updated_at) invalidates cached results when new records land
+watermark_table = os.getenv("QUERY_CACHE_WATERMARK_TABLE", "FLATTENED_MEDICAL_RECORDS")
+
+
+def get_source_watermark():
+    with connection_manager.connection() as conn:
+        return conn.exec_driver_sql(f"SELECT MAX(last_updated_at) FROM {watermark_table}").scalar()
+
+
+# Shared by every page and session, so a dashboard reload or the same generated SQL
+# from another user is answered from memory while the source table is unchanged
+query_cache = QueryResultCache(
+    max_bytes = int(os.getenv("QUERY_CACHE_MAX_MB", 256)) * 1024 ** 2,
+    ttl_seconds = float(os.getenv("QUERY_CACHE_TTL_SECONDS", 300)),
+    disk_dir = os.getenv("QUERY_CACHE_DIR") or None,
+    watermark = get_source_watermark
+)
+
+# How many generated queries are duplicates once canonicalized
+fingerprint_stats = FingerprintStats()
+
+
+# Cost and latency of every query. The JSONL log holds the SQL text, filter values
+# included, so it is only written when QUERY_LOG_PATH is set
+query_stats = QueryStats(
+    log_path = os.getenv("QUERY_LOG_PATH") or None,
+    history_size = int(os.getenv("QUERY_STATS_HISTORY", 1000))
 )
 
 
-def get_dataframe_from_query(query: str, engine: Engine = engine):
+def canonicalize_query(query: str) -> str:
+    canonical_query = canonicalize_sql(query)
+    fingerprint_stats.record(query, canonical_query)
+    return canonical_query
+
+
+def _normalize_name(conn):
+    dialect = conn.dialect
+    # Match the column names pd.read_sql gets through SQLAlchemy, e.g. lower-cased for Snowflake
+    return dialect.normalize_name if dialect.requires_name_normalize else None
+
+
+def _read_query(query: str, conn, arrow: bool, timeout: float = None,
+                max_rows: int = None, max_bytes: int = None, trace: QueryTrace = None) -> pd.DataFrame:
+    query = apply_row_limit(query, max_rows)
+    if not arrow:
+        # pd.read_sql doesn't separate executing from fetching, so all of it counts as execute
+        with trace.phase("execute"):
+            df = pd.read_sql(query, conn)
+        trace.bytes = int(df.memory_usage(index = False).sum())
+        if max_rows is not None and len(df) > max_rows:
+            df = mark_truncated(df.iloc[:max_rows], 'rows', max_rows, max_bytes)
+        return df
+    return read_arrow(query, conn.connection, _normalize_name(conn), timeout, max_rows, max_bytes, trace)
+
+
+def get_dataframe_from_query(query: str, engine: Engine = engine, arrow: bool = True, use_cache: bool = True,
+                             canonical_query: str = None, timeout: float = None,
+                             max_rows: int = query_max_rows, max_bytes: int = query_max_bytes,
+                             validate: bool = True):
+    # The cache only holds results of the shared warehouse engine
+    use_cache = use_cache and engine is connection_manager.engine
+    trace = None
     try:
-        df = pd.read_sql(query, engine)
+        if not query:
+            raise ValueError("No SQL query to run")
+        canonical_query = canonical_query or canonicalize_query(query)
+        trace = QueryTrace(query, sql_fingerprint(query, canonical_query))
+        if validate and engine is connection_manager.engine:
+            validation = validate_query(query)
+            if not validation.valid:
+                # Doomed queries never cost a warehouse round trip
+                print(f"Query rejected before running: {[issue.message for issue in validation.issues]}")
+                df = pd.DataFrame()
+                df.attrs["sql_validation"] = validation.model_dump()
+                trace.source = "rejected"
+                query_stats.record(trace.finish(error = "; ".join(issue.message for issue in validation.issues)))
+                return df
+
+        if use_cache:
+            # Equivalent queries that differ in formatting, casing or aliases share an entry
+            cache_key = f"{canonical_query} -- max_rows={max_rows} max_bytes={max_bytes}"
+            df = query_cache.get(cache_key)
+            if df is not None:
+                print("Data loaded from cache!")
+                trace.source = "cache"
+                trace.rows = len(df)
+                query_stats.record(trace.finish())
+                return df
+
+        connect_start = time.perf_counter()
+        if engine is connection_manager.engine:
+            with connection_manager.connection() as conn:
+                trace.timings["connect"] = time.perf_counter() - connect_start
+                df = _read_query(query, conn, arrow, timeout, max_rows, max_bytes, trace)
+        else:
+            with engine.connect() as conn:
+                trace.timings["connect"] = time.perf_counter() - connect_start
+                df = _read_query(query, conn, arrow, timeout, max_rows, max_bytes, trace)
         print("Data loaded successfully!")
+        trace.rows = len(df)
+        trace.truncated = df.attrs.get(TRUNCATION_ATTR, {}).get("reason")
+        record = query_stats.record(trace.finish())
+        print(f"Query {record['fingerprint']} ({record['query_id'] or 'no query ID'}): {record['rows']} rows, "
+              f"{record['bytes'] / 1024 ** 2:.1f} MB in {record['total_seconds']:.2f}s")
+        if use_cache:
+            query_cache.put(cache_key, df)
         return df
-    except:
+    except Exception as e:
         print("Data DID NOT load successfully")
+        if trace is not None:
+            query_stats.record(trace.finish(error = str(e)))
         return pd.DataFrame()
-    finally:
-        # Close the connection
-        engine.dispose()
-        
-        
-        
+
+
+def stream_dataframe_from_query(query: str, chunk_rows: int = 10_000, max_rows: int = query_max_rows,
+                                timeout: float = None):
+    # Yields the result in chunks; the connection goes back to the pool when the consumer stops
+    with connection_manager.connection() as conn:
+        yield from iter_dataframe_chunks(apply_row_limit(query, max_rows), conn.connection, _normalize_name(conn),
+                                         timeout, max_rows, chunk_rows)
+
+
+query_concurrency = int(os.getenv("QUERY_CONCURRENCY", 4))
+query_timeout = float(os.getenv("QUERY_TIMEOUT_SECONDS", 120))
+
+# Runs the dashboard's topic queries in parallel; keep the concurrency within the pool size
+query_executor = ConcurrentQueryExecutor(
+    get_dataframe_from_query,
+    max_concurrency = query_concurrency,
+    timeout = query_timeout
+)
+
+# Queries the pages submit and poll on later reruns instead of waiting for them
+async_queries = AsyncQueryClient(get_dataframe_from_query, max_workers = query_concurrency)
+
+
+def submit_query(query: str, **kwargs) -> QueryHandle:
+    # The warehouse stops the query at the timeout, so a handle never stays running for good
+    kwargs.setdefault("timeout", query_timeout)
+    return async_queries.submit(query, **kwargs)
+
+
+
 
 if __name__ == "__main__":
     # Query the table
     query = "SELECT * FROM MISTRALHEALTHDB.MEDICALRECORDDATAMART.FLATTENED_MEDICAL_RECORDS"
     df = get_dataframe_from_query(query, engine)
     print(df.head())
+    print(connection_manager.stats())
+    print(query_stats.format_report())
+    print(query_cache.stats())
+    print(fingerprint_stats.format_stats())
+
 
-    
@@ -0,0 +1,119 @@
+import argparse
+import json
+import timeit
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from LLM_messaging.llm_context_and_format import (ChartReference,
+                                                  ContextTexts as DashboardContextTexts,
+                                                  GenerateCharts,
+                                                  LoadTableInfo,
+                                                  NumReports,
+                                                  SqlQuery)
+from mixtral_chat_utilities.mixtral_context import ContextTexts, PromptGenerator, SqlPrompt
+from mixtral_chat_utilities.prompt_registry import PromptRegistry
+
+
+USER_PROMPT = "patients with highest heart rate"
+
+
+def _table_description() -> str:
+    table_name = LoadTableInfo.default_table_name
+    table_cols, sample_table_values = LoadTableInfo(table_name).load_info()
+    return DashboardContextTexts.TABLE_DESCRIPTION.value.format(table_name=table_name, table_columns=table_cols,
+                                                                sample_column_values=sample_table_values)
+
+
+def prompt_builders(registry: PromptRegistry, df: pd.DataFrame) -> Dict[str, Tuple[Callable[[], str], Callable[[], str]]]:
+    """
+    Returns, per system prompt, how it was built on every request and how the registry builds it.
+    """
+    cr = ChartReference()
+    table_name = LoadTableInfo.default_table_name
+    return {
+        'sql_query_agent': (
+            lambda: ContextTexts.TABLE_ASSISTANT.value.format(output_format=json.dumps(SqlPrompt.model_json_schema(), indent=2)),
+            lambda: registry.prompt(ContextTexts.TABLE_ASSISTANT, output_format=registry.schema_json(SqlPrompt)).format(),
+        ),
+        'prompt_agent': (
+            lambda: ContextTexts.NOMINAL_CONTEXT.value.format(output_format=json.dumps(PromptGenerator.model_json_schema(), indent=2)),
+            lambda: registry.prompt(ContextTexts.NOMINAL_CONTEXT, output_format=registry.schema_json(PromptGenerator)).format(),
+        ),
+        'get_num_reports': (
+            lambda: DashboardContextTexts.GET_NUM_REPORTS.value.format(
+                user_prompt=USER_PROMPT, table_description=_table_description(),
+                output_format=json.dumps(NumReports.model_json_schema(), indent=2)),
+            lambda: registry.prompt(
+                DashboardContextTexts.GET_NUM_REPORTS,
+                table_description=registry.static_text(f"table_description:{table_name}", _table_description),
+                output_format=registry.schema_json(NumReports)).format(user_prompt=USER_PROMPT),
+        ),
+        'get_sql_from_description': (
+            lambda: DashboardContextTexts.GET_SQL_FROM_DESCRIPTION.value.format(
+                report_statement="Heart rate", report_description="Patients by heart rate",
+                table_description=_table_description(),
+                output_format=json.dumps(SqlQuery.model_json_schema(), indent=2)),
+            lambda: registry.prompt(
+                DashboardContextTexts.GET_SQL_FROM_DESCRIPTION,
+                table_description=registry.static_text(f"table_description:{table_name}", _table_description),
+                output_format=registry.schema_json(SqlQuery)
+            ).format(report_statement="Heart rate", report_description="Patients by heart rate"),
+        ),
+        # The dataset parts stay per request in both; only the chart and schema parts are static
+        'generate_chart_info_from_df': (
+            lambda: DashboardContextTexts.GET_CHART_SUMMARY.value.format(
+                user_prompt=USER_PROMPT, df_map=df.head(3), df_stats=df.describe(include="all"),
+                chart_names=cr.load_chart_names(), chart_map=cr.load_map(),
+                output_format=json.dumps(GenerateCharts.model_json_schema(), indent=2)),
+            lambda: registry.prompt(
+                DashboardContextTexts.GET_CHART_SUMMARY,
+                chart_names=registry.static_text("chart_names", cr.load_chart_names),
+                chart_map=registry.static_text("chart_map", cr.load_map),
+                output_format=registry.schema_json(GenerateCharts)
+            ).format(user_prompt=USER_PROMPT, df_map=df.head(3), df_stats=df.describe(include="all")),
+        ),
+    }
+
+
+def run_benchmark(number: int = 2000) -> List[Dict[str, Any]]:
+    """
+    Times building each system prompt per request against the prompt registry.
+
+    The registry is warmed up first, as it is after the first request; every
+    prompt is checked to be identical to the one built per request.
+
+    Args:
+        number (int): Builds timed per prompt
+
+    Returns:
+        List[Dict[str, Any]]: Microseconds per build of each prompt, before and after
+    """
+    registry = PromptRegistry()
+    df = pd.DataFrame({'age': range(100), 'heart_rate': range(60, 160), 'gender': ['Female', 'Male'] * 50})
+    results = []
+    for name, (per_request, registered) in prompt_builders(registry, df).items():
+        if per_request() != registered():
+            raise AssertionError(f"The registry builds a different prompt for {name}")
+        # The DataFrame formatting dominates the chart prompt, so it gets fewer runs
+        runs = number if name != 'generate_chart_info_from_df' else max(number // 20, 1)
+        results.append({
+            'prompt': name,
+            'per_request_us': timeit.timeit(per_request, number=runs) / runs * 1e6,
+            'registry_us': timeit.timeit(registered, number=runs) / runs * 1e6,
+            'characters': len(registered()),
+        })
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure the cost of building the system prompts per request.")
+    parser.add_argument('--number', type=int, default=2000, help="Builds timed per prompt")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    for result in run_benchmark(args.number):
+        print(f"{result['prompt']:>28}: {result['per_request_us']:9.1f} us -> {result['registry_us']:8.1f} us per request "
+              f"({result['per_request_us'] / result['registry_us']:.0f}x, {result['characters']:,} characters)")
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import string
+import threading
+from enum import Enum
+from typing import Any, Callable, Dict, Tuple, Union
+
+from pydantic import BaseModel
+
+
+_formatter = string.Formatter()
+
+
+def _escape(text: str) -> str:
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+class PromptTemplate:
+    """
+    A prompt template with its static fields already filled in.
+
+    format() only substitutes the remaining, per-request fields; a template
+    without any is rendered once. `version` changes whenever the template or
+    one of its static values (e.g. a JSON schema) changes.
+
+    Args:
+        template (str): Template in str.format syntax
+        static (Dict[str, str]): Values of the fields that are the same for every request
+    """
+
+    def __init__(self, template: str, static: Dict[str, str]):
+        parts = []
+        fields = set()
+        for literal, field, spec, conversion in _formatter.parse(template):
+            parts.append(_escape(literal))
+            if field is None:
+                continue
+            if field in static:
+                value = static[field]
+                if conversion:
+                    value = _formatter.convert_field(value, conversion)
+                parts.append(_escape(format(value, spec or '')))
+            else:
+                parts.append("{" + field + (f"!{conversion}" if conversion else "") + (f":{spec}" if spec else "") + "}")
+                fields.add(field)
+        self.text = "".join(parts)
+        self.fields = frozenset(fields)
+        self.version = hashlib.sha256(self.text.encode()).hexdigest()[:12]
+        self._rendered = None if fields else self.text.format()
+
+    def format(self, **dynamic: Any) -> str:
+        if self._rendered is not None:
+            return self._rendered
+        return self.text.format(**dynamic)
+
+
+class PromptRegistry:
+    """
+    Builds the static parts of the system prompts once per process.
+
+    JSON schemas and other static texts (table description, chart map) are
+    computed on first use and kept, and templates are compiled once per
+    template and static values, so a request only formats its dynamic fields.
+    """
+
+    def __init__(self):
+        self._static_texts: Dict[str, str] = {}
+        self._templates: Dict[Tuple, PromptTemplate] = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.hits = 0
+
+    def static_text(self, name: str, build: Callable[[], Any]) -> str:
+        """
+        Returns the text of a static value, building it on first use.
+
+        Args:
+            name (str): Name the value is kept under, e.g. 'chart_map'
+            build (Callable[[], Any]): Returns the value; non-strings are rendered with str()
+        """
+        text = self._static_texts.get(name)
+        if text is None:
+            value = build()
+            text = value if isinstance(value, str) else str(value)
+            with self._lock:
+                text = self._static_texts.setdefault(name, text)
+        return text
+
+    def schema_json(self, model: type[BaseModel]) -> str:
+        """
+        Returns the model's JSON schema as sent to the LLM (indented by 2).
+        """
+        return self.static_text(f"schema:{model.__module__}.{model.__qualname__}",
+                                lambda: json.dumps(model.model_json_schema(), indent=2))
+
+    def prompt(self, template: Union[Enum, str], **static: str) -> PromptTemplate:
+        """
+        Returns the template compiled with its static fields.
+
+        Args:
+            template (Union[Enum, str]): A ContextTexts / PromptTexts member or a template string
+            **static (str): Values of the static fields, e.g. output_format=registry.schema_json(Model)
+
+        Returns:
+            PromptTemplate: Formats the remaining fields per request
+        """
+        key = (template, tuple(sorted(static.items())))
+        compiled = self._templates.get(key)
+        if compiled is not None:
+            self.hits += 1
+            return compiled
+
+        text = template.value if isinstance(template, Enum) else template
+        compiled = PromptTemplate(text, static)
+        with self._lock:
+            self.builds += 1
+            return self._templates.setdefault(key, compiled)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'static_texts': len(self._static_texts),
+            'templates': len(self._templates),
+            'builds': self.builds,
+            'hits': self.hits,
+        }
@@ -0,0 +1,214 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+class CacheEntry:
+
+    def __init__(self, df: pd.DataFrame, stored_at: float, watermark: Optional[str]):
+        self.df = df
+        self.stored_at = stored_at
+        self.watermark = watermark
+        self.nbytes = int(df.memory_usage(deep=True).sum())
+
+
+class QueryResultCache:
+    """
+    Caches query results by SQL text.
+
+    The text is used as given, apart from surrounding whitespace, since
+    rewriting raw SQL could merge queries that differ inside a string literal;
+    callers pass the canonical query (canonicalize_sql) so equivalent queries
+    share an entry.
+
+    Results live in an in-memory LRU bounded by `max_bytes` and, with `disk_dir`,
+    are also written to Parquet files so they survive restarts and can be
+    promoted back into memory after eviction. An entry is served while it is
+    younger than `ttl_seconds` and, when a `watermark` callable is given, while
+    the source table's watermark (e.g. MAX(last_updated_at)) is unchanged. The
+    watermark is itself a query, so it is re-read at most every
+    `watermark_interval` seconds.
+
+    Args:
+        max_bytes (int): Memory budget for cached DataFrames
+        ttl_seconds (float): Maximum age of an entry
+        disk_dir (Optional[str]): Directory of the Parquet tier, None to keep results in memory only
+        watermark (Optional[Callable[[], Any]]): Returns the current source table watermark
+        watermark_interval (float): Seconds a watermark reading is reused
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 ** 2, ttl_seconds: float = 300,
+                 disk_dir: Optional[str] = None, watermark: Optional[Callable[[], Any]] = None,
+                 watermark_interval: float = 10):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+        self.watermark = watermark
+        self.watermark_interval = watermark_interval
+
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._watermark_value: Optional[str] = None
+        self._watermark_read_at = 0.0
+        self.bytes_used = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidated = 0
+        self.evictions = 0
+
+    def current_watermark(self) -> Optional[str]:
+        """
+        Returns the source table watermark, re-reading it once `watermark_interval` has passed.
+        """
+        if self.watermark is None:
+            return None
+        now = time.monotonic()
+        if self._watermark_value is None or now - self._watermark_read_at >= self.watermark_interval:
+            try:
+                self._watermark_value = str(self.watermark())
+            except Exception as e:
+                # Without a watermark nothing can be validated, so only the TTL applies
+                print(f"Could not read the cache watermark: {e}")
+                self._watermark_value = None
+            self._watermark_read_at = now
+        return self._watermark_value
+
+    def _path(self, key: str) -> Path:
+        return self.disk_dir / f"{hashlib.sha256(key.encode()).hexdigest()}.parquet"
+
+    def _is_valid(self, entry: CacheEntry, watermark: Optional[str]) -> bool:
+        if time.time() - entry.stored_at > self.ttl_seconds:
+            self.expired += 1
+            return False
+        if watermark is not None and entry.watermark != watermark:
+            self.invalidated += 1
+            return False
+        return True
+
+    def _read_disk(self, key: str) -> Optional[CacheEntry]:
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            table = pq.read_table(path)
+        except Exception as e:
+            print(f"Could not read cached result {path.name}: {e}")
+            return None
+        metadata = table.schema.metadata or {}
+        if metadata.get(b'sql', b'').decode() != key:
+            return None
+        watermark = metadata.get(b'watermark')
+        return CacheEntry(table.to_pandas(), float(metadata[b'stored_at']), watermark.decode() if watermark else None)
+
+    def _write_disk(self, key: str, entry: CacheEntry):
+        table = pa.Table.from_pandas(entry.df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata.update({b'sql': key.encode(), b'stored_at': str(entry.stored_at).encode()})
+        if entry.watermark is not None:
+            metadata[b'watermark'] = entry.watermark.encode()
+        path = self._path(key)
+        temp_path = path.with_suffix('.tmp')
+        pq.write_table(table.replace_schema_metadata(metadata), temp_path)
+        temp_path.replace(path)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes_used -= entry.nbytes
+        if self.disk_dir is not None:
+            self._path(key).unlink(missing_ok=True)
+
+    def _store(self, key: str, entry: CacheEntry):
+        if key in self._entries:
+            self.bytes_used -= self._entries.pop(key).nbytes
+        if entry.nbytes > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self.bytes_used += entry.nbytes
+        while self.bytes_used > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes_used -= evicted.nbytes
+            self.evictions += 1
+
+    def get(self, sql: str) -> Optional[pd.DataFrame]:
+        """
+        Returns the cached result of a query, or None if it isn't cached or no longer valid.
+
+        The result is a shallow copy, so callers can add or drop columns without
+        changing the cached DataFrame.
+        """
+        key = sql.strip()
+        watermark = self.current_watermark()
+        with self._lock:
+            entry = self._entries.get(key)
+            from_disk = False
+            if entry is None and self.disk_dir is not None:
+                entry = self._read_disk(key)
+                from_disk = entry is not None
+            if entry is None:
+                self.misses += 1
+                return None
+            if not self._is_valid(entry, watermark):
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            if from_disk:
+                self.disk_hits += 1
+                self._store(key, entry)
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return entry.df.copy(deep=False)
+
+    def put(self, sql: str, df: pd.DataFrame):
+        """
+        Caches the result of a query under the current watermark.
+        """
+        key = sql.strip()
+        entry = CacheEntry(df.copy(deep=False), time.time(), self.current_watermark())
+        with self._lock:
+            self._store(key, entry)
+            if self.disk_dir is not None:
+                try:
+                    self._write_disk(key, entry)
+                except Exception as e:
+                    print(f"Could not write cached result to {self.disk_dir}: {e}")
+
+    def clear(self):
+        """
+        Drops every cached result, in memory and on disk.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.bytes_used = 0
+            if self.disk_dir is not None:
+                for path in self.disk_dir.glob('*.parquet'):
+                    path.unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes_used': self.bytes_used,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'expired': self.expired,
+                'invalidated': self.invalidated,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,94 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, NamedTuple, Optional
+
+import pandas as pd
+
+
+class QueryResult(NamedTuple):
+    topic: str
+    df: pd.DataFrame
+    seconds: float
+    error: Optional[str] = None
+
+
+class ConcurrentQueryExecutor:
+    """
+    Runs a set of topic queries in parallel and yields each result as soon as it completes.
+
+    At most `max_concurrency` queries run at once. A query that runs longer than
+    `timeout` seconds is yielded with an empty DataFrame and an error; the
+    timeout is also passed to `run_query` so drivers that support it cancel the
+    query on the warehouse. Closing the result iterator, or setting `cancel`,
+    cancels every query that hasn't started and stops waiting for running ones.
+
+    Args:
+        run_query (Callable): Called as run_query(sql, timeout=...) and returns a DataFrame
+        max_concurrency (int): Queries running at the same time
+        timeout (Optional[float]): Seconds a query may run, None for no limit
+    """
+
+    def __init__(self, run_query: Callable[..., pd.DataFrame], max_concurrency: int = 4,
+                 timeout: Optional[float] = None):
+        self.run_query = run_query
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+
+    def _run(self, sql: str, started: Dict[str, float], topic: str) -> pd.DataFrame:
+        started[topic] = time.monotonic()
+        return self.run_query(sql, timeout=self.timeout)
+
+    def run(self, topic_to_sql_map: Dict[str, str], cancel: Optional[threading.Event] = None) -> Iterator[QueryResult]:
+        """
+        Submits every query and yields a QueryResult per topic in completion order.
+
+        Args:
+            topic_to_sql_map (Dict[str, str]): Query per topic
+            cancel (Optional[threading.Event]): Set to stop the remaining queries
+
+        Yields:
+            QueryResult: Topic, DataFrame, seconds the query ran and error, if any
+        """
+        pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='query')
+        started: Dict[str, float] = {}
+        futures: Dict[Future, str] = {
+            pool.submit(self._run, sql, started, topic): topic
+            for topic, sql in topic_to_sql_map.items()
+        }
+        pending = set(futures)
+        try:
+            while pending:
+                if cancel is not None and cancel.is_set():
+                    print(f"Cancelled {len(pending)} queries")
+                    return
+
+                now = time.monotonic()
+                if self.timeout is not None:
+                    for future in [future for future in pending if futures[future] in started]:
+                        if not future.done() and now - started[futures[future]] >= self.timeout:
+                            pending.discard(future)
+                            topic = futures[future]
+                            print(f"Query for topic '{topic}' timed out after {self.timeout:.0f}s")
+                            yield QueryResult(topic, pd.DataFrame(), now - started[topic], f"timed out after {self.timeout:.0f}s")
+                    deadlines = [started[futures[future]] + self.timeout for future in pending if futures[future] in started]
+                    wait_seconds = max(0.0, min(deadlines) - now) if deadlines else 0.1
+                    # Queries that haven't started yet have no deadline, poll for their start
+                    if len(deadlines) < len(pending):
+                        wait_seconds = min(wait_seconds, 0.1)
+                else:
+                    wait_seconds = 0.1 if cancel is not None else None
+
+                done, _ = wait(pending, timeout=wait_seconds, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.discard(future)
+                    topic = futures[future]
+                    seconds = time.monotonic() - started.get(topic, now)
+                    try:
+                        yield QueryResult(topic, future.result(), seconds)
+                    except Exception as e:
+                        print(f"Query for topic '{topic}' failed: {e}")
+                        yield QueryResult(topic, pd.DataFrame(), seconds, str(e))
+        finally:
+            # Also reached when the consumer stops iterating early
+            pool.shutdown(wait=False, cancel_futures=True)
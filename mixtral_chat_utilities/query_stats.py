@@ -0,0 +1,150 @@
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Phases of a query's wall time, in the order they happen
+PHASES = ('connect', 'execute', 'fetch', 'build')
+
+
+class QueryTrace:
+    """
+    Accounting of one query: where its wall time went and what it returned.
+
+    Args:
+        sql (str): Query as submitted
+        fingerprint (Optional[str]): Fingerprint of the canonical query
+    """
+
+    def __init__(self, sql: str, fingerprint: Optional[str] = None):
+        self.sql = sql
+        self.fingerprint = fingerprint
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.timings = {phase: 0.0 for phase in PHASES}
+        self.total_seconds: Optional[float] = None
+        self.rows = 0
+        self.bytes = 0
+        self.query_id: Optional[str] = None
+        self.source = 'warehouse'
+        self.truncated: Optional[str] = None
+        self.error: Optional[str] = None
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Adds the time spent in the block to one of PHASES.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - start
+
+    def finish(self, error: Optional[str] = None) -> 'QueryTrace':
+        self.total_seconds = time.perf_counter() - self._start
+        self.error = error
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'started_at': self.started_at,
+            'fingerprint': self.fingerprint,
+            'query_id': self.query_id,
+            'source': self.source,
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'total_seconds': self.total_seconds,
+            **{f'{phase}_seconds': seconds for phase, seconds in self.timings.items()},
+            'truncated': self.truncated,
+            'error': self.error,
+            'sql': self.sql,
+        }
+
+
+class QueryStats:
+    """
+    Keeps the accounting of recent queries and appends each one to a JSONL log.
+
+    Reports rank the last `history_size` queries, so they follow what the app
+    is doing now; the log keeps everything for offline analysis.
+
+    Args:
+        log_path (Optional[str]): JSONL file to append to, None to keep records in memory only
+        history_size (int): Recent queries the reports are computed over
+    """
+
+    def __init__(self, log_path: Optional[str] = None, history_size: int = 1000):
+        self.log_path = Path(log_path) if log_path else None
+        if self.log_path:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        self.records = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+
+    def record(self, trace: QueryTrace) -> Dict[str, Any]:
+        record = trace.to_dict()
+        with self._lock:
+            self.records.append(record)
+            if self.log_path:
+                try:
+                    with self.log_path.open('a') as log:
+                        log.write(json.dumps(record, default=str) + '\n')
+                except OSError as e:
+                    print(f"Could not write the query log: {e}")
+        return record
+
+    def top(self, n: int = 10, by: str = 'total_seconds') -> List[Dict[str, Any]]:
+        """
+        Returns the recent queries ranked by a record field, e.g. 'total_seconds' or 'bytes'.
+        """
+        with self._lock:
+            records = [record for record in self.records if record['source'] == 'warehouse']
+        return sorted(records, key=lambda record: record[by] or 0, reverse=True)[:n]
+
+    def top_fingerprints(self, n: int = 10, by: str = 'total_seconds') -> List[Dict[str, Any]]:
+        """
+        Returns the recent query fingerprints ranked by the sum of a record field,
+        so a cheap query that runs all the time shows up next to a slow one.
+        """
+        with self._lock:
+            records = [record for record in self.records if record['source'] == 'warehouse']
+        fingerprints: Dict[str, Dict[str, Any]] = {}
+        for record in records:
+            summary = fingerprints.setdefault(record['fingerprint'], {
+                'fingerprint': record['fingerprint'], 'count': 0, 'total_seconds': 0.0, 'bytes': 0, 'rows': 0,
+                'sql': record['sql'],
+            })
+            summary['count'] += 1
+            summary['total_seconds'] += record['total_seconds'] or 0
+            summary['bytes'] += record['bytes']
+            summary['rows'] += record['rows']
+        return sorted(fingerprints.values(), key=lambda summary: summary[by], reverse=True)[:n]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            records = list(self.records)
+        warehouse = [record for record in records if record['source'] == 'warehouse']
+        return {
+            'queries': len(records),
+            'warehouse_queries': len(warehouse),
+            'errors': sum(record['error'] is not None for record in records),
+            'total_seconds': sum(record['total_seconds'] or 0 for record in warehouse),
+            'bytes': sum(record['bytes'] for record in warehouse),
+            **{f'{phase}_seconds': sum(record[f'{phase}_seconds'] for record in warehouse) for phase in PHASES},
+        }
+
+    def format_report(self, n: int = 5) -> str:
+        """
+        Formats the slowest and the largest recent queries for the logs.
+        """
+        def line(record: Dict[str, Any]) -> str:
+            phases = ' '.join(f"{phase}={record[f'{phase}_seconds']:.2f}s" for phase in PHASES)
+            return (f"  {record['total_seconds']:.2f}s {record['rows']:,} rows {record['bytes'] / 1024 ** 2:.1f} MB "
+                    f"[{phases}] {record['fingerprint']} {record['query_id'] or '-'}: {record['sql'][:100]}")
+
+        lines = [f"Slowest {n} queries:"] + [line(record) for record in self.top(n, 'total_seconds')]
+        lines += [f"Largest {n} queries:"] + [line(record) for record in self.top(n, 'bytes')]
+        return '\n'.join(lines)
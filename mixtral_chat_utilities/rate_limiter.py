@@ -0,0 +1,194 @@
+import asyncio
+import math
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Mapping, Optional
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_UNITS = {'h': 3600.0, 'm': 60.0, 's': 1.0, 'ms': 0.001}
+
+# Chat formatting tokens added per message on top of its text
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(*texts: str) -> int:
+    """
+    Estimates the prompt tokens of chat messages, about 4 characters per token.
+    """
+    return sum(math.ceil(len(text) / 4) + _MESSAGE_OVERHEAD_TOKENS for text in texts)
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parses a rate-limit reset or retry-after header, e.g. '7.66s', '2m59.56s', '250ms' or '30'.
+
+    Returns:
+        Optional[float]: Seconds, or None if the value can't be parsed
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts or ''.join(number + unit for number, unit in parts) != value:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+class TokenBucketRateLimiter:
+    """
+    Client-side requests-per-minute and tokens-per-minute limiter for the LLM API.
+
+    Each call reserves one request and its estimated tokens, and waits only as
+    long as the buckets need to refill for it; reservations queue in order, so
+    concurrent callers are scheduled one after another rather than all retrying
+    at once. One instance is meant to be shared by every session and thread in
+    the process. The buckets are corrected with the API's rate-limit headers and
+    the actual token usage when the responses provide them.
+
+    Args:
+        requests_per_minute (float): Request budget
+        tokens_per_minute (float): Token budget, prompt and completion tokens
+        clock (Callable[[], float]): Monotonic clock, replaceable for testing
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float,
+                 clock: Callable[[], float] = time.monotonic):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._updated_at = clock()
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._blocked_until = 0.0
+        self.calls = 0
+        self.waited_seconds = 0.0
+        self.rate_limited = 0
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def reserve(self, tokens: int) -> float:
+        """
+        Reserves one request and `tokens` tokens.
+
+        Returns:
+            float: Seconds to wait before sending the request
+        """
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            # A request larger than the whole budget waits for a full bucket, not forever
+            tokens = min(tokens, self.tokens_per_minute)
+            self._requests -= 1
+            self._tokens -= tokens
+            wait = max(
+                self._blocked_until - now,
+                -self._requests * 60 / self.requests_per_minute if self._requests < 0 else 0.0,
+                -self._tokens * 60 / self.tokens_per_minute if self._tokens < 0 else 0.0,
+                0.0,
+            )
+            self.calls += 1
+            self.waited_seconds += wait
+            return wait
+
+    def acquire(self, tokens: int) -> float:
+        """
+        Blocks until the request may be sent; returns the seconds waited.
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            print(f"Waiting {wait:.1f}s for the LLM rate limit")
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens: int) -> float:
+        """
+        Same as acquire, without blocking the event loop.
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            print(f"Waiting {wait:.1f}s for the LLM rate limit")
+            await asyncio.sleep(wait)
+        return wait
+
+    def record_usage(self, estimated_tokens: int, used_tokens: Optional[int]):
+        """
+        Corrects the token bucket once the response reports the tokens actually used.
+        """
+        if used_tokens is None:
+            return
+        with self._lock:
+            self._tokens -= used_tokens - min(estimated_tokens, self.tokens_per_minute)
+
+    def update_from_headers(self, headers: Optional[Mapping[str, Any]]):
+        """
+        Aligns the buckets with the x-ratelimit-* response headers.
+
+        The remaining tokens (a per-minute budget) cap the token bucket; an
+        exhausted request budget, which some APIs count per day, pauses calls
+        until its reset.
+        """
+        if not headers:
+            return
+        limit_tokens = headers.get('x-ratelimit-limit-tokens')
+        remaining_tokens = headers.get('x-ratelimit-remaining-tokens')
+        remaining_requests = headers.get('x-ratelimit-remaining-requests')
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            try:
+                if limit_tokens is not None:
+                    self.tokens_per_minute = float(limit_tokens)
+                if remaining_tokens is not None:
+                    self._tokens = min(self._tokens, float(remaining_tokens))
+                if remaining_requests is not None and float(remaining_requests) <= 0:
+                    reset = parse_duration(headers.get('x-ratelimit-reset-requests'))
+                    if reset is not None:
+                        self._blocked_until = max(self._blocked_until, now + reset)
+            except ValueError:
+                pass
+
+    def penalize(self, headers: Optional[Mapping[str, Any]] = None, fallback_seconds: float = 30.0) -> float:
+        """
+        Pauses every caller after the API answered with a rate-limit error.
+
+        The pause is the retry-after header, else the token or request reset,
+        else `fallback_seconds`.
+
+        Returns:
+            float: Seconds until calls resume
+        """
+        headers = headers or {}
+        seconds = None
+        for header in ('retry-after', 'x-ratelimit-reset-tokens', 'x-ratelimit-reset-requests'):
+            seconds = parse_duration(headers.get(header))
+            if seconds is not None:
+                break
+        seconds = fallback_seconds if seconds is None else seconds
+        with self._lock:
+            now = self.clock()
+            self._blocked_until = max(self._blocked_until, now + seconds)
+            self.rate_limited += 1
+            return self._blocked_until - now
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refill(self.clock())
+            return {
+                'requests_per_minute': self.requests_per_minute,
+                'tokens_per_minute': self.tokens_per_minute,
+                'available_requests': self._requests,
+                'available_tokens': self._tokens,
+                'calls': self.calls,
+                'waited_seconds': self.waited_seconds,
+                'rate_limited': self.rate_limited,
+            }
@@ -0,0 +1,82 @@
+from typing import Optional
+
+import pandas as pd
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+
+
+DIALECT = 'snowflake'
+
+# Key of DataFrame.attrs describing a result that was cut off at the row or byte cap
+TRUNCATION_ATTR = 'truncation'
+
+
+def apply_row_limit(sql: str, max_rows: Optional[int]) -> str:
+    """
+    Adds a LIMIT to a query that has none, or tightens one above the cap.
+
+    The limit is one row above `max_rows` so a result that fills the cap can be
+    told apart from one that was cut off. Queries sqlglot can't parse, and
+    anything other than a SELECT, are returned unchanged; the fetch still stops
+    at the cap.
+
+    Args:
+        sql (str): Query, e.g. as generated by the LLM
+        max_rows (Optional[int]): Row cap, None for no cap
+
+    Returns:
+        str: The query with its LIMIT at most max_rows + 1
+    """
+    if max_rows is None:
+        return sql
+    try:
+        expression = sqlglot.parse_one(sql, read=DIALECT)
+    except SqlglotError:
+        return sql
+    if not isinstance(expression, (exp.Select, exp.Union)):
+        return sql
+
+    limit = expression.args.get('limit')
+    if limit is not None:
+        current = limit.expression
+        if not (isinstance(current, exp.Literal) and current.is_int) or int(current.name) <= max_rows + 1:
+            return sql
+    return expression.limit(max_rows + 1, copy=False).sql(dialect=DIALECT)
+
+
+def mark_truncated(df: pd.DataFrame, reason: str, max_rows: Optional[int], max_bytes: Optional[int]) -> pd.DataFrame:
+    """
+    Records on the DataFrame that the result was cut off, for the UI to report.
+
+    Args:
+        df (pd.DataFrame): The capped result
+        reason (str): 'rows' or 'bytes', the cap that was hit
+        max_rows (Optional[int]): Row cap
+        max_bytes (Optional[int]): Byte cap
+
+    Returns:
+        pd.DataFrame: The same DataFrame
+    """
+    df.attrs[TRUNCATION_ATTR] = {
+        'reason': reason,
+        'rows': len(df),
+        'max_rows': max_rows,
+        'max_bytes': max_bytes,
+    }
+    return df
+
+
+def truncation_message(df) -> Optional[str]:
+    """
+    Returns a message for the UI if the result was truncated, otherwise None.
+    """
+    if not isinstance(df, pd.DataFrame) or TRUNCATION_ATTR not in df.attrs:
+        return None
+    truncation = df.attrs[TRUNCATION_ATTR]
+    if truncation['reason'] == 'rows':
+        cap = f"the {truncation['max_rows']:,}-row limit"
+    else:
+        cap = f"the {truncation['max_bytes'] / 1024 ** 2:,.0f} MB limit"
+    return (f"Only the first {truncation['rows']:,} rows are shown: the query returned more than {cap}. "
+            f"Narrow the question or ask for aggregated results to see everything.")
@@ -0,0 +1,161 @@
+import hashlib
+import threading
+from collections import Counter
+from typing import Any, Dict, Optional
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.dialects.dialect import Dialect
+from sqlglot.errors import SqlglotError
+from sqlglot.optimizer.normalize_identifiers import normalize_identifiers
+from sqlglot.tokens import TokenType
+
+
+DIALECT = 'snowflake'
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Normalizes the formatting of a query without parsing it.
+
+    The query is split into sqlglot tokens and joined with single spaces, so
+    whitespace and comments between tokens are dropped while string literals
+    keep their exact text; trailing semicolons are removed.
+    """
+    try:
+        tokens = Dialect.get_or_raise(DIALECT).tokenize(sql)
+    except SqlglotError:
+        return sql.strip()
+    while tokens and tokens[-1].token_type == TokenType.SEMICOLON:
+        tokens.pop()
+    return " ".join(sql[token.start:token.end + 1] for token in tokens)
+
+
+def _rename_aliases(expression: exp.Expression) -> exp.Expression:
+    # Table and subquery aliases only name things inside the query, so t, mr and
+    # records all become _T0; column aliases name the result columns and are kept
+    aliased = [node for node in expression.find_all(exp.Table, exp.Subquery) if node.alias]
+    aliases = [node.alias for node in aliased]
+    if len(set(aliases)) != len(aliases):
+        # The same alias in several scopes would need scope resolution to rename safely
+        return expression
+    renames = {alias: f"_T{index}" for index, alias in enumerate(aliases)}
+    for node in aliased:
+        node.set('alias', exp.TableAlias(this=exp.to_identifier(renames[node.alias])))
+    for column in expression.find_all(exp.Column):
+        if column.table in renames:
+            column.set('table', exp.to_identifier(renames[column.table]))
+    return expression
+
+
+def _sort_in_lists(expression: exp.Expression):
+    for node in expression.find_all(exp.In):
+        if node.expressions and all(isinstance(value, exp.Literal) for value in node.expressions):
+            node.set('expressions', sorted(node.expressions, key=lambda value: value.sql(dialect=DIALECT)))
+
+
+def _sort_operands(node: exp.Expression) -> exp.Expression:
+    if isinstance(node, (exp.And, exp.Or)) and not isinstance(node.parent, type(node)):
+        operands = sorted(node.flatten(), key=lambda operand: operand.sql(dialect=DIALECT))
+        combine = exp.and_ if isinstance(node, exp.And) else exp.or_
+        return combine(*operands, copy=False)
+    return node
+
+
+def canonicalize_sql(sql: str) -> str:
+    """
+    Rewrites a query into a canonical form that is the same for equivalent queries.
+
+    Unquoted identifiers are resolved the way Snowflake does (upper case), table
+    and subquery aliases are renamed by position, IN lists of literals and the
+    operands of AND / OR chains are sorted, and the query is printed with
+    uniform keywords and whitespace. Queries sqlglot can't parse fall back to
+    normalize_sql.
+
+    Args:
+        sql (str): Query, e.g. as generated by the LLM
+
+    Returns:
+        str: The canonical query, which runs with the same result as `sql`
+    """
+    try:
+        expression = sqlglot.parse_one(sql, read=DIALECT)
+    except SqlglotError:
+        return normalize_sql(sql)
+    expression = normalize_identifiers(expression, dialect=DIALECT)
+    expression = _rename_aliases(expression)
+    _sort_in_lists(expression)
+    expression = expression.transform(_sort_operands, copy=False)
+    return expression.sql(dialect=DIALECT)
+
+
+def parameterize_sql(canonical_sql: str) -> str:
+    """
+    Replaces the literals of a canonical query with placeholders, giving its shape.
+    """
+    try:
+        expression = sqlglot.parse_one(canonical_sql, read=DIALECT)
+    except SqlglotError:
+        return canonical_sql
+    expression = expression.transform(
+        lambda node: exp.Placeholder() if isinstance(node, exp.Literal) else node, copy=False
+    )
+    return expression.sql(dialect=DIALECT)
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def sql_fingerprint(sql: str, canonical_sql: Optional[str] = None) -> str:
+    """
+    Returns a short hash of the canonical query; equivalent queries share it.
+    """
+    return _digest(canonical_sql or canonicalize_sql(sql))
+
+
+class FingerprintStats:
+    """
+    Counts how many generated queries collapse to the same fingerprint.
+
+    Besides exact text and canonical fingerprints, the shape (the canonical query
+    with literals replaced by placeholders) shows near-duplicates that only
+    differ in their filter values.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.texts = Counter()
+        self.fingerprints = Counter()
+        self.shapes = Counter()
+
+    def record(self, sql: str, canonical_sql: Optional[str] = None) -> str:
+        """
+        Records a query and returns its fingerprint.
+        """
+        canonical_sql = canonical_sql or canonicalize_sql(sql)
+        fingerprint = sql_fingerprint(sql, canonical_sql)
+        shape = _digest(parameterize_sql(canonical_sql))
+        with self._lock:
+            self.texts[sql] += 1
+            self.fingerprints[fingerprint] += 1
+            self.shapes[shape] += 1
+        return fingerprint
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            queries = sum(self.texts.values())
+            return {
+                'queries': queries,
+                'distinct_texts': len(self.texts),
+                'distinct_fingerprints': len(self.fingerprints),
+                'distinct_shapes': len(self.shapes),
+                'duplicate_queries': queries - len(self.fingerprints),
+                'collapsed_by_canonicalization': len(self.texts) - len(self.fingerprints),
+            }
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        return (f"{stats['queries']} queries, {stats['distinct_texts']} distinct texts -> "
+                f"{stats['distinct_fingerprints']} fingerprints ({stats['collapsed_by_canonicalization']} collapsed by "
+                f"canonicalization) -> {stats['distinct_shapes']} shapes ignoring literals")
@@ -0,0 +1,160 @@
+import difflib
+import re
+from typing import Dict, List, Optional, Sequence
+
+import sqlglot
+from pydantic import BaseModel
+from sqlglot import exp
+from sqlglot.errors import OptimizeError, ParseError, SqlglotError
+from sqlglot.optimizer.qualify import qualify
+
+
+DIALECT = 'snowflake'
+
+# Statements that change data or schema; only queries may reach the warehouse
+FORBIDDEN_EXPRESSIONS = (
+    exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Create, exp.Drop,
+    exp.Alter, exp.TruncateTable, exp.Command, exp.Grant,
+)
+
+
+class SqlValidationIssue(BaseModel):
+    code: str
+    message: str
+    name: Optional[str] = None
+    suggestions: List[str] = []
+
+
+class SqlValidationResult(BaseModel):
+    sql: str
+    valid: bool
+    issues: List[SqlValidationIssue] = []
+    available_columns: List[str] = []
+
+    def to_repair_prompt(self) -> str:
+        """
+        Describes the problems so the LLM can return a corrected query.
+        """
+        issues = "\n".join(
+            f"- {issue.message}" + (f" Did you mean: {', '.join(issue.suggestions)}?" if issue.suggestions else "")
+            for issue in self.issues
+        )
+        return (f"The SQL query below was rejected before running and must be corrected:\n{self.sql}\n\n"
+                f"Problems:\n{issues}\n\n"
+                f"Only use these columns: {', '.join(self.available_columns)}.\n"
+                f"Return a single corrected SELECT query in the same output format.")
+
+
+def _table_key(*parts: Optional[str]) -> str:
+    return ".".join(part.upper() for part in parts if part)
+
+
+class SqlValidator:
+    """
+    Checks generated SQL locally before it is sent to the warehouse.
+
+    A query must parse in the Snowflake dialect, be a single SELECT (including
+    WITH ... SELECT and set operations) without DML or DDL, read only known
+    tables and reference only their columns. Column references are resolved
+    with sqlglot's qualify, so aliases, CTEs and subqueries are handled.
+
+    Args:
+        table_to_columns (Dict[str, Sequence[str]]): Columns per fully qualified table name
+        catalog (str): Database unqualified table names resolve to
+        db (str): Schema unqualified table names resolve to
+    """
+
+    def __init__(self, table_to_columns: Dict[str, Sequence[str]], catalog: str, db: str):
+        self.catalog = catalog.upper()
+        self.db = db.upper()
+        self.table_to_columns = {
+            _table_key(table_name): [column.upper() for column in columns]
+            for table_name, columns in table_to_columns.items()
+        }
+        self.schema: Dict = {}
+        for table_name, columns in self.table_to_columns.items():
+            catalog_name, db_name, name = table_name.split(".")
+            self.schema.setdefault(catalog_name, {}).setdefault(db_name, {})[name] = {column: 'VARCHAR' for column in columns}
+        self.columns = sorted({column for columns in self.table_to_columns.values() for column in columns})
+
+    def _result(self, sql: str, issues: List[SqlValidationIssue]) -> SqlValidationResult:
+        return SqlValidationResult(sql=sql, valid=not issues, issues=issues,
+                                   available_columns=[column.lower() for column in self.columns])
+
+    def _unknown_column_issue(self, name: str) -> SqlValidationIssue:
+        suggestions = difflib.get_close_matches(name.upper(), self.columns, n=3)
+        return SqlValidationIssue(code='unknown_column', name=name.lower(),
+                                  message=f"Column '{name.lower()}' does not exist.",
+                                  suggestions=[suggestion.lower() for suggestion in suggestions])
+
+    def validate(self, sql: str) -> SqlValidationResult:
+        """
+        Validates a query.
+
+        Args:
+            sql (str): Query, e.g. as generated by the LLM
+
+        Returns:
+            SqlValidationResult: valid, or the issues found, which
+                to_repair_prompt turns into feedback for the LLM
+        """
+        try:
+            statements = [statement for statement in sqlglot.parse(sql, read=DIALECT) if statement is not None]
+        except ParseError as e:
+            errors = e.errors[:1]
+            if errors:
+                error = errors[0]
+                detail = f"{error['description'].split(' but got ')[0]} near '{error['highlight']}' (line {error['line']}, column {error['col']})"
+            else:
+                detail = str(e)
+            return self._result(sql, [SqlValidationIssue(code='parse_error', message=f"The query does not parse: {detail}.")])
+        except SqlglotError as e:
+            return self._result(sql, [SqlValidationIssue(code='parse_error', message=f"The query does not parse: {e}.")])
+
+        if len(statements) != 1:
+            return self._result(sql, [SqlValidationIssue(code='multiple_statements',
+                                                         message=f"Expected exactly one statement, got {len(statements)}.")])
+        expression = statements[0]
+        forbidden = next(iter(expression.find_all(*FORBIDDEN_EXPRESSIONS)), None)
+        if not isinstance(expression, exp.Query) or forbidden is not None:
+            statement = type(forbidden or expression).__name__.upper()
+            return self._result(sql, [SqlValidationIssue(code='not_select', name=statement,
+                                                         message=f"Only SELECT queries are allowed, got {statement}.")])
+
+        issues = []
+        cte_names = {cte.alias_or_name.upper() for cte in expression.find_all(exp.CTE)}
+        for table in expression.find_all(exp.Table):
+            if not table.catalog and not table.db and table.name.upper() in cte_names:
+                continue
+            table_name = _table_key(table.catalog or self.catalog, table.db or self.db, table.name)
+            if table_name not in self.table_to_columns:
+                suggestions = difflib.get_close_matches(table_name, list(self.table_to_columns), n=1)
+                issues.append(SqlValidationIssue(code='unknown_table', name=table.sql(dialect=DIALECT),
+                                                 message=f"Table '{table.sql(dialect=DIALECT)}' does not exist.",
+                                                 suggestions=suggestions))
+        if issues:
+            return self._result(sql, issues)
+
+        # Names the query defines itself: projection aliases, CTE and subquery columns
+        defined = {alias.alias.upper() for alias in expression.find_all(exp.Alias)}
+        defined |= {column.name.upper() for table_alias in expression.find_all(exp.TableAlias) for column in table_alias.columns}
+        unknown = sorted({
+            column.name.upper() for column in expression.find_all(exp.Column)
+            if column.name and column.name.upper() not in self.columns and column.name.upper() not in defined
+        })
+        issues = [self._unknown_column_issue(name) for name in unknown]
+        if issues:
+            return self._result(sql, issues)
+
+        try:
+            qualify(expression.copy(), schema=self.schema, catalog=self.catalog, db=self.db,
+                    dialect=DIALECT, validate_qualify_columns=True)
+        except OptimizeError as e:
+            match = re.search(r"Column '(\w+)'|Unknown column: (\w+)", str(e))
+            if match:
+                issues.append(self._unknown_column_issue(match.group(1) or match.group(2)))
+            else:
+                issues.append(SqlValidationIssue(code='unresolved', message=f"The query can't be resolved: {e}."))
+        except SqlglotError as e:
+            issues.append(SqlValidationIssue(code='unresolved', message=f"The query can't be resolved: {e}."))
+        return self._result(sql, issues)
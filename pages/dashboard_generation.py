@@ -14,6 +14,8 @@ from pages_markdowns import PagesMarkdowns
 import streamlit as st
 
 from LLM_messaging.context_functions import (get_topic_to_dataframe_map,
+                                             get_chart_query_map,
+                                             submit_topic_queries,
                                              get_num_reports,
                                              get_report_to_description_map,
                                              get_sqls_from_descriptions,
@@ -22,6 +24,10 @@ from LLM_messaging.context_functions import (get_topic_to_dataframe_map,
 
 from pages_utilities.create_streamlit_chart import create_all_gpt_charts
 from pages_utilities.streamlit_plots import reset_data_in_session_state
+from mixtral_chat_utilities.result_limits import truncation_message
+from mixtral_chat_utilities.mixtral_tools import async_queries
+from mixtral_chat_utilities.async_queries import QueryStatus
+import pandas as pd
 import time
 
 
@@ -31,27 +37,115 @@ import time
 
 
         
-def reload_data_from_database():
+def warn_if_truncated(topic, df):
+    if message := truncation_message(df):
+        st.warning(f"{topic}: {message}")
+
+
+def submit_dashboard_queries():
 
     if "topic_to_sql_map" in st.session_state and st.session_state.topic_to_sql_map != None:
         topic_to_sql_map = st.session_state.topic_to_sql_map
         
     else:
         st.warning("Please send a query before attempting to reload the data")
-        return
+        return False
     
     if "topic_to_chart_info" in st.session_state and st.session_state.topic_to_chart_info != None:
         topic_to_chart_info = st.session_state.topic_to_chart_info
 
     else:
         st.warning("Please send a query before attempting to reload the data")
-        return
+        return False
+    
+    cancel_dashboard_queries()
     
-    st.session_state.topic_to_dataframe_map = get_topic_to_dataframe_map(topic_to_sql_map)
-    topic_to_dataframe_map = st.session_state.topic_to_dataframe_map
+    # Charts the warehouse can aggregate for get only the rows they draw; the raw
+    # rows of a topic are fetched only if one of its charts still needs them
+    previous_topic_to_dataframe_map = st.session_state.get("topic_to_dataframe_map") or {}
+    chart_query_map = get_chart_query_map(topic_to_sql_map, topic_to_chart_info, previous_topic_to_dataframe_map)
+    
+    query_map = {}
+    topic_to_keys = {}
+    for topic in topic_to_sql_map:
+        chart_info_content = topic_to_chart_info.get(topic)
+        num_charts = len(chart_info_content.chart_content) if chart_info_content else 0
+        chart_keys = [(topic, idx) for idx in range(num_charts) if (topic, idx) in chart_query_map]
+        query_keys = chart_keys if num_charts and len(chart_keys) == num_charts else chart_keys + [topic]
+        for key in query_keys:
+            query_map[key] = chart_query_map[key] if key != topic else topic_to_sql_map[topic]
+        topic_to_keys[topic] = query_keys
+    
+    # Only the handle ids live in the session; the queries keep running across reruns
+    st.session_state.dashboard_query_ids = submit_topic_queries(query_map)
+    st.session_state.dashboard_topic_keys = topic_to_keys
+    return True
+
+
+def cancel_dashboard_queries():
+    query_ids = st.session_state.get("dashboard_query_ids")
+    if query_ids:
+        cancelled = async_queries.cancel(set(query_ids.values()))
+        print(f"Cancelled {cancelled} queued dashboard queries")
+    st.session_state.dashboard_query_ids = None
+
+
+def render_dashboard_queries():
+    query_ids = st.session_state.dashboard_query_ids
+    topic_to_keys = st.session_state.dashboard_topic_keys
+    topic_to_chart_info = st.session_state.topic_to_chart_info
+    previous_topic_to_dataframe_map = st.session_state.get("topic_to_dataframe_map") or {}
+    statuses = async_queries.poll(set(query_ids.values()))
     
     st.markdown("### Generated Dashboard:")
-    create_all_gpt_charts(topic_to_dataframe_map, topic_to_chart_info)
+    
+    # Each topic renders as soon as its queries complete, the others show their progress
+    topic_to_dataframe_map = {}
+    chart_dataframes = {}
+    pending = False
+    for topic, keys in topic_to_keys.items():
+        handles = {key: async_queries.get(query_ids[key]) for key in keys}
+        running = [handle for handle in handles.values() if handle is not None and not handle.done()]
+        if running:
+            pending = True
+            elapsed = max(handle.elapsed for handle in running)
+            st.info(f"Loading {topic}: {len(keys) - len(running)} of {len(keys)} queries done ({elapsed:.0f}s)")
+            continue
+        
+        for key, handle in handles.items():
+            if query_ids[key] is None:
+                st.warning(f"{topic}: no SQL query could be generated")
+                df = pd.DataFrame()
+            elif statuses[query_ids[key]] == QueryStatus.SUCCEEDED:
+                df = handle.result()
+            else:
+                st.warning(f"{topic}: the query did not complete ({statuses[query_ids[key]].value})")
+                df = pd.DataFrame()
+            if isinstance(key, tuple):
+                chart_dataframes[key] = df
+            else:
+                topic_to_dataframe_map[topic] = df
+            warn_if_truncated(topic, df)
+        
+        if topic in topic_to_chart_info:
+            topic_df = topic_to_dataframe_map.get(topic, previous_topic_to_dataframe_map.get(topic))
+            topic_chart_dataframes = {chart_key: chart_dataframes[chart_key] for chart_key in chart_dataframes if chart_key[0] == topic}
+            create_all_gpt_charts({topic: topic_df}, {topic: topic_to_chart_info[topic]}, topic_chart_dataframes)
+    
+    if pending:
+        time.sleep(0.5)
+        st.rerun()
+    
+    st.session_state.dashboard_query_ids = None
+    st.session_state.chart_dataframes = chart_dataframes
+    st.session_state.topic_to_dataframe_map = {
+        topic: topic_to_dataframe_map.get(topic, previous_topic_to_dataframe_map.get(topic)) for topic in topic_to_keys
+    }
+
+
+def reload_data_from_database():
+    if submit_dashboard_queries():
+        render_dashboard_queries()
     
     
 
@@ -93,6 +187,7 @@ if __name__ == "__main__":
     user_prompt = st.chat_input("Type your query to generate the dashboard")
     
     if user_prompt:
+        cancel_dashboard_queries()
         table_name = "MISTRALHEALTHDB.MEDICALRECORDDATAMART.FLATTENED_MEDICAL_RECORDS"
         
         num_reports = get_num_reports(user_prompt, table_name)
@@ -104,9 +199,12 @@ if __name__ == "__main__":
         
         topic_to_dataframe_map = get_topic_to_dataframe_map(topic_to_sql_map)
         st.session_state.topic_to_dataframe_map = topic_to_dataframe_map
+        for topic in topic_to_dataframe_map:
+            warn_if_truncated(topic, topic_to_dataframe_map[topic])
         
         topic_to_chart_info = generate_all_charts_info(user_prompt, topic_to_dataframe_map)
         st.session_state.topic_to_chart_info = topic_to_chart_info
+        st.session_state.chart_dataframes = {}
         
         user_prompt = None
         
@@ -121,12 +219,17 @@ if __name__ == "__main__":
         reload_data_from_database()
         st.write(st.session_state.topic_to_dataframe_map)
         
+    elif st.session_state.get("dashboard_query_ids"):
+        # A reload is still in flight: poll its queries again on this rerun
+        render_dashboard_queries()
+        st.write(st.session_state.topic_to_dataframe_map)
     
     else:
         st.markdown("### Generated Dashboard:")
         try:
             #st.write(st.session_state.topic_to_chart_info)
-            create_all_gpt_charts(st.session_state.topic_to_dataframe_map, st.session_state.topic_to_chart_info)
+            create_all_gpt_charts(st.session_state.topic_to_dataframe_map, st.session_state.topic_to_chart_info,
+                                  st.session_state.get("chart_dataframes"))
         except AttributeError as e:
             st.warning("Please enter a query.")
         
@@ -81,15 +81,18 @@ def filter_duplicate_charts(df_dict: Dict, chart_columns, chart_title, chart_typ
         
     
 
-def create_all_gpt_charts(topic_to_dataframe_map: Dict, topic_to_chart_info: Dict):
+def create_all_gpt_charts(topic_to_dataframe_map: Dict, topic_to_chart_info: Dict, chart_dataframes: Dict = None):
+    # chart_dataframes maps (topic, chart index) to the rows the warehouse aggregated for that chart
+    chart_dataframes = chart_dataframes or {}
     
     charts_list = []
     
     for topic in topic_to_chart_info:
-        df = topic_to_dataframe_map[topic]
+        df = topic_to_dataframe_map.get(topic, pd.DataFrame())
         chart_info_content = topic_to_chart_info[topic]
         
-        if len(df) <= 0:
+        has_chart_dataframes = any(chart_topic == topic for chart_topic, _ in chart_dataframes)
+        if len(df) <= 0 and not has_chart_dataframes:
             print(f"DataFrame is empty for topic: '{topic}'")
             continue
         
@@ -102,6 +105,7 @@ def create_all_gpt_charts(topic_to_dataframe_map: Dict, topic_to_chart_info: Dic
         for idx, chart_type in enumerate(chart_info["chart_type"]):
             chart_title = chart_info["chart_title"][idx]
             chart_columns = chart_info["chart_columns"][idx]
+            df = chart_dataframes.get((topic, idx), topic_to_dataframe_map.get(topic, pd.DataFrame()))
             
             print(f"Passing the information: \ndf:{df}\nchart: {chart_type}\ntitle: {chart_title}\ncols: {chart_columns}\n\n")
             
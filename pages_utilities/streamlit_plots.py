@@ -19,6 +19,8 @@ from functools import wraps
 import threading
 from uuid import uuid4
 
+from mixtral_chat_utilities.chart_queries import CHART_COUNT_COLUMN
+
 
 # def title_decorator():
 #     def decorator(func):
@@ -294,6 +296,9 @@ def plot_histogram(df, col, title):
         return
     
     
+    # Rows aggregated by the warehouse carry their counts, see mixtral_chat_utilities.chart_queries
+    counts_col = CHART_COUNT_COLUMN if CHART_COUNT_COLUMN in df.columns else None
+    
     num_step = 20
     try:
         if "x_hist_step" not in st.session_state:
@@ -305,12 +310,12 @@ def plot_histogram(df, col, title):
         
         filtered_df = df.loc[x_limit_mask, :]
         
-        fig = px.histogram(filtered_df, x=col, title=title)
+        fig = px.histogram(filtered_df, x=col, y=counts_col, title=title)
         st.plotly_chart(fig)
         
     except Exception as e:
         st.warning(e)
-        fig = px.histogram(df, x=col, title=title)
+        fig = px.histogram(df, x=col, y=counts_col, title=title)
         st.plotly_chart(fig)
 
 
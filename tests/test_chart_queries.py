@@ -0,0 +1,58 @@
+import pytest
+
+from mixtral_chat_utilities.chart_queries import CHART_COUNT_COLUMN, aggregate_query_for_chart
+
+duckdb = pytest.importorskip("duckdb")
+
+
+@pytest.fixture
+def conn():
+    conn = duckdb.connect()
+    conn.execute("CREATE TABLE visits (department VARCHAR, diagnosis VARCHAR, cost DOUBLE)")
+    conn.execute("INSERT INTO visits VALUES ('Cardiology', 'a  b', 10), ('Cardiology', 'a b', 20), "
+                 "('Oncology', 'a  b', 5), ('Oncology', NULL, 7)")
+    yield conn
+    conn.close()
+
+
+def _pie(sql):
+    return aggregate_query_for_chart(sql, 'pie_chart', {'names': 'department', 'values': 'cost'}, ['cost'])
+
+
+def test_comments_and_a_trailing_semicolon_stay_inside_the_subquery(conn):
+    sql = "SELECT department, cost -- per visit\nFROM visits\nWHERE cost > 6;"
+
+    chart_query = _pie(sql)
+
+    assert conn.execute(chart_query).fetchall() == [('Cardiology', 30.0), ('Oncology', 7.0)]
+
+
+def test_string_literals_are_kept_as_written(conn):
+    chart_query = _pie("SELECT department, cost FROM visits WHERE diagnosis = 'a  b'")
+
+    assert "'a  b'" in chart_query
+    assert conn.execute(chart_query).fetchall() == [('Cardiology', 10.0), ('Oncology', 5.0)]
+
+
+def test_histogram_counts_every_non_null_value(conn):
+    chart_query = aggregate_query_for_chart("SELECT cost FROM visits", 'histogram', {'col': 'cost'}, ['cost'],
+                                            histogram_bins=2)
+
+    rows = conn.execute(chart_query).df()
+
+    # Snowflake returns the quoted upper-case name lower-cased, DuckDB as written
+    assert [column.lower() for column in rows.columns] == ['cost', CHART_COUNT_COLUMN]
+    assert rows[CHART_COUNT_COLUMN].sum() == 4
+
+
+@pytest.mark.parametrize("sql", [None, "", "SELEC department FROM", "SELECT 1; SELECT 2",
+                                 "DELETE FROM visits"])
+def test_queries_that_are_not_a_single_select_get_no_rewrite(sql):
+    assert _pie(sql) is None
+
+
+def test_non_numeric_values_or_unknown_types_get_no_rewrite():
+    sql = "SELECT department, diagnosis FROM visits"
+
+    assert aggregate_query_for_chart(sql, 'pie_chart', {'names': 'department', 'values': 'diagnosis'}, ['cost']) is None
+    assert aggregate_query_for_chart(sql, 'pie_chart', {'names': 'department', 'values': 'cost'}) is None
@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+# The app modules create the Streamlit bot and the Snowflake engine on import
+pytest.importorskip("streamlit")
+pytest.importorskip("snowflake.sqlalchemy")
+
+from LLM_messaging import context_functions
+from mixtral_chat_utilities.query_executor import QueryResult
+
+
+class FakeExecutor:
+    """
+    Returns one row per query instead of running it.
+    """
+
+    def __init__(self):
+        self.queries = {}
+
+    def run(self, topic_to_sql_map, cancel = None):
+        self.queries.update(topic_to_sql_map)
+        for topic in topic_to_sql_map:
+            yield QueryResult(topic, pd.DataFrame({"n": [1]}), 0.0)
+
+
+def test_topics_without_sql_map_to_empty_dataframes(monkeypatch):
+    executor = FakeExecutor()
+    monkeypatch.setattr(context_functions, "query_executor", executor)
+    # get_sql_from_description returns None when the LLM call fails or times out
+    topic_to_sql_map = {"Visits": "SELECT COUNT(*) AS n FROM FLATTENED_MEDICAL_RECORDS",
+                        "Failed": None,
+                        "Empty": ""}
+
+    topic_to_df_map = context_functions.get_topic_to_dataframe_map(topic_to_sql_map)
+
+    assert set(topic_to_df_map) == set(topic_to_sql_map)
+    assert len(topic_to_df_map["Visits"]) == 1
+    assert topic_to_df_map["Failed"].empty and topic_to_df_map["Empty"].empty
+    assert len(executor.queries) == 1
+
+
+def test_topics_without_sql_get_no_query_handle(monkeypatch):
+    submitted = []
+
+    def submit_query(query, **kwargs):
+        submitted.append(query)
+        return SimpleNamespace(id = str(len(submitted)))
+
+    monkeypatch.setattr(context_functions, "submit_query", submit_query)
+
+    topic_to_handle_id = context_functions.submit_topic_queries({"Visits": "SELECT 1", "Failed": None})
+
+    assert topic_to_handle_id == {"Visits": "1", "Failed": None}
+    assert submitted == ["SELECT 1"]
@@ -0,0 +1,66 @@
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from mixtral_chat_utilities.llm_concurrency import ConcurrentLLMRunner
+
+try:
+    # mixtral_chat creates the Snowflake engine on import
+    from mixtral_chat import MixtralAgents
+except Exception:
+    MixtralAgents = None
+
+
+class SlowLimiter:
+    """
+    Rate limiter that makes every request wait `wait` seconds.
+    """
+
+    def __init__(self, wait: float):
+        self.wait = wait
+
+    async def acquire_async(self, tokens):
+        await asyncio.sleep(self.wait)
+        return self.wait
+
+    def record_usage(self, estimated_tokens, used_tokens):
+        pass
+
+
+def _client(seconds: float):
+    async def create(**kwargs):
+        await asyncio.sleep(seconds)
+        message = SimpleNamespace(content='{"output": "SELECT 1"}')
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+@asynccontextmanager
+async def _no_client():
+    yield None
+
+
+def test_runner_turns_a_timed_out_call_into_none():
+    async def slow(client):
+        await asyncio.sleep(1)
+
+    async def fast(client):
+        return 'done'
+
+    runner = ConcurrentLLMRunner(_no_client, timeout=0.1)
+
+    assert runner.run({'slow': slow, 'fast': fast}) == {'slow': None, 'fast': 'done'}
+
+
+@pytest.mark.skipif(MixtralAgents is None, reason="mixtral_chat needs the Snowflake SQLAlchemy dialect")
+def test_waiting_for_the_rate_limit_does_not_count_toward_the_request_timeout():
+    agents = MixtralAgents(rate_limiter=SlowLimiter(0.3), request_timeout=0.2)
+
+    completion = asyncio.run(agents._create_chat_completion_async(_client(0.05), "context", "text"))
+    assert completion.choices[0].message.content
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(agents._create_chat_completion_async(_client(0.5), "context", "text"))